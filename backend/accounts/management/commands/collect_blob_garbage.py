@@ -0,0 +1,59 @@
+# management/commands/collect_blob_garbage.py
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from accounts.utils.blob_utils import (
+    BLOB_FIELDS,
+    BLOB_PREFIX,
+    collect_blob_garbage,
+    move_to_blob_store,
+    reconcile_blob_references,
+)
+
+class Command(BaseCommand):
+    help = 'Deletes attachment blobs no agreement or letter points at any more'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--import-legacy',
+            action='store_true',
+            help='First move files stored under their old upload paths into the blob store, '
+                 'deduplicating them (run once after migrating)'
+        )
+        parser.add_argument(
+            '--reconcile',
+            action='store_true',
+            help='Recount every blob reference from the file fields before collecting'
+        )
+        parser.add_argument(
+            '--grace-hours',
+            type=float,
+            default=None,
+            help='Keep unreferenced blobs younger than this (defaults to BLOB_GC_GRACE_HOURS)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report what would be deleted without deleting it'
+        )
+
+    def handle(self, *args, **options):
+        if options['import_legacy'] and not options['dry_run']:
+            for app_label, model_name, field_name in BLOB_FIELDS:
+                model = apps.get_model(app_label, model_name)
+                legacy = (
+                    model.objects.exclude(**{f'{field_name}__startswith': BLOB_PREFIX})
+                    .exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+                    .only('pk', field_name)
+                )
+                moved = sum(move_to_blob_store(instance, field_name) for instance in legacy.iterator())
+                self.stdout.write(f"Moved {moved} {model._meta.label} files into the blob store.")
+
+        if options['reconcile']:
+            corrected = reconcile_blob_references()
+            self.stdout.write(f"Corrected the reference count of {corrected} blobs.")
+
+        deleted, freed = collect_blob_garbage(
+            grace_hours=options['grace_hours'], dry_run=options['dry_run']
+        )
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(f"{verb} {deleted} unreferenced blobs ({freed / (1024 * 1024):.1f} MB).")
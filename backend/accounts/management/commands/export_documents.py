@@ -0,0 +1,35 @@
+# management/commands/export_documents.py
+from django.core.management.base import BaseCommand, CommandError
+from accounts.utils.export_utils import EXPORT_KINDS, ExportFilter, stream_export_zip
+
+class Command(BaseCommand):
+    help = 'Writes a ZIP of letter documents, letter attachments and agreement attachments with a CSV manifest'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Path of the ZIP file to write')
+        parser.add_argument('--date-from', help='First letter date / agreement start date (YYYY-MM-DD)')
+        parser.add_argument('--date-to', help='Last letter date / agreement start date (YYYY-MM-DD)')
+        parser.add_argument('--category', help='Letter category id')
+        parser.add_argument('--department', help='Department id')
+        parser.add_argument('--vendor', help='Agreement vendor (party) id')
+        parser.add_argument(
+            '--include',
+            default=','.join(EXPORT_KINDS),
+            help='Comma separated document kinds to export: letters, agreements'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            export_filter = ExportFilter.from_params(options)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        stats = {}
+        with open(options['output'], 'wb') as output:
+            for chunk in stream_export_zip(export_filter, stats):
+                output.write(chunk)
+
+        self.stdout.write(
+            f"Exported {stats['files']} files ({stats['bytes']} bytes) to {options['output']}, "
+            f"{stats['missing']} missing from storage."
+        )
@@ -1,11 +1,14 @@
 # migrate_from_backup.py
-import json
 import os
-from datetime import datetime
+import time
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from django.utils import timezone
 from accounts.models import Organization, OrganizationType, Recipient
+from accounts.utils.json_utils import iter_json_items
 from agreements.models import Agreement
+from agreements.utils.search_utils import index_agreements
+from agreements.utils.stats_utils import invalidate_dashboard_stats
 import re
 
 class Command(BaseCommand):
@@ -23,40 +26,51 @@ class Command(BaseCommand):
             action='store_true',
             help='Show what would be done without making changes'
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Vendors (and agreements) written per transaction'
+        )
     
     def handle(self, *args, **options):
         json_file = options['file']
         dry_run = options['dry_run']
+        self.batch_size = options['batch_size']
+        self.verbosity = options['verbosity']
         
         self.stdout.write("=" * 70)
         self.stdout.write("VENDOR BACKUP MIGRATION TO ORGANIZATION SCHEMA")
         self.stdout.write("=" * 70)
         
-        # Step 1: Load and validate JSON
-        vendors_data = self.load_vendor_data(json_file)
-        if vendors_data is None:
+        # Step 1: Check the JSON file, vendors are read from it as they are processed
+        if not os.path.exists(json_file):
+            self.stderr.write(f"❌ JSON file not found: {json_file}")
+            self.stderr.write(f"Current directory: {os.getcwd()}")
+            self.stderr.write(f"Available files: {os.listdir('.')}")
             return
         
-        self.stdout.write(f"✅ Loaded {len(vendors_data)} vendors from backup")
-        
         # Step 2: Get or create OrganizationType
         org_type = self.get_or_create_organization_type(dry_run)
         if not org_type and not dry_run:
             self.stderr.write("❌ Failed to create organization type")
             return
         
-        # Step 3: Process each vendor
-        migration_results = self.process_vendors(
-            vendors_data, org_type, dry_run
-        )
+        # Step 3: Create organizations and recipients in batches
+        started = time.monotonic()
+        self.load_existing()
+        try:
+            migration_results = self.process_vendors(iter_json_items(json_file), org_type, dry_run)
+        except ValueError as e:
+            # Batches before the error are committed, running again skips them
+            self.stderr.write(f"❌ Invalid JSON in {json_file}: {str(e)}")
+            return
         
         # Step 4: Update Agreements
-        agreements_updated = self.update_agreements(
-            vendors_data, migration_results, dry_run
-        )
+        agreements_updated = self.update_agreements(migration_results, dry_run)
         
         # Step 5: Display summary
-        self.display_summary(migration_results, agreements_updated, dry_run)
+        self.display_summary(migration_results, agreements_updated, dry_run, time.monotonic() - started)
         
         if dry_run:
             self.stdout.write("\n" + "=" * 70)
@@ -64,34 +78,6 @@ class Command(BaseCommand):
             self.stdout.write("Run without --dry-run to execute migration")
             self.stdout.write("=" * 70)
     
-    def load_vendor_data(self, json_file):
-        """Load vendor data from JSON file"""
-        if not os.path.exists(json_file):
-            self.stderr.write(f"❌ JSON file not found: {json_file}")
-            self.stderr.write(f"Current directory: {os.getcwd()}")
-            self.stderr.write(f"Available files: {os.listdir('.')}")
-            return None
-        
-        try:
-            with open(json_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            # Handle different JSON formats
-            if isinstance(data, list):
-                return data
-            elif isinstance(data, dict) and 'data' in data:
-                return data['data']
-            else:
-                self.stderr.write(f"❌ Unexpected JSON format in {json_file}")
-                return None
-                
-        except json.JSONDecodeError as e:
-            self.stderr.write(f"❌ Invalid JSON in {json_file}: {str(e)}")
-            return None
-        except Exception as e:
-            self.stderr.write(f"❌ Error reading {json_file}: {str(e)}")
-            return None
-    
     def get_or_create_organization_type(self, dry_run=False):
         """Get or create vendor organization type"""
         type_name = 'Vendor'
@@ -118,6 +104,21 @@ class Command(BaseCommand):
             self.stderr.write(f"❌ Error creating OrganizationType: {str(e)}")
             return None
     
+    def load_existing(self):
+        """Keep the unique values already taken in memory instead of querying per vendor"""
+        # email (lowercase) -> organization id
+        self.organization_ids = {
+            email.lower(): org_id
+            for email, org_id in Organization.objects.exclude(email=None).values_list('email', 'id').iterator()
+        }
+        self.short_forms = {
+            short_form.lower() for short_form in Organization.objects.values_list('short_form', flat=True).iterator()
+        }
+        self.recipient_emails = {
+            email.lower() for email in Recipient.objects.values_list('email', flat=True).iterator()
+        }
+        self.next_counters = {}
+    
     def generate_short_form(self, name):
         """Generate short form from organization name"""
         if not name:
@@ -200,20 +201,55 @@ class Command(BaseCommand):
         # Default: take first 3-5 letters
         return designation[:5].title()
     
-    def parse_timestamp(self, timestamp_str):
-        """Parse ISO timestamp string to timezone-aware datetime"""
-        if not timestamp_str:
-            return timezone.now()
+    def make_unique_short_form(self, short_form, max_length=50):
+        """Append a counter to short_form until no organization uses it"""
+        candidate = short_form[:max_length]
+        # Continue from the last counter used, many vendors share a short form
+        counter = self.next_counters.get(('short_form', short_form.lower()), 1)
+        while candidate.lower() in self.short_forms:
+            suffix = str(counter)
+            candidate = f"{short_form[:max_length - len(suffix)]}{suffix}"
+            counter += 1
+        self.next_counters[('short_form', short_form.lower())] = counter
+        self.short_forms.add(candidate.lower())
+        return candidate
+    
+    def make_unique_email(self, email):
+        """Append a counter to the local part until no recipient uses the email"""
+        local, domain = email.split('@', 1)
+        candidate = email
+        counter = self.next_counters.get(('email', email.lower()), 1)
+        while candidate.lower() in self.recipient_emails:
+            candidate = f"{local}{counter}@{domain}"
+            counter += 1
+        self.next_counters[('email', email.lower())] = counter
+        self.recipient_emails.add(candidate.lower())
+        return candidate
+    
+    def build_recipient(self, vendor, org_id, results):
+        """Recipient for the contact person of a vendor, None when there is none"""
+        contact_name = vendor.get('contact_person_name')
+        if not contact_name:
+            return None
         
-        try:
-            # Handle different timestamp formats
-            timestamp_str = timestamp_str.replace('Z', '+00:00')
-            return timezone.make_aware(datetime.fromisoformat(timestamp_str))
-        except:
-            return timezone.now()
+        # Generate recipient email
+        recipient_email = self.generate_recipient_email(contact_name, vendor.get('email'))
+        if not recipient_email:
+            self.stderr.write(f"    ❌ Failed to create recipient {contact_name}: no email address")
+            results['recipients_failed'] += 1
+            return None
+        
+        return Recipient(
+            fullName=contact_name,
+            email=self.make_unique_email(recipient_email),
+            organization_id=org_id,
+            designation=vendor.get('contact_person_designation') or 'Contact Person',
+            phone_number=vendor.get('phone_number'),
+            short_designation=self.get_short_designation(vendor.get('contact_person_designation')),
+        )
     
-    def process_vendors(self, vendors_data, org_type, dry_run=False):
-        """Process each vendor and create Organization/Recipient"""
+    def process_vendors(self, vendors, org_type, dry_run=False):
+        """Create Organization/Recipient rows for the vendors, batch_size vendors per transaction"""
         results = {
             'organizations_created': 0,
             'organizations_existing': 0,
@@ -221,145 +257,160 @@ class Command(BaseCommand):
             'recipients_created': 0,
             'recipients_existing': 0,
             'recipients_failed': 0,
-            'mapping': {}  # old_vendor_id -> new_organization
+            'mapping': {}  # old_vendor_id -> new organization id
         }
         
-        for vendor in vendors_data:
+        started = time.monotonic()
+        processed = 0
+        batch = []
+        for vendor in vendors:
+            batch.append(vendor)
+            if len(batch) == self.batch_size:
+                self.process_batch(batch, org_type, results, dry_run)
+                processed += len(batch)
+                batch = []
+                self.report_progress('vendors', processed, started)
+        if batch:
+            self.process_batch(batch, org_type, results, dry_run)
+            processed += len(batch)
+            self.report_progress('vendors', processed, started)
+        
+        return results
+    
+    def process_batch(self, vendors, org_type, results, dry_run=False):
+        """Bulk create the organizations and recipients of one batch of vendors"""
+        new_organizations = {}  # email (lowercase) -> (vendor, Organization)
+        duplicates = []  # (old_vendor_id, email) of vendors sharing a new organization
+        
+        for vendor in vendors:
             vendor_id = vendor.get('id')
             vendor_name = vendor.get('name', f'Vendor {vendor_id}')
-            
-            self.stdout.write(f"\n📋 Processing: {vendor_name}")
+            if self.verbosity > 1:
+                self.stdout.write(f"\n📋 Processing: {vendor_name}")
             
             # Extract vendor data
             vendor_email = vendor.get('email')
             if not vendor_email:
-                self.stderr.write(f"  ❌ Skipping - No email address")
+                self.stderr.write(f"  ❌ Skipping {vendor_name} - No email address")
                 results['organizations_failed'] += 1
                 continue
             
             # Check if organization already exists
-            existing_org = None
-            if not dry_run:
-                existing_org = Organization.objects.filter(email=vendor_email).first()
-            
-            if existing_org:
-                self.stdout.write(f"  ℹ️ Organization already exists: {existing_org.name}")
+            key = vendor_email.lower()
+            if key in self.organization_ids or key in new_organizations:
+                if self.verbosity > 1:
+                    self.stdout.write(f"  ℹ️ Organization already exists: {vendor_email}")
                 results['organizations_existing'] += 1
-                results['mapping'][vendor_id] = existing_org
-                continue
-            
-            # Prepare organization data
-            org_data = {
-                'name': vendor.get('name', 'Unknown Vendor'),
-                'short_form': self.generate_short_form(vendor.get('name')),
-                'address': vendor.get('address', 'Address not specified'),
-                'email': vendor_email,
-                'organization_type': org_type,
-            }
-            
-            # Add timestamps if available
-            created_at = self.parse_timestamp(vendor.get('created_at'))
-            updated_at = self.parse_timestamp(vendor.get('updated_at'))
-            
-            if dry_run:
-                self.stdout.write(f"  Would create Organization:")
-                for key, value in org_data.items():
-                    if key != 'organization_type':
-                        self.stdout.write(f"    {key}: {value}")
-                results['organizations_created'] += 1
+                if key in self.organization_ids:
+                    results['mapping'][vendor_id] = self.organization_ids[key]
+                else:
+                    duplicates.append((vendor_id, key))
                 continue
             
-            # Create Organization
-            try:
-                org = Organization.objects.create(
-                    **org_data,
-                    created_at=created_at,
-                    updated_at=updated_at
-                )
-                self.stdout.write(f"  ✅ Created Organization: {org.name}")
-                results['organizations_created'] += 1
-                results['mapping'][vendor_id] = org
-                
-                # Create Recipient if contact person exists
-                contact_name = vendor.get('contact_person_name')
-                if contact_name:
-                    recipient_data = {
-                        'name': contact_name,
-                        'organization': org,
-                        'designation': vendor.get('contact_person_designation') or 'Contact Person',
-                        'phone_number': vendor.get('phone_number'),
-                        'short_designation': self.get_short_designation(
-                            vendor.get('contact_person_designation')
-                        ),
-                    }
-                    
-                    # Generate recipient email
-                    recipient_email = self.generate_recipient_email(
-                        contact_name, vendor_email
-                    )
-                    if recipient_email:
-                        # Ensure email is unique
-                        counter = 1
-                        original_email = recipient_email
-                        while Recipient.objects.filter(email=recipient_email).exists():
-                            base_email = recipient_email.split('@')[0]
-                            domain = recipient_email.split('@')[1]
-                            recipient_email = f"{base_email}{counter}@{domain}"
-                            counter += 1
-                        
-                        recipient_data['email'] = recipient_email
-                    
-                    try:
-                        recipient = Recipient.objects.create(**recipient_data)
-                        self.stdout.write(f"    👤 Created Recipient: {recipient.name}")
-                        results['recipients_created'] += 1
-                    except Exception as e:
-                        self.stderr.write(f"    ❌ Failed to create recipient: {str(e)}")
-                        results['recipients_failed'] += 1
-                
-            except Exception as e:
-                self.stderr.write(f"  ❌ Failed to create organization: {str(e)}")
-                results['organizations_failed'] += 1
+            new_organizations[key] = (vendor, Organization(
+                name=vendor.get('name') or 'Unknown Vendor',
+                short_form=self.make_unique_short_form(self.generate_short_form(vendor.get('name'))),
+                address=vendor.get('address') or 'Address not specified',
+                email=vendor_email,
+                organization_type=None if dry_run else org_type,
+            ))
         
-        return results
+        if dry_run:
+            for key, (vendor, org) in new_organizations.items():
+                if self.verbosity > 1:
+                    self.stdout.write(f"  Would create Organization: {org.name} ({org.short_form})")
+                self.organization_ids[key] = None
+                results['mapping'][vendor.get('id')] = None
+                if self.build_recipient(vendor, None, results):
+                    results['recipients_created'] += 1
+            results['organizations_created'] += len(new_organizations)
+            return
+        
+        if not new_organizations:
+            for vendor_id, key in duplicates:
+                results['mapping'][vendor_id] = self.organization_ids[key]
+            return
+        
+        try:
+            with transaction.atomic():
+                Organization.objects.bulk_create([org for _, org in new_organizations.values()])
+                # bulk_create does not return ids on every database, look them up by email
+                created_ids = {
+                    email.lower(): org_id
+                    for email, org_id in Organization.objects.filter(
+                        email__in=[org.email for _, org in new_organizations.values()]
+                    ).values_list('email', 'id')
+                }
+                recipients = [
+                    self.build_recipient(vendor, created_ids[key], results)
+                    for key, (vendor, _) in new_organizations.items()
+                ]
+                recipients = [recipient for recipient in recipients if recipient]
+                Recipient.objects.bulk_create(recipients)
+        except Exception as e:
+            self.stderr.write(f"  ❌ Failed to create {len(new_organizations)} organizations: {str(e)}")
+            results['organizations_failed'] += len(new_organizations) + len(duplicates)
+            return
+        
+        self.organization_ids.update(created_ids)
+        for key, (vendor, _) in new_organizations.items():
+            results['mapping'][vendor.get('id')] = created_ids[key]
+        for vendor_id, key in duplicates:
+            results['mapping'][vendor_id] = created_ids[key]
+        results['organizations_created'] += len(new_organizations)
+        results['recipients_created'] += len(recipients)
+    
+    def report_progress(self, what, processed, started):
+        elapsed = time.monotonic() - started
+        rate = processed / elapsed if elapsed else processed
+        self.stdout.write(f"  Processed {processed} {what} in {elapsed:.1f}s ({rate:.0f} {what}/s)")
     
-    def update_agreements(self, vendors_data, migration_results, dry_run=False):
+    def update_agreements(self, migration_results, dry_run=False):
         """Update agreements to reference new organizations"""
+        mapping = {
+            old_id: new_id for old_id, new_id in migration_results['mapping'].items() if old_id is not None
+        }
+        old_ids = list(mapping)
+        
+        # Read every change before writing, an agreement moved to a new id
+        # must not be picked up again as pointing at an old vendor id
+        changes = []
+        for start in range(0, len(old_ids), self.batch_size):
+            rows = Agreement.objects.filter(
+                party_name_id__in=old_ids[start:start + self.batch_size]
+            ).values_list('pk', 'party_name_id')
+            changes.extend((pk, mapping[old_id]) for pk, old_id in rows if mapping[old_id] != old_id)
+        
         if dry_run:
-            self.stdout.write("\n📝 Would update agreements to use new organizations")
+            self.stdout.write(f"\n📝 Would update {len(changes)} agreements to use new organizations")
             return 0
         
+        started = time.monotonic()
         agreements_updated = 0
-        
         try:
-            # Get all agreements
-            agreements = Agreement.objects.all()
-            
-            for agreement in agreements:
-                # Check if agreement has old vendor reference
-                old_vendor_id = None
-                
-                # Method 1: Check party_name_id field
-                if hasattr(agreement, 'party_name_id') and agreement.party_name_id:
-                    old_vendor_id = agreement.party_name_id
-                
-                # Method 2: Check if party_name is an integer (old vendor ID)
-                elif hasattr(agreement, 'party_name') and isinstance(agreement.party_name, int):
-                    old_vendor_id = agreement.party_name
-                
-                if old_vendor_id and old_vendor_id in migration_results['mapping']:
-                    new_org = migration_results['mapping'][old_vendor_id]
-                    agreement.party_name = new_org
-                    agreement.save()
-                    agreements_updated += 1
-                    self.stdout.write(f"  ✅ Agreement {agreement.agreement_id}: {agreement.party_name.name}")
-        
+            for start in range(0, len(changes), self.batch_size):
+                chunk = changes[start:start + self.batch_size]
+                now = timezone.now()
+                with transaction.atomic():
+                    # bulk_update skips save(), set updated_at for incremental backups
+                    Agreement.objects.bulk_update(
+                        [Agreement(pk=pk, party_name_id=org_id, updated_at=now) for pk, org_id in chunk],
+                        ['party_name', 'updated_at'],
+                    )
+                    # Nor does it send post_save, refresh the search index here
+                    index_agreements(
+                        Agreement.objects.filter(pk__in=[pk for pk, _ in chunk]).select_related('party_name')
+                    )
+                agreements_updated += len(chunk)
+                self.report_progress('agreements', agreements_updated, started)
         except Exception as e:
             self.stderr.write(f"❌ Error updating agreements: {str(e)}")
         
+        if agreements_updated:
+            invalidate_dashboard_stats()
         return agreements_updated
     
-    def display_summary(self, results, agreements_updated, dry_run=False):
+    def display_summary(self, results, agreements_updated, dry_run=False, elapsed=0):
         """Display migration summary"""
         self.stdout.write("\n" + "=" * 70)
         self.stdout.write("MIGRATION SUMMARY")
@@ -384,10 +435,13 @@ class Command(BaseCommand):
         total_vendors = (results['organizations_created'] + 
                         results['organizations_existing'] + 
                         results['organizations_failed'])
+        self.stdout.write(
+            f"\n{total_vendors} vendors in {elapsed:.2f}s ({total_vendors / elapsed if elapsed else total_vendors:.0f} vendors/s)"
+        )
         
         self.stdout.write("\n" + "=" * 70)
         if not dry_run:
             self.stdout.write("✅ MIGRATION COMPLETE!")
         else:
             self.stdout.write("📋 DRY RUN COMPLETE")
-        self.stdout.write("=" * 70)
\ No newline at end of file
+        self.stdout.write("=" * 70)
@@ -0,0 +1,115 @@
+# management/commands/restore.py
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from accounts.utils.backup_utils import (
+    finish_restore, flush_models, get_backup_chain, get_model_levels, get_restore_plan, restore_model,
+    restore_model_in_worker, verify_backup_files,
+)
+
+class Command(BaseCommand):
+    help = (
+        'Restores a backup made by the backup command, loading the full backup it builds on and '
+        'every incremental backup up to it, several models at a time in dependency order'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'backup_dir',
+            type=str,
+            help='Backup directory (backups/backup-<timestamp>) to restore'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=min(4, os.cpu_count() or 1),
+            help='Number of models loaded at the same time (separate processes, 1 loads in this process)'
+        )
+        parser.add_argument(
+            '--flush',
+            action='store_true',
+            help='Empty the tables of the backed up models before loading'
+        )
+        parser.add_argument(
+            '--skip-verify',
+            action='store_true',
+            help='Do not check the files against the manifest checksums first'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            chain = get_backup_chain(os.path.normpath(options['backup_dir']))
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(
+            f"Restoring {options['backup_dir']} from {len(chain)} backups "
+            f"({', '.join(os.path.basename(backup_dir) for backup_dir, _ in chain)})"
+        )
+
+        if not options['skip_verify']:
+            mismatched = verify_backup_files(chain)
+            if mismatched:
+                raise CommandError(f"Backup files missing or damaged: {', '.join(mismatched)}")
+            self.stdout.write('Checksums verified.')
+
+        plan = get_restore_plan(chain)
+        try:
+            # Dependency order of the latest backup
+            models = [apps.get_model(entry['model']) for entry in chain[-1][1]['models']]
+        except LookupError as e:
+            raise CommandError(str(e))
+
+        workers = options['workers']
+        if workers > 1 and connections['default'].vendor == 'sqlite':
+            # SQLite allows a single writer
+            self.stdout.write('SQLite database, loading one model at a time.')
+            workers = 1
+
+        if options['flush']:
+            flush_models(models)
+            self.stdout.write(f"Emptied {len(models)} tables.")
+
+        started = time.monotonic()
+        results = []
+        for level in get_model_levels(models):
+            labels = [model._meta.label_lower for model in level]
+            if workers == 1:
+                level_results = [restore_model(label, *plan[label]) for label in labels]
+            else:
+                # Forked workers must open their own connections
+                connections.close_all()
+                level_results = []
+                with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork')) as executor:
+                    futures = {executor.submit(restore_model_in_worker, label, *plan[label]): label for label in labels}
+                    for future in as_completed(futures):
+                        try:
+                            level_results.append(future.result())
+                        except Exception as e:
+                            # Later levels point at this model, stop here
+                            raise CommandError(f"Could not restore {futures[future]}: {e}")
+
+            for result in level_results:
+                rate = result['rows'] / result['seconds'] if result['seconds'] else result['rows']
+                self.stdout.write(
+                    f"  {result['model']}: {result['rows']} rows in {result['seconds']:.2f}s ({rate:.0f} rows/s)"
+                    + (f", {result['deleted']} deleted" if result['deleted'] else '')
+                )
+            results.extend(level_results)
+
+        try:
+            synced = finish_restore(models)
+        except Exception as e:
+            raise CommandError(f"Restored data failed the integrity checks: {e}")
+
+        elapsed = time.monotonic() - started
+        total_rows = sum(result['rows'] for result in results)
+        self.stdout.write(
+            f"Restored {total_rows} rows of {len(results)} models in {elapsed:.2f}s "
+            f"({total_rows / elapsed if elapsed else total_rows:.0f} rows/s). "
+            f"Synced {synced['agreement_sequences']} agreement id sequences, "
+            f"corrected {synced['blobs']} blob reference counts."
+        )
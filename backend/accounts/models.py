@@ -5,9 +5,10 @@ from django.core.validators import RegexValidator
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 from django.dispatch import receiver
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 
 from agreements.utils.email_utils import send_admin_user_creation_notification, send_user_creation_notification
+from .utils.access_utils import invalidate_access_context
 
 class CustomUserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
@@ -162,6 +163,22 @@ class DepartmentPermission(models.Model):
         self.clean()
         super().save(*args, **kwargs)
 
+
+# Keep cached access contexts (see accounts.utils.access_utils) in sync
+@receiver([post_save, post_delete], sender=DepartmentPermission)
+def invalidate_permission_access_context(sender, instance, **kwargs):
+    invalidate_access_context(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender='accounts.User')
+def invalidate_user_access_context(sender, instance, **kwargs):
+    invalidate_access_context(instance.pk)
+
+
+@receiver(post_save, sender=Department)
+def invalidate_department_access_context(sender, instance, **kwargs):
+    invalidate_access_context(*instance.users.values_list('pk', flat=True))
+
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     department = models.ForeignKey(Department, on_delete=models.SET_NULL, null=True, blank=True)
@@ -277,4 +294,24 @@ class Recipient(models.Model):
     class Meta:
         ordering = ['fullName']
         verbose_name = 'Recipient'
-        verbose_name_plural = 'Recipients'
\ No newline at end of file
+        verbose_name_plural = 'Recipients'
+
+#----------------------- Stored Blob Model -----------------------#
+class StoredBlob(models.Model):
+    """
+    A file in the content-addressed blob store (see accounts.utils.blob_utils),
+    with the number of attachment rows pointing at it.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    sha256 = models.CharField(max_length=64, db_index=True)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} references)"
+
+    class Meta:
+        verbose_name = 'Stored Blob'
+        verbose_name_plural = 'Stored Blobs'
@@ -0,0 +1,376 @@
+import csv
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import shutil
+import struct
+import tempfile
+import zipfile
+from datetime import datetime, timedelta
+from unittest import mock, skipUnless
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.http import Http404
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from agreements.models import Agreement, AgreementIdSequence, AgreementType
+from backend.views import serve_media
+from .models import Department, Organization, Recipient, User
+from .utils.export_utils import ExportFilter, ZipStreamBuffer, stream_export_zip
+from .utils.json_utils import JSONStreamReader
+
+
+class DocumentExportTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.department = Department.objects.create(name='IT')
+        self.agreement_type = AgreementType.objects.create(name='Service')
+        self.user = User.objects.create(email='user@example.com', full_name='User', department=self.department)
+        self.lease = self.create_agreement('Lease', self.department, b'lease contract')
+        self.payroll = self.create_agreement('Payroll', Department.objects.create(name='HR'), b'payroll contract')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def create_agreement(self, title, department, content):
+        today = timezone.now().date()
+        return Agreement.objects.create(
+            title=title,
+            agreement_type=self.agreement_type,
+            department=department,
+            start_date=today,
+            expiry_date=today + timedelta(days=400),
+            reminder_time=today + timedelta(days=200),
+            attachment=SimpleUploadedFile(f'{title.lower()}.pdf', content),
+        )
+
+    def export(self, export_filter=None, stats=None):
+        chunks = list(stream_export_zip(export_filter or ExportFilter(kinds=['agreements']), stats))
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(chunks)))
+        self.assertIsNone(archive.testzip())
+        return archive, chunks
+
+    def read_manifest(self, archive):
+        return list(csv.DictReader(io.StringIO(archive.read('manifest.csv').decode())))
+
+    def test_archive_round_trip_with_manifest(self):
+        stats = {}
+        archive, _ = self.export(stats=stats)
+        manifest = self.read_manifest(archive)
+        self.assertEqual(stats, {'files': 2, 'missing': 0, 'bytes': len(b'lease contract' + b'payroll contract')})
+        self.assertEqual(archive.namelist(), [row['path'] for row in manifest] + ['manifest.csv'])
+
+        for agreement, row in zip((self.lease, self.payroll), manifest):
+            content = archive.read(row['path'])
+            self.assertEqual(content, agreement.attachment.read())
+            self.assertEqual(row['path'], f'agreements/{agreement.pk}-{agreement.agreement_id}/{agreement.original_filename}')
+            self.assertEqual(
+                (row['type'], row['record_id'], row['reference'], row['status']),
+                ('agreement_attachment', str(agreement.pk), agreement.agreement_id, 'ok')
+            )
+            self.assertEqual((row['size'], row['sha256']), (str(len(content)), hashlib.sha256(content).hexdigest()))
+
+    def test_missing_file_is_listed_in_the_manifest(self):
+        # Blobs are shared and delete() keeps them, remove the file itself
+        os.remove(self.payroll.attachment.path)
+        stats = {}
+        archive, _ = self.export(stats=stats)
+        self.assertEqual((stats['files'], stats['missing']), (1, 1))
+
+        rows = {row['record_id']: row for row in self.read_manifest(archive)}
+        self.assertEqual(rows[str(self.payroll.pk)]['status'], 'missing')
+        self.assertEqual(rows[str(self.payroll.pk)]['sha256'], '')
+        self.assertNotIn(rows[str(self.payroll.pk)]['path'], archive.namelist())
+        self.assertEqual(rows[str(self.lease.pk)]['status'], 'ok')
+
+    @mock.patch('accounts.utils.export_utils.EXPORT_READ_SIZE', 4)
+    def test_archive_is_streamed_without_seeking(self):
+        self.assertFalse(hasattr(ZipStreamBuffer(), 'seek'))
+        archive, chunks = self.export()
+        # Each read of a file is handed out on its own, not once the archive is done
+        self.assertGreater(len(chunks), len(b'lease contract') // 4)
+        for info in archive.infolist():
+            # Sizes follow the data in a data descriptor since headers can't be patched
+            self.assertTrue(info.flag_bits & 0x08, info.filename)
+
+    @mock.patch('accounts.utils.export_utils.ZIP64_THRESHOLD', 0)
+    def test_large_files_get_zip64_headers(self):
+        archive, chunks = self.export()
+        data = b''.join(chunks)
+        for info in archive.infolist():
+            if info.filename == 'manifest.csv':
+                continue
+            # The local header of the entry carries the ZIP64 extra field (id 0x0001)
+            name_length, extra_length = struct.unpack('<HH', data[info.header_offset + 26:info.header_offset + 30])
+            extra_start = info.header_offset + 30 + name_length
+            self.assertEqual(struct.unpack('<H', data[extra_start:extra_start + 2])[0], 1)
+            self.assertGreater(extra_length, 0)
+
+    def test_api_exports_only_viewable_agreements(self):
+        response = self.client.get('/api/accounts/export/documents/', {'include': 'agreements'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertIsNone(archive.testzip())
+        self.assertEqual([row['record_id'] for row in self.read_manifest(archive)], [str(self.lease.pk)])
+
+    def test_api_rejects_malformed_filters(self):
+        response = self.client.get('/api/accounts/export/documents/', {'date_from': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/accounts/export/documents/', {'include': 'invoices'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_export_documents_command(self):
+        output = os.path.join(self.media_root, 'documents.zip')
+        stdout = io.StringIO()
+        call_command('export_documents', output, '--include', 'agreements', stdout=stdout)
+        with zipfile.ZipFile(output) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(len(self.read_manifest(archive)), 2)
+        self.assertIn('Exported 2 files', stdout.getvalue())
+
+
+# Without the overlap, only rows changed after the previous backup started are picked up
+@override_settings(BACKUP_INCREMENTAL_OVERLAP=0)
+class BackupRestoreTests(TestCase):
+
+    def setUp(self):
+        self.output = tempfile.mkdtemp()
+        self.department = Department.objects.create(name='IT')
+        self.user = User.objects.create(email='user@example.com', full_name='User', department=self.department)
+        today = timezone.now().date()
+        self.agreements = [
+            Agreement.objects.create(
+                title=f'Agreement {number}', department=self.department, creator=self.user,
+                start_date=today, expiry_date=today + timedelta(days=400),
+            )
+            for number in range(3)
+        ]
+        self.agreements[0].assigned_users.add(self.user)
+
+    def tearDown(self):
+        shutil.rmtree(self.output, ignore_errors=True)
+
+    def backup(self, *args):
+        call_command('backup', '--output', self.output, '--workers', '1', '--chunk-size', '2', *args, stdout=io.StringIO())
+        return os.path.join(self.output, sorted(os.listdir(self.output))[-1])
+
+    def test_incremental_backup_and_restore(self):
+        self.backup()
+        changed, deleted = self.agreements[1], self.agreements[2]
+        changed.title = 'Renamed'
+        changed.save()
+        deleted.delete()
+        backup_dir = self.backup('--incremental')
+
+        with open(os.path.join(backup_dir, 'manifest.json')) as f:
+            manifest = json.load(f)
+        entry = next(entry for entry in manifest['models'] if entry['model'] == 'agreements.agreement')
+        self.assertEqual((entry['mode'], entry['rows']), ('incremental', 1))
+
+        Agreement.objects.filter(pk=self.agreements[0].pk).update(title='Lost')
+        AgreementIdSequence.objects.all().delete()
+        call_command('restore', backup_dir, '--flush', '--workers', '1', stdout=io.StringIO())
+
+        self.assertEqual(
+            list(Agreement.objects.order_by('pk').values_list('title', flat=True)), ['Agreement 0', 'Renamed']
+        )
+        self.assertEqual(list(Agreement.objects.get(pk=self.agreements[0].pk).assigned_users.all()), [self.user])
+        year = self.agreements[0].start_date.year
+        self.assertEqual(AgreementIdSequence.objects.get(year=year).last_number, 3)
+
+    def test_incremental_backup_keeps_queryset_updates(self):
+        expired = self.agreements[0]
+        Agreement.objects.filter(pk=expired.pk).update(expiry_date=timezone.now().date() - timedelta(days=1))
+        self.backup()
+        # Expires agreements with QuerySet.update()
+        call_command('update_agreements', stdout=io.StringIO())
+        backup_dir = self.backup('--incremental')
+
+        call_command('restore', backup_dir, '--flush', '--workers', '1', stdout=io.StringIO())
+        self.assertEqual(Agreement.objects.get(pk=expired.pk).status, 'Expired')
+
+    def test_restore_rejects_damaged_files(self):
+        backup_dir = self.backup()
+        name = next(name for name in os.listdir(backup_dir) if name.startswith('agreements.agreement.'))
+        with open(os.path.join(backup_dir, name), 'ab') as f:
+            f.write(b'\0')
+        with self.assertRaises(CommandError):
+            call_command('restore', backup_dir, '--workers', '1', stdout=io.StringIO())
+        self.assertEqual(Agreement.objects.count(), 3)
+
+
+class ExportDBTests(TestCase):
+
+    def setUp(self):
+        self.output = tempfile.mkdtemp()
+        today = timezone.now().date()
+        self.agreements = [
+            Agreement.objects.create(title=title, remarks=remarks, start_date=today, expiry_date=today + timedelta(days=400))
+            for title, remarks in [
+                ('Plain', None),
+                ('Comma, "quotes"', 'Line one\nline two'),
+                ('Unicode বাংলা', ''),
+            ]
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.output, ignore_errors=True)
+
+    def export(self, *args):
+        call_command(
+            'export_db', '--output', self.output, '--workers', '1', '--chunk-size', '2',
+            '--tables', 'agreements_agreement', *args, stdout=io.StringIO()
+        )
+        with open(os.path.join(self.output, 'export_state.json')) as f:
+            state = json.load(f)
+        if '--format' in args:
+            return state, None
+        with open(os.path.join(state['last_run_dir'], 'agreements_agreement.csv'), newline='', encoding='utf-8') as f:
+            return state, list(csv.DictReader(f))
+
+    def test_csv_round_trip(self):
+        _, rows = self.export()
+        expected = list(Agreement.objects.order_by('pk').values('id', 'agreement_id', 'title', 'remarks', 'expiry_date'))
+        self.assertEqual(
+            [{name: row[name] for name in ('id', 'agreement_id', 'title', 'remarks', 'expiry_date')} for row in rows],
+            [
+                {
+                    'id': str(values['id']),
+                    'agreement_id': values['agreement_id'],
+                    'title': values['title'],
+                    'remarks': values['remarks'] or '',
+                    'expiry_date': values['expiry_date'].isoformat(),
+                }
+                for values in expected
+            ]
+        )
+
+    @skipUnless(importlib.util.find_spec('pyarrow'), 'parquet exports need pyarrow')
+    def test_parquet_types_do_not_depend_on_the_first_chunk(self):
+        import pyarrow.parquet
+
+        # NULL in the first chunk, an id in the next
+        vendor = Organization.objects.create(name='Acme')
+        Agreement.objects.filter(pk=self.agreements[1].pk).update(party_name=vendor)
+        state, _ = self.export('--format', 'parquet', '--chunk-size', '1')
+        table = pyarrow.parquet.read_table(os.path.join(state['last_run_dir'], 'agreements_agreement.parquet'))
+
+        self.assertEqual(str(table.schema.field('party_name_id').type), 'int64')
+        self.assertEqual(str(table.schema.field('expiry_date').type), 'date32[day]')
+        rows = sorted(table.to_pylist(), key=lambda row: row['id'])
+        self.assertEqual([row['party_name_id'] for row in rows], [None, vendor.pk, None])
+        self.assertEqual([row['title'] for row in rows], [agreement.title for agreement in self.agreements])
+        self.assertEqual(rows[0]['expiry_date'], self.agreements[0].expiry_date)
+
+    @override_settings(BACKUP_INCREMENTAL_OVERLAP=60)
+    def test_incremental_exports_rows_changed_since_last_run(self):
+        unchanged, late, changed = self.agreements
+        Agreement.objects.update(updated_at=timezone.now() - timedelta(hours=2))
+        state, rows = self.export('--incremental')
+        self.assertEqual(len(rows), 3)
+
+        # Saved just before the last run started but committed after it read
+        # the table, caught by the overlap
+        started_at = datetime.fromisoformat(state['last_started_at'])
+        Agreement.objects.filter(pk=late.pk).update(updated_at=started_at - timedelta(seconds=30))
+        Agreement.objects.filter(pk=changed.pk).update(title='Renamed', updated_at=timezone.now())
+        _, rows = self.export('--incremental')
+        self.assertEqual(sorted((int(row['id']), row['title']) for row in rows), [
+            (late.pk, late.title), (changed.pk, 'Renamed'),
+        ])
+
+
+class VendorMigrationTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.old_vendor = Organization.objects.create(name='Old Vendor', short_form='SBL', address='Road 1')
+        today = timezone.now().date()
+        self.agreement = Agreement.objects.create(
+            title='Lease', party_name=self.old_vendor, start_date=today, expiry_date=today + timedelta(days=400),
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def migrate(self, vendors, *args):
+        path = os.path.join(self.directory, 'vendors.json')
+        with open(path, 'w') as f:
+            json.dump({'exported_at': '2026-01-12', 'data': vendors}, f)
+        call_command('migrate_from_backup', '--file', path, '--batch-size', '2', *args, stdout=io.StringIO(), stderr=io.StringIO())
+
+    def test_migrates_vendors_in_batches(self):
+        vendors = [
+            {'id': self.old_vendor.pk, 'name': 'Sonali Bank Limited', 'address': 'Dhaka', 'email': 'info@sonali.com',
+             'contact_person_name': 'Jack Smith', 'contact_person_designation': 'Manager'},
+            {'id': 90, 'name': 'Sonali Builders Ltd', 'address': 'Khulna', 'email': 'info@builders.com',
+             'contact_person_name': 'Jack Smith'},
+            {'id': 91, 'name': 'Sonali Bank Limited', 'email': 'INFO@sonali.com'},
+            {'id': 92, 'name': 'No Email'},
+        ]
+        self.migrate(vendors, '--dry-run')
+        self.assertEqual(Organization.objects.count(), 1)
+
+        self.migrate(vendors)
+        bank = Organization.objects.get(email='info@sonali.com')
+        builders = Organization.objects.get(email='info@builders.com')
+        # Short forms clash with each other and with the existing organization
+        self.assertEqual({bank.short_form, builders.short_form}, {'SBL1', 'SBL2'})
+        self.assertEqual(Organization.objects.count(), 3)
+        self.assertEqual(
+            sorted(Recipient.objects.values_list('email', flat=True)), ['jack.smith@builders.com', 'jack.smith@sonali.com']
+        )
+
+        self.agreement.refresh_from_db()
+        self.assertEqual(self.agreement.party_name, bank)
+        self.assertIn('sonali', self.agreement.search_terms.values_list('term', flat=True))
+
+    def test_stream_reader_matches_json_module(self):
+        document = json.dumps({'meta': {'items': [1, ']'], 'count': 12345}, 'data': [
+            {'id': number, 'name': f'Vendor "{number}" ]}}'} for number in range(50)
+        ] + [1.5, None, 'text']})
+        reader = JSONStreamReader(io.StringIO(document), read_size=3)
+        self.assertEqual(list(reader.iter_items()), json.loads(document)['data'])
+        with self.assertRaises(ValueError):
+            list(JSONStreamReader(io.StringIO('[{"id": 1} {"id": 2}]')).iter_items())
+
+
+class MediaServingTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.media_root, CHUNKED_UPLOAD_DIR=os.path.join(self.media_root, 'chunked_uploads')
+        )
+        self.settings_override.enable()
+        for path in ('letters/logo.png', 'blobs/ab/cd/abcd.pdf', 'chunked_uploads/upload.part'):
+            os.makedirs(os.path.dirname(os.path.join(self.media_root, path)), exist_ok=True)
+            with open(os.path.join(self.media_root, path), 'wb') as f:
+                f.write(b'content')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_private_directories_are_not_served(self):
+        request = RequestFactory().get('/media/')
+        response = serve_media(request, 'letters/logo.png')
+        self.assertEqual(b''.join(response.streaming_content), b'content')
+        for path in ('blobs/ab/cd/abcd.pdf', 'chunked_uploads/upload.part', 'letters/../blobs/ab/cd/abcd.pdf'):
+            with self.assertRaises(Http404):
+                serve_media(request, path)
@@ -22,4 +22,5 @@ urlpatterns = [
     path('department-update-delete/<int:pk>/', DepartmentRetrieveUpdateDestroyAPIView.as_view(), name='department-detail-api'),
     path('designations-createlist/', DesignationListCreateAPIView.as_view(), name='designation-list-create-api'),
     path('designation-update-delete/<int:pk>/', views.DesignationRetrieveUpdateDestroyAPIView.as_view(), name='designation-detail-api'),
+    path('export/documents/', views.DocumentExportAPIView.as_view(), name='document-export-api'),
 ] + router.urls
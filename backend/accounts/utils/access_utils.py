@@ -0,0 +1,92 @@
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+ACCESS_CONTEXT_CACHE_KEY = 'access_context:{user_id}'
+
+
+class AccessContext:
+    """
+    What a user may see and edit, resolved once and shared by every agreement
+    view: whether the user is an executive, the departments whose agreements
+    they can view and the departments whose agreements they can edit.
+    """
+
+    def __init__(self, user_id, department_id, is_executive, viewable_department_ids, editable_department_ids):
+        self.user_id = user_id
+        self.department_id = department_id
+        self.is_executive = is_executive
+        self.viewable_department_ids = frozenset(viewable_department_ids)
+        self.editable_department_ids = frozenset(editable_department_ids)
+
+    @classmethod
+    def build(cls, user):
+        from accounts.models import Department, DepartmentPermission
+
+        is_executive = bool(
+            user.department_id and
+            Department.objects.filter(pk=user.department_id, executive=True).exists()
+        )
+
+        viewable = set()
+        editable = set()
+        if user.department_id:
+            viewable.add(user.department_id)
+            editable.add(user.department_id)
+        for department_id, permission_type in DepartmentPermission.objects.filter(
+            user_id=user.pk
+        ).values_list('department_id', 'permission_type'):
+            viewable.add(department_id)
+            if permission_type == 'edit':
+                editable.add(department_id)
+
+        return cls(user.pk, user.department_id, is_executive, viewable, editable)
+
+    def can_view(self, agreement):
+        return self.is_executive or agreement.department_id in self.viewable_department_ids
+
+    def can_edit(self, agreement):
+        """
+        Executives can never edit. Other users can edit agreements of their
+        editable departments or agreements they are assigned to.
+        """
+        if self.is_executive:
+            return False
+        if agreement.department_id in self.editable_department_ids:
+            return True
+        return agreement.assigned_users.filter(pk=self.user_id).exists()
+
+    def filter_viewable(self, queryset):
+        """Restrict an Agreement queryset to what the user can view."""
+        if self.is_executive:
+            return queryset
+        return queryset.filter(department_id__in=self.viewable_department_ids)
+
+
+def get_access_context(request):
+    """
+    Return the AccessContext of the request user. It is computed at most once
+    per request and kept per user in the shared cache for
+    ACCESS_CONTEXT_CACHE_TIMEOUT seconds.
+    """
+    context = getattr(request, '_access_context', None)
+    if context is not None:
+        return context
+
+    user = request.user
+    key = ACCESS_CONTEXT_CACHE_KEY.format(user_id=user.pk)
+    context = cache.get(key)
+    if context is None or context.department_id != user.department_id:
+        context = AccessContext.build(user)
+        cache.set(key, context, getattr(settings, 'ACCESS_CONTEXT_CACHE_TIMEOUT', 300))
+
+    request._access_context = context
+    return context
+
+
+def invalidate_access_context(*user_ids):
+    """Drop the cached AccessContext of the given users."""
+    cache.delete_many([ACCESS_CONTEXT_CACHE_KEY.format(user_id=user_id) for user_id in user_ids])
@@ -0,0 +1,355 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core import serializers
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, transaction
+from django.utils.dateparse import parse_datetime
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+
+# Column compared with the watermark of the previous backup
+INCREMENTAL_FIELD = 'updated_at'
+
+# Rebuilt by migrate or not worth keeping
+DEFAULT_BACKUP_EXCLUDE = ('contenttypes', 'auth.permission', 'sessions')
+
+# Rebuilt by migrate with ids that differ between databases, foreign keys to
+# them are written as natural keys
+NATURAL_KEY_MODELS = ('contenttypes.contenttype', 'auth.permission')
+
+
+def get_backup_models(include=None, exclude=DEFAULT_BACKUP_EXCLUDE):
+    """
+    Models to back up in dependency order, every model after the models its
+    foreign keys point at. include and exclude take app labels or
+    app_label.model names. Many-to-many tables are separate models, placed
+    after both sides.
+    """
+    def selected(model):
+        names = (model._meta.app_label, model._meta.label_lower)
+        if include and not any(name in include for name in names):
+            return False
+        return not any(name in (exclude or ()) for name in names)
+
+    app_list = {}
+    for model in apps.get_models():
+        if model._meta.proxy or not model._meta.managed or not selected(model):
+            continue
+        app_list.setdefault(apps.get_app_config(model._meta.app_label), []).append(model)
+    models = serializers.sort_dependencies(app_list.items(), allow_cycles=True)
+
+    through_models = []
+    for model in models:
+        for field in model._meta.local_many_to_many:
+            through = field.remote_field.through
+            if through._meta.auto_created and selected(through) and through not in through_models:
+                through_models.append(through)
+    return models + through_models
+
+
+def get_model_levels(models):
+    """
+    Group models (in dependency order) into levels: a model only points at
+    models of earlier levels, so the models of one level can be restored at
+    the same time.
+    """
+    levels = {}
+    for model in models:
+        dependencies = [
+            field.related_model for field in model._meta.concrete_fields
+            if field.is_relation and field.related_model is not model and field.related_model in levels
+        ]
+        levels[model] = max((levels[dependency] + 1 for dependency in dependencies), default=0)
+    grouped = [[] for _ in range(max(levels.values(), default=-1) + 1)]
+    for model in models:
+        grouped[levels[model]].append(model)
+    return grouped
+
+
+def has_incremental_field(model):
+    return any(field.name == INCREMENTAL_FIELD for field in model._meta.concrete_fields)
+
+
+def get_file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_ndjson(path, objects):
+    """Write objects as gzipped JSON lines. Returns the file entry of the manifest."""
+    compresslevel = getattr(settings, 'BACKUP_COMPRESSLEVEL', 6)
+    rows = 0
+    with gzip.open(path, 'wt', encoding='utf-8', compresslevel=compresslevel) as f:
+        for obj in objects:
+            f.write(json.dumps(obj, cls=DjangoJSONEncoder, ensure_ascii=False))
+            f.write('\n')
+            rows += 1
+    return {
+        'name': os.path.basename(path),
+        'rows': rows,
+        'bytes': os.path.getsize(path),
+        'sha256': get_file_sha256(path),
+    }
+
+
+def read_ndjson(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def get_natural_key_fields(model, using='default'):
+    """{field name: {id: natural key}} for the foreign keys of model to NATURAL_KEY_MODELS."""
+    fields = {}
+    for field in model._meta.local_fields:
+        if field.is_relation and field.related_model._meta.label_lower in NATURAL_KEY_MODELS:
+            fields[field.name] = {
+                obj.pk: list(obj.natural_key()) for obj in field.related_model._base_manager.using(using)
+            }
+    return fields
+
+
+def backup_model(label, backup_dir, since=None, chunk_size=None, using='default'):
+    """
+    Write the rows of one model to backup_dir/<label>.<n>.ndjson.gz files of
+    chunk_size rows, read by primary key ranges so memory does not grow
+    with the table. With since, models that have updated_at only get the
+    rows changed since then plus the list of all their primary keys, which
+    lets a restore drop the rows deleted in between. auto_now only applies
+    to save(), so code writing with QuerySet.update() sets updated_at itself.
+    Returns the manifest entry of the model.
+    """
+    model = apps.get_model(label)
+    chunk_size = chunk_size or getattr(settings, 'BACKUP_CHUNK_SIZE', 10000)
+    incremental = bool(since and has_incremental_field(model))
+    fields = [field.name for field in model._meta.local_fields if not field.primary_key]
+    natural_keys = get_natural_key_fields(model, using)
+    queryset = model._base_manager.using(using).order_by('pk')
+    changed = queryset.filter(**{f'{INCREMENTAL_FIELD}__gte': since}) if incremental else queryset
+
+    started = time.monotonic()
+    entry = {'model': label, 'mode': 'incremental' if incremental else 'full', 'rows': 0, 'files': []}
+    if incremental:
+        entry['since'] = since.isoformat()
+
+    last_pk = None
+    while True:
+        chunk = changed if last_pk is None else changed.filter(pk__gt=last_pk)
+        objects = list(chunk[:chunk_size])
+        if not objects:
+            break
+        last_pk = objects[-1].pk
+        serialized = serializers.serialize('python', objects, fields=fields)
+        for obj in serialized:
+            for name, keys in natural_keys.items():
+                if obj['fields'][name] is not None:
+                    obj['fields'][name] = keys[obj['fields'][name]]
+        path = os.path.join(backup_dir, f"{label}.{len(entry['files']) + 1:05d}.ndjson.gz")
+        file_entry = write_ndjson(path, ({'pk': obj['pk'], 'fields': obj['fields']} for obj in serialized))
+        entry['files'].append(file_entry)
+        entry['rows'] += file_entry['rows']
+
+    if incremental:
+        entry['pks'] = write_ndjson(
+            os.path.join(backup_dir, f"{label}.pks.ndjson.gz"),
+            queryset.values_list('pk', flat=True).iterator(chunk_size=chunk_size),
+        )
+
+    entry['seconds'] = time.monotonic() - started
+    logger.info(f"Backed up {entry['rows']} rows of {label} in {entry['seconds']:.2f}s")
+    return entry
+
+
+def backup_model_in_worker(*args, **kwargs):
+    """backup_model for a process pool worker, the connection inherited from the parent is not reused."""
+    connections.close_all()
+    try:
+        return backup_model(*args, **kwargs)
+    finally:
+        connections.close_all()
+
+
+def load_manifest(backup_dir):
+    path = os.path.join(backup_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        raise ValueError(f"{backup_dir} is not a complete backup, {MANIFEST_NAME} is missing")
+    with open(path) as f:
+        manifest = json.load(f)
+    if manifest.get('version') != MANIFEST_VERSION:
+        raise ValueError(f"{backup_dir} has an unsupported backup version {manifest.get('version')}")
+    return manifest
+
+
+def get_incremental_since(manifest):
+    """
+    Watermark of an incremental backup built on manifest: the start of that
+    backup minus BACKUP_INCREMENTAL_OVERLAP seconds. updated_at is set when a
+    row is saved, not when its transaction commits, so a row saved just
+    before the previous backup started may only have become visible after
+    that backup read its table.
+    """
+    overlap = getattr(settings, 'BACKUP_INCREMENTAL_OVERLAP', 15 * 60)
+    return parse_datetime(manifest['started_at']) - timedelta(seconds=overlap)
+
+
+def find_latest_backup(output_dir):
+    """Most recent complete backup under output_dir, or None."""
+    if not os.path.isdir(output_dir):
+        return None
+    for name in sorted(os.listdir(output_dir), reverse=True):
+        if name.startswith('backup-') and os.path.exists(os.path.join(output_dir, name, MANIFEST_NAME)):
+            return os.path.join(output_dir, name)
+    return None
+
+
+def get_backup_chain(backup_dir):
+    """The full backup a backup builds on followed by its incremental backups, oldest first."""
+    chain = []
+    while backup_dir:
+        if any(backup_dir == seen for seen, _ in chain):
+            raise ValueError(f"Backup chain of {backup_dir} loops")
+        manifest = load_manifest(backup_dir)
+        chain.insert(0, (backup_dir, manifest))
+        parent = manifest.get('parent')
+        backup_dir = os.path.join(os.path.dirname(backup_dir.rstrip(os.sep)), parent) if parent else None
+    return chain
+
+
+def verify_backup_files(chain):
+    """Return the files of a backup chain whose checksum does not match the manifest."""
+    mismatched = []
+    for backup_dir, manifest in chain:
+        for entry in manifest['models']:
+            for file_entry in entry['files'] + ([entry['pks']] if 'pks' in entry else []):
+                path = os.path.join(backup_dir, file_entry['name'])
+                if not os.path.exists(path) or get_file_sha256(path) != file_entry['sha256']:
+                    mismatched.append(path)
+    return mismatched
+
+
+def get_restore_plan(chain):
+    """
+    {model label: (files to load in order, path of the primary key list or
+    None)}. A full copy of a model replaces whatever the older backups
+    held, incremental copies are applied on top of it.
+    """
+    plan = {}
+    for backup_dir, manifest in chain:
+        for entry in manifest['models']:
+            paths = [os.path.join(backup_dir, file_entry['name']) for file_entry in entry['files']]
+            if entry['mode'] == 'full' or entry['model'] not in plan:
+                plan[entry['model']] = (paths, None)
+            else:
+                plan[entry['model']] = (plan[entry['model']][0] + paths, None)
+            if 'pks' in entry:
+                plan[entry['model']] = (plan[entry['model']][0], os.path.join(backup_dir, entry['pks']['name']))
+    return plan
+
+
+def bulk_upsert(model, objects, using='default'):
+    """Insert objects, overwriting the rows that already have their primary key."""
+    connection = connections[using]
+    update_fields = [field.name for field in model._meta.local_concrete_fields if not field.primary_key]
+    options = {}
+    if update_fields:
+        options = {'update_conflicts': True, 'update_fields': update_fields}
+        if connection.features.supports_update_conflicts_with_target:
+            options['unique_fields'] = [model._meta.pk.name]
+    else:
+        options = {'ignore_conflicts': True}
+    model._base_manager.using(using).bulk_create(objects, **options)
+
+
+def restore_model(label, paths, pks_path=None, using='default'):
+    """
+    Load the backup files of one model with bulk_create, a file (one backup
+    chunk) per transaction. Foreign key checks are off while loading, the
+    restore command checks them once everything is in. With pks_path, rows
+    missing from that primary key list are deleted afterwards. Returns a
+    dict with the model label, rows loaded, rows deleted and seconds.
+    """
+    model = apps.get_model(label)
+    connection = connections[using]
+    started = time.monotonic()
+    rows = deleted = 0
+
+    with connection.constraint_checks_disabled():
+        for path in paths:
+            objects = [
+                deserialized.object for deserialized in serializers.deserialize(
+                    'python',
+                    ({'model': label, 'pk': row['pk'], 'fields': row['fields']} for row in read_ndjson(path)),
+                    using=using, ignorenonexistent=True,
+                )
+            ]
+            with transaction.atomic(using=using):
+                bulk_upsert(model, objects, using=using)
+            rows += len(objects)
+
+        if pks_path:
+            pk_field = model._meta.pk
+            kept = {pk_field.to_python(pk) for pk in read_ndjson(pks_path)}
+            stale = [
+                pk for pk in model._base_manager.using(using).values_list('pk', flat=True).iterator()
+                if pk not in kept
+            ]
+            for start in range(0, len(stale), 1000):
+                deleted += model._base_manager.using(using).filter(pk__in=stale[start:start + 1000])._raw_delete(using)
+
+    seconds = time.monotonic() - started
+    logger.info(f"Restored {rows} rows of {label} in {seconds:.2f}s ({deleted} deleted)")
+    return {'model': label, 'rows': rows, 'deleted': deleted, 'seconds': seconds}
+
+
+def restore_model_in_worker(*args, **kwargs):
+    """restore_model for a process pool worker, the connection inherited from the parent is not reused."""
+    connections.close_all()
+    try:
+        return restore_model(*args, **kwargs)
+    finally:
+        connections.close_all()
+
+
+def flush_models(models, using='default'):
+    """Empty the tables of models, dependants first."""
+    connection = connections[using]
+    with connection.constraint_checks_disabled(), transaction.atomic(using=using):
+        for model in reversed(models):
+            model._base_manager.using(using).all()._raw_delete(using)
+
+
+def finish_restore(models, using='default'):
+    """
+    Check the foreign keys of the restored tables, move database sequences
+    past the restored ids and bring the counters kept next to the data
+    (agreement id sequences, blob reference counts) in line with it.
+    """
+    from agreements.utils.sequence_utils import sync_agreement_id_sequences
+    from .blob_utils import reconcile_blob_references
+
+    connection = connections[using]
+    connection.check_constraints(table_names=[model._meta.db_table for model in models])
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    if statements:
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+    return {
+        'agreement_sequences': sync_agreement_id_sequences(),
+        'blobs': reconcile_blob_references(),
+    }
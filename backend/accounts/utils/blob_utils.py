@@ -0,0 +1,254 @@
+import hashlib
+import logging
+import os
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.signals import post_delete, post_init, post_save
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+BLOB_PREFIX = 'blobs/'
+
+# File fields stored in the content-addressed blob store, as (app label, model, field)
+BLOB_FIELDS = (
+    ('agreements', 'Agreement', 'attachment'),
+    ('letters', 'AdditionalLetterAttachment', 'file'),
+    ('letters', 'LetterFile', 'document'),
+    ('letters', 'LetterRender', 'pdf'),
+)
+
+
+def is_blob_name(name):
+    return bool(name) and name.startswith(BLOB_PREFIX)
+
+
+def get_blob_name(sha256, original_name):
+    """blobs/ab/cd/abcd...ef.pdf, the extension is kept so the file is served with the right type."""
+    ext = os.path.splitext(original_name or '')[1].lower()[:10]
+    return f"{BLOB_PREFIX}{sha256[:2]}/{sha256[2:4]}/{sha256}{ext}"
+
+
+def hash_content(content):
+    """
+    Return the SHA-256 of a file. Uploads hashed while streaming (see
+    backend.uploadhandlers) or by the chunked upload carry it already.
+    """
+    sha256 = getattr(content, 'sha256', None)
+    if sha256:
+        return sha256
+    hasher = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks():
+        hasher.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return hasher.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores every file under the SHA-256 of its content, so identical files
+    (a contract attached to parent and child agreements, an annex attached to
+    many letters) are written once. The name from upload_to is ignored.
+
+    Blobs are shared, so delete() leaves them in place. StoredBlob counts
+    the rows pointing at each blob and collect_blob_garbage removes the
+    ones nothing points at any more.
+    """
+
+    def _save(self, name, content):
+        from accounts.models import StoredBlob
+
+        sha256 = hash_content(content)
+        blob_name = get_blob_name(sha256, getattr(content, 'name', None) or name)
+        # The row lock keeps collect_blob_garbage from deleting the blob until
+        # the row about to point at it is committed, and a concurrent upload
+        # of the same content waits here until the file is written
+        with transaction.atomic():
+            blob, created = StoredBlob.objects.select_for_update().get_or_create(
+                name=blob_name,
+                defaults={'sha256': sha256, 'size': content.size},
+            )
+            if not created:
+                # Reused, restart the grace period of an unreferenced blob
+                StoredBlob.objects.filter(pk=blob.pk).update(updated_at=timezone.now())
+            if not self.exists(blob_name):
+                saved_name = super()._save(blob_name, content)
+                if saved_name != blob_name:
+                    # The file appeared outside the lock, keep ours under the alternative name
+                    blob_name = saved_name
+                    StoredBlob.objects.get_or_create(
+                        name=blob_name,
+                        defaults={'sha256': sha256, 'size': content.size},
+                    )
+        return blob_name
+
+    def delete(self, name):
+        if is_blob_name(name):
+            return
+        super().delete(name)
+
+    def delete_blob(self, name):
+        super().delete(name)
+
+
+blob_storage = ContentAddressedStorage()
+
+
+def get_blob_storage():
+    return blob_storage
+
+
+def change_blob_references(name, delta):
+    from accounts.models import StoredBlob
+
+    if is_blob_name(name):
+        StoredBlob.objects.filter(name=name).update(
+            ref_count=F('ref_count') + delta, updated_at=timezone.now()
+        )
+
+
+def add_blob_references(names):
+    """Count references for rows written without signals, e.g. by bulk_create."""
+    for name in names:
+        change_blob_references(name, 1)
+
+
+def track_blob_references(model, field_name):
+    """
+    Keep StoredBlob.ref_count in step with a file field: remember the stored
+    name when a row is loaded, and move the count from the old blob to the
+    new one on save and away from it on delete.
+    """
+    attname = model._meta.get_field(field_name).attname
+
+    def remember_blob(sender, instance, **kwargs):
+        # Read the raw value, the field may be deferred
+        value = instance.__dict__.get(attname)
+        instance.__dict__[f'_loaded_{attname}'] = value if isinstance(value, str) else None
+
+    def update_blob(sender, instance, created, raw=False, **kwargs):
+        if raw:
+            return
+        old_name = None if created else instance.__dict__.get(f'_loaded_{attname}')
+        new_name = getattr(instance, field_name).name or None
+        if old_name != new_name:
+            change_blob_references(new_name, 1)
+            change_blob_references(old_name, -1)
+        instance.__dict__[f'_loaded_{attname}'] = new_name
+
+    def release_blob(sender, instance, **kwargs):
+        change_blob_references(getattr(instance, field_name).name, -1)
+
+    uid = f'blob_refs_{model._meta.label_lower}_{field_name}'
+    post_init.connect(remember_blob, sender=model, weak=False, dispatch_uid=uid)
+    post_save.connect(update_blob, sender=model, weak=False, dispatch_uid=uid)
+    post_delete.connect(release_blob, sender=model, weak=False, dispatch_uid=uid)
+
+
+def count_blob_references():
+    """Return {blob name: number of rows pointing at it} over every BLOB_FIELDS field."""
+    counts = {}
+    for app_label, model_name, field_name in BLOB_FIELDS:
+        model = apps.get_model(app_label, model_name)
+        rows = (
+            model.objects.filter(**{f'{field_name}__startswith': BLOB_PREFIX})
+            .values(field_name)
+            .annotate(references=Count('pk'))
+            .order_by()
+        )
+        for row in rows:
+            counts[row[field_name]] = counts.get(row[field_name], 0) + row['references']
+    return counts
+
+
+def is_blob_referenced(name):
+    for app_label, model_name, field_name in BLOB_FIELDS:
+        if apps.get_model(app_label, model_name).objects.filter(**{field_name: name}).exists():
+            return True
+    return False
+
+
+def reconcile_blob_references():
+    """Recount the references of every blob from the file fields. Returns the number of corrected blobs."""
+    from accounts.models import StoredBlob
+
+    counts = count_blob_references()
+    corrected = 0
+    for blob in StoredBlob.objects.only('pk', 'name', 'ref_count').iterator():
+        actual = counts.get(blob.name, 0)
+        if blob.ref_count != actual:
+            StoredBlob.objects.filter(pk=blob.pk).update(ref_count=actual, updated_at=timezone.now())
+            corrected += 1
+    return corrected
+
+
+def collect_blob_garbage(grace_hours=None, dry_run=False):
+    """
+    Delete blobs nothing points at. Blobs younger than BLOB_GC_GRACE_HOURS
+    are kept, they may belong to a transaction that has not committed yet.
+    Each candidate is locked (see ContentAddressedStorage._save), checked
+    again against the counter, the grace period and the file fields, and
+    deleted under that lock. Returns (number of deleted blobs, bytes freed).
+    """
+    from accounts.models import StoredBlob
+
+    if grace_hours is None:
+        grace_hours = getattr(settings, 'BLOB_GC_GRACE_HOURS', 24)
+    candidates = StoredBlob.objects.filter(
+        ref_count__lte=0,
+        updated_at__lt=timezone.now() - timedelta(hours=grace_hours),
+    )
+
+    deleted, freed = 0, 0
+    for pk in list(candidates.values_list('pk', flat=True)):
+        with transaction.atomic():
+            # Reused or referenced since the candidates were listed
+            blob = candidates.select_for_update().filter(pk=pk).first()
+            if blob is None:
+                continue
+            if is_blob_referenced(blob.name):
+                # The counter drifted, reconcile_blob_references will fix it
+                logger.warning(f"Blob {blob.name} is still referenced, keeping it")
+                continue
+            if not dry_run:
+                # Row first, a failing file delete rolls it back
+                blob.delete()
+                blob_storage.delete_blob(blob.name)
+        deleted += 1
+        freed += blob.size
+    logger.info(f"Blob garbage collection {'would delete' if dry_run else 'deleted'} {deleted} blobs ({freed} bytes)")
+    return deleted, freed
+
+
+def move_to_blob_store(instance, field_name):
+    """
+    Move a file stored under its old upload_to path into the blob store and
+    point the row at it without running save(). Returns True if it moved.
+    """
+    field_file = getattr(instance, field_name)
+    name = field_file.name
+    if not name or is_blob_name(name):
+        return False
+    old_storage = FileSystemStorage()
+    if not old_storage.exists(name):
+        logger.warning(f"{instance._meta.label} {instance.pk}: file {name} is missing")
+        return False
+
+    with old_storage.open(name, 'rb') as content:
+        blob_name = blob_storage.save(name, content)
+    updates = {field_name: blob_name}
+    if any(field.name == 'updated_at' for field in instance._meta.concrete_fields):
+        # update() skips auto_now, incremental backups select rows by updated_at
+        updates['updated_at'] = timezone.now()
+    type(instance).objects.filter(pk=instance.pk).update(**updates)
+    change_blob_references(blob_name, 1)
+    old_storage.delete(name)
+    return True
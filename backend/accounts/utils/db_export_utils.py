@@ -0,0 +1,298 @@
+import csv
+import logging
+import os
+import time
+from datetime import date, datetime, timezone as dt_timezone
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ('csv', 'xlsx', 'parquet')
+
+# Column used to select the rows changed since the previous export
+INCREMENTAL_COLUMN = 'updated_at'
+
+# Excel stops at 1,048,576 rows per sheet, header included
+XLSX_MAX_ROWS = 1048575
+
+# Parquet column type (pyarrow type factory name) per Django field type
+# reported by introspection. Columns of other types get the type pyarrow
+# infers from the first chunk.
+PARQUET_TYPES = {
+    'AutoField': 'int64',
+    'BigAutoField': 'int64',
+    'SmallAutoField': 'int64',
+    'IntegerField': 'int64',
+    'BigIntegerField': 'int64',
+    'SmallIntegerField': 'int64',
+    'PositiveIntegerField': 'int64',
+    'PositiveBigIntegerField': 'uint64',
+    'PositiveSmallIntegerField': 'int64',
+    'BooleanField': 'bool_',
+    'FloatField': 'float64',
+    'DecimalField': 'string',
+    'CharField': 'string',
+    'TextField': 'string',
+    'UUIDField': 'string',
+    'JSONField': 'string',
+    'DateField': 'date32',
+    'DateTimeField': 'timestamp',
+    'TimeField': 'time64',
+    'BinaryField': 'binary',
+}
+
+
+def get_field_types(connection, table):
+    """Django field type of each column of table, None where introspection does not know it."""
+    introspection = connection.introspection
+    field_types = {}
+    with connection.cursor() as cursor:
+        for column in introspection.get_table_description(cursor, table):
+            try:
+                field_types[column.name] = introspection.get_field_type(column.type_code, column)
+            except KeyError:
+                field_types[column.name] = None
+    return field_types
+
+
+def get_export_tables(connection, tables=None, exclude=None):
+    """Tables to export with, for each, whether it has an updated_at column."""
+    names = connection.introspection.table_names()
+    if tables:
+        unknown = set(tables) - set(names)
+        if unknown:
+            raise ValueError(f"Unknown tables: {', '.join(sorted(unknown))}")
+        names = [name for name in names if name in tables]
+    if exclude:
+        names = [name for name in names if name not in exclude]
+
+    with connection.cursor() as cursor:
+        return [
+            (name, INCREMENTAL_COLUMN in {
+                column.name for column in connection.introspection.get_table_description(cursor, name)
+            })
+            for name in names
+        ]
+
+
+def open_streaming_cursor(connection):
+    """
+    Cursor that hands rows over as they are read instead of loading the whole
+    result first. On MySQL that is a server-side (unbuffered) cursor, SQLite
+    already steps through results lazily.
+    """
+    connection.ensure_connection()
+    if connection.vendor == 'mysql':
+        from MySQLdb.cursors import SSCursor
+        return connection.connection.cursor(SSCursor)
+    return connection.connection.cursor()
+
+
+def to_text(value):
+    if value is None:
+        return ''
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).hex()
+    return value
+
+
+class CSVTableWriter:
+    extension = 'csv'
+
+    def __init__(self, path, columns, field_types=None):
+        self.file = open(path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(columns)
+
+    def write_rows(self, rows):
+        self.writer.writerows([to_text(value) for value in row] for row in rows)
+
+    def close(self):
+        self.file.close()
+
+
+class XLSXTableWriter:
+    """Write-only openpyxl workbook, rows are flushed to disk as they are added."""
+    extension = 'xlsx'
+
+    def __init__(self, path, columns, field_types=None):
+        try:
+            from openpyxl import Workbook
+            from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+        except ImportError:
+            raise RuntimeError("xlsx exports need openpyxl (pip install openpyxl)")
+        self.illegal_characters = ILLEGAL_CHARACTERS_RE
+        self.path = path
+        self.columns = columns
+        self.workbook = Workbook(write_only=True)
+        self.sheet = None
+        self.sheet_rows = 0
+        self.add_sheet()
+
+    def add_sheet(self):
+        # Sheet names are limited to 31 characters
+        number = len(self.workbook.worksheets) + 1
+        title = os.path.splitext(os.path.basename(self.path))[0][:28]
+        self.sheet = self.workbook.create_sheet(title if number == 1 else f"{title}_{number}")
+        self.sheet.append(self.columns)
+        self.sheet_rows = 0
+
+    def convert(self, value):
+        if isinstance(value, datetime) and timezone.is_aware(value):
+            # Excel has no time zones
+            return timezone.make_naive(value, dt_timezone.utc)
+        if isinstance(value, str):
+            return self.illegal_characters.sub('', value)
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return bytes(value).hex()
+        return value
+
+    def write_rows(self, rows):
+        for row in rows:
+            if self.sheet_rows == XLSX_MAX_ROWS:
+                self.add_sheet()
+            self.sheet.append([self.convert(value) for value in row])
+            self.sheet_rows += 1
+
+    def close(self):
+        self.workbook.save(self.path)
+
+
+class ParquetTableWriter:
+    """
+    One Parquet row group per chunk. Column types come from the field types
+    of the table (see PARQUET_TYPES), so a column that is NULL in the first
+    chunk keeps its type in the later ones.
+    """
+    extension = 'parquet'
+
+    def __init__(self, path, columns, field_types=None):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("parquet exports need pyarrow (pip install pyarrow)")
+        self.pyarrow = pyarrow
+        self.path = path
+        self.columns = columns
+        self.field_types = field_types or {}
+        self.writer = None
+        self.schema = None
+
+    def get_type(self, column):
+        name = PARQUET_TYPES.get(self.field_types.get(column))
+        if name == 'timestamp':
+            return self.pyarrow.timestamp('us')
+        if name == 'time64':
+            return self.pyarrow.time64('us')
+        return getattr(self.pyarrow, name)() if name else None
+
+    def get_schema(self, table=None):
+        """Schema from the field types, others as inferred in table (text when all NULL or no rows)."""
+        pa = self.pyarrow
+        fields = []
+        for column in self.columns:
+            column_type = self.get_type(column)
+            if column_type is None:
+                inferred = table.schema.field(column).type if table is not None else pa.null()
+                column_type = pa.string() if pa.types.is_null(inferred) else inferred
+            fields.append(pa.field(column, column_type))
+        return pa.schema(fields)
+
+    def convert(self, value):
+        if isinstance(value, memoryview):
+            return bytes(value)
+        if isinstance(value, Decimal):
+            return str(value)
+        return value
+
+    def write_rows(self, rows):
+        pa = self.pyarrow
+        data = {
+            column: [self.convert(row[index]) for row in rows]
+            for index, column in enumerate(self.columns)
+        }
+        if self.writer is None:
+            self.schema = self.get_schema(pa.Table.from_pydict(data))
+            self.writer = pa.parquet.ParquetWriter(self.path, self.schema)
+        self.writer.write_table(pa.Table.from_pydict(data, schema=self.schema))
+
+    def close(self):
+        if self.writer is None:
+            # Empty table, still write its columns
+            schema = self.get_schema()
+            self.pyarrow.parquet.write_table(self.pyarrow.Table.from_pylist([], schema=schema), self.path)
+        else:
+            self.writer.close()
+
+
+TABLE_WRITERS = {
+    'csv': CSVTableWriter,
+    'xlsx': XLSXTableWriter,
+    'parquet': ParquetTableWriter,
+}
+
+
+def export_table(table, output_dir, export_format='csv', since=None, has_updated_at=False, chunk_size=None,
+                 using='default'):
+    """
+    Stream one table into output_dir/<table>.<format>, chunk_size rows at a
+    time. With since, only rows with updated_at >= since are exported from
+    tables that have the column, other tables are exported in full.
+    Returns a dict with the table name, number of rows, seconds and whether
+    the export was incremental.
+    """
+    chunk_size = chunk_size or getattr(settings, 'DB_EXPORT_CHUNK_SIZE', 5000)
+    connection = connections[using]
+    quote = connection.ops.quote_name
+
+    sql = f"SELECT * FROM {quote(table)}"
+    params = []
+    incremental = bool(since and has_updated_at)
+    if incremental:
+        sql += f" WHERE {quote(INCREMENTAL_COLUMN)} >= %s"
+        params.append(connection.ops.adapt_datetimefield_value(since))
+    if connection.vendor == 'sqlite':
+        # sqlite3 uses ? placeholders on the raw connection
+        sql = sql.replace('%s', '?')
+
+    started = time.monotonic()
+    rows_written = 0
+    # Read before streaming, an unbuffered MySQL cursor blocks other queries
+    field_types = get_field_types(connection, table)
+    cursor = open_streaming_cursor(connection)
+    try:
+        cursor.execute(sql, params)
+        columns = [column[0] for column in cursor.description]
+        writer_class = TABLE_WRITERS[export_format]
+        writer = writer_class(os.path.join(output_dir, f"{table}.{writer_class.extension}"), columns, field_types)
+        try:
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                writer.write_rows(rows)
+                rows_written += len(rows)
+        finally:
+            writer.close()
+    finally:
+        cursor.close()
+
+    seconds = time.monotonic() - started
+    logger.info(f"Exported {rows_written} rows of {table} in {seconds:.2f}s")
+    return {'table': table, 'rows': rows_written, 'seconds': seconds, 'incremental': incremental}
+
+
+def export_table_in_worker(*args, **kwargs):
+    """export_table for a process pool worker, the connection inherited from the parent is not reused."""
+    connections.close_all()
+    try:
+        return export_table(*args, **kwargs)
+    finally:
+        connections.close_all()
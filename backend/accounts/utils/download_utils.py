@@ -0,0 +1,170 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core import signing
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import content_disposition_header, parse_etags
+from rest_framework.authentication import BaseAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from .blob_utils import is_blob_name
+
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+DOWNLOAD_SIGNING_SALT = 'accounts.download'
+
+# Bytes read from storage at a time when streaming a range
+READ_SIZE = 64 * 1024
+
+
+class RangeNotSatisfiable(ValueError):
+    pass
+
+
+class SignedURLAuthentication(BaseAuthentication):
+    """
+    Authenticates download links built by get_download_url, so files can be
+    opened from a plain <a href> without the bearer token. The signature is
+    bound to the user and the path and expires after DOWNLOAD_URL_MAX_AGE.
+    """
+
+    def authenticate(self, request):
+        from accounts.models import User
+
+        token = request.query_params.get('token')
+        if not token:
+            return None
+        try:
+            data = signing.loads(
+                token, salt=DOWNLOAD_SIGNING_SALT,
+                max_age=getattr(settings, 'DOWNLOAD_URL_MAX_AGE', 60 * 60)
+            )
+        except signing.BadSignature:
+            raise AuthenticationFailed('Download link is invalid or has expired.')
+        if data.get('path') != request.path:
+            raise AuthenticationFailed('Download link is invalid or has expired.')
+        try:
+            user = User.objects.select_related('department').get(pk=data.get('user'), is_active=True)
+        except User.DoesNotExist:
+            raise AuthenticationFailed('Download link is invalid or has expired.')
+        return (user, None)
+
+
+def get_download_url(request, path):
+    """Return a signed link to a download endpoint for the request user, or None without a request."""
+    if request is None or not request.user.is_authenticated:
+        return None
+    token = signing.dumps({'user': request.user.pk, 'path': path}, salt=DOWNLOAD_SIGNING_SALT)
+    return request.build_absolute_uri(f"{path}?token={token}")
+
+
+def get_file_etag(field_file):
+    """
+    Blob names carry the SHA-256 of the content, which makes a strong ETag
+    without touching the file. Other files use their size and mtime.
+    """
+    name = field_file.name
+    if is_blob_name(name):
+        return f'"{os.path.splitext(os.path.basename(name))[0]}"'
+    stat = os.stat(field_file.path)
+    return f'"{stat.st_size:x}-{int(stat.st_mtime):x}"'
+
+
+def parse_range(header, size):
+    """
+    Return (start, end) for a single 'bytes=start-end' range, or None to
+    send the whole file. Multiple ranges are answered with the whole file.
+    """
+    match = RANGE_PATTERN.match(header or '')
+    if not match or not any(match.groups()):
+        return None
+    start, end = match.groups()
+    if not start:
+        # Suffix range, the last N bytes
+        length = int(end)
+        if length == 0:
+            raise RangeNotSatisfiable()
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or end < start:
+        raise RangeNotSatisfiable()
+    return start, end
+
+
+def iter_file_range(f, start, length):
+    try:
+        f.seek(start)
+        while length > 0:
+            data = f.read(min(READ_SIZE, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+    finally:
+        f.close()
+
+
+def serve_file(request, field_file, filename, as_attachment=False):
+    """
+    Return a response sending a stored file, once access has been checked.
+
+    With DOWNLOAD_X_ACCEL_REDIRECT_PREFIX set, the transfer (including Range
+    requests) is handed to nginx with X-Accel-Redirect and the worker is
+    released at once. Otherwise the file is streamed with ETag,
+    If-None-Match and single Range support.
+    """
+    etag = get_file_etag(field_file)
+    headers = {
+        'ETag': etag,
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': 'private, max-age=0, must-revalidate',
+    }
+
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match and (if_none_match.strip() == '*' or etag in parse_etags(if_none_match)):
+        response = HttpResponseNotModified()
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    disposition = content_disposition_header(as_attachment, filename)
+
+    prefix = getattr(settings, 'DOWNLOAD_X_ACCEL_REDIRECT_PREFIX', '')
+    if prefix:
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = f"{prefix.rstrip('/')}/{quote(field_file.name)}"
+        response['Content-Disposition'] = disposition
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    storage = field_file.storage
+    size = storage.size(field_file.name)
+    byte_range = None
+    if_range = request.headers.get('If-Range')
+    if request.headers.get('Range') and (not if_range or if_range.strip() == etag):
+        try:
+            byte_range = parse_range(request.headers['Range'], size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f"bytes */{size}"
+            return response
+
+    f = storage.open(field_file.name, 'rb')
+    if byte_range is None:
+        response = FileResponse(f, content_type=content_type)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            iter_file_range(f, start, end - start + 1), status=206, content_type=content_type
+        )
+        response['Content-Range'] = f"bytes {start}-{end}/{size}"
+        response['Content-Length'] = str(end - start + 1)
+    response['Content-Disposition'] = disposition
+    for header, value in headers.items():
+        response[header] = value
+    return response
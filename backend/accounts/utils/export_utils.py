@@ -0,0 +1,298 @@
+import csv
+import hashlib
+import logging
+import os
+import tempfile
+import zipfile
+from datetime import datetime, time
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.db.models import Prefetch
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.utils.text import get_valid_filename
+
+from .blob_utils import is_blob_name
+
+logger = logging.getLogger(__name__)
+
+EXPORT_KINDS = ('letters', 'agreements')
+
+MANIFEST_FIELDS = (
+    'type', 'record_id', 'reference', 'title', 'date', 'department', 'category', 'vendor',
+    'path', 'size', 'sha256', 'status',
+)
+
+# Bytes copied from storage into the archive at a time
+EXPORT_READ_SIZE = 256 * 1024
+
+# Most documents are PDFs that barely compress, a low level keeps the
+# export close to disk speed
+EXPORT_COMPRESSLEVEL = 1
+
+ZIP64_THRESHOLD = 2 * 1024 ** 3 - 1
+
+
+class ExportFilter:
+    """
+    Which documents an export contains. Dates are inclusive and match the
+    letter date or the agreement start date. category only restricts letters
+    and vendor only agreements, department restricts both (the department of
+    the letter author for letters). user restricts agreements to the ones
+    the user can view, None exports everything.
+    """
+
+    def __init__(self, date_from=None, date_to=None, category=None, department=None, vendor=None,
+                 kinds=EXPORT_KINDS, user=None):
+        self.date_from = date_from
+        self.date_to = date_to
+        self.category = category
+        self.department = department
+        self.vendor = vendor
+        self.kinds = tuple(kinds)
+        self.user = user
+
+    @classmethod
+    def from_params(cls, params, user=None):
+        """
+        Build a filter from query parameters (date_from, date_to, category,
+        department, vendor and include, a comma separated list of kinds).
+        Raises ValueError for malformed values.
+        """
+        values = {}
+        for name in ('date_from', 'date_to'):
+            if params.get(name):
+                values[name] = parse_date(params[name])
+                if values[name] is None:
+                    raise ValueError(f"{name} must be a date (YYYY-MM-DD).")
+        for name in ('category', 'department', 'vendor'):
+            if params.get(name):
+                try:
+                    values[name] = int(params[name])
+                except (TypeError, ValueError):
+                    raise ValueError(f"{name} must be an id.")
+        if params.get('include'):
+            kinds = [kind.strip() for kind in params['include'].split(',') if kind.strip()]
+            unknown = set(kinds) - set(EXPORT_KINDS)
+            if unknown or not kinds:
+                raise ValueError(f"include must be a list of: {', '.join(EXPORT_KINDS)}.")
+            values['kinds'] = kinds
+        return cls(user=user, **values)
+
+    def get_letters(self):
+        from letters.models import Letter
+
+        letters = Letter.objects.all()
+        if self.date_from:
+            letters = letters.filter(created_at__gte=timezone.make_aware(datetime.combine(self.date_from, time.min)))
+        if self.date_to:
+            letters = letters.filter(created_at__lte=timezone.make_aware(datetime.combine(self.date_to, time.max)))
+        if self.category:
+            letters = letters.filter(category_id=self.category)
+        if self.department:
+            letters = letters.filter(created_by__department_id=self.department)
+        return letters
+
+    def get_agreements(self):
+        from agreements.models import Agreement
+        from .access_utils import AccessContext
+
+        agreements = Agreement.objects.exclude(attachment='')
+        if self.user is not None:
+            agreements = AccessContext.build(self.user).filter_viewable(agreements)
+        if self.date_from:
+            agreements = agreements.filter(start_date__gte=self.date_from)
+        if self.date_to:
+            agreements = agreements.filter(start_date__lte=self.date_to)
+        if self.department:
+            agreements = agreements.filter(department_id=self.department)
+        if self.vendor:
+            agreements = agreements.filter(party_name_id=self.vendor)
+        return agreements
+
+
+class ExportEntry:
+    """One file of the archive and its manifest row."""
+
+    def __init__(self, path, field_file, row):
+        self.path = path
+        self.field_file = field_file
+        self.row = row
+
+
+def get_safe_name(name, default='file'):
+    try:
+        return get_valid_filename((name or '').replace('/', '-'))
+    except SuspiciousFileOperation:
+        # Nothing usable left in the name
+        return default
+
+
+def iter_letter_entries(export_filter, chunk_size=500):
+    """Documents, rendered PDFs and attachments of the matching letters, one letter at a time."""
+    from letters.models import LetterRender
+
+    letters = export_filter.get_letters().select_related(
+        'category', 'created_by__department'
+    ).prefetch_related(
+        'documents',
+        'attachments',
+        Prefetch('renders', queryset=LetterRender.objects.filter(status='Complete').order_by('-created_at')),
+    ).order_by('pk')
+    for letter in letters.iterator(chunk_size=chunk_size):
+        folder = f"letters/{letter.pk}-{get_safe_name(letter.reference_number, 'letter')}"
+        row = {
+            'type': '',
+            'record_id': letter.pk,
+            'reference': letter.reference_number,
+            'title': letter.subject,
+            'date': letter.created_at.date().isoformat() if letter.created_at else '',
+            'department': letter.created_by.department.name if letter.created_by and letter.created_by.department else '',
+            'category': letter.category.name if letter.category else '',
+            'vendor': '',
+        }
+
+        # Server-rendered PDF of the letter (see letters.utils.render_utils)
+        renders = letter.renders.all()
+        if renders:
+            yield ExportEntry(f"{folder}/letter.pdf", renders[0].pdf, {**row, 'type': 'letter_pdf'})
+
+        for document in letter.documents.all():
+            extension = os.path.splitext(document.document.name)[1]
+            yield ExportEntry(
+                f"{folder}/documents/{document.pk}{extension}", document.document, {**row, 'type': 'letter_document'}
+            )
+
+        for attachment in letter.attachments.all():
+            extension = os.path.splitext(attachment.file.name)[1]
+            name = get_safe_name(attachment.title, 'attachment')
+            if not name.lower().endswith(extension.lower()):
+                name += extension
+            yield ExportEntry(
+                f"{folder}/attachments/{attachment.pk}-{name}",
+                attachment.file, {**row, 'type': 'letter_attachment', 'title': attachment.title or letter.subject}
+            )
+
+
+def iter_agreement_entries(export_filter, chunk_size=500):
+    agreements = export_filter.get_agreements().select_related(
+        'department', 'agreement_type', 'party_name'
+    ).order_by('pk')
+    for agreement in agreements.iterator(chunk_size=chunk_size):
+        filename = agreement.original_filename or os.path.basename(agreement.attachment.name)
+        folder = f"agreements/{agreement.pk}-{get_safe_name(agreement.agreement_id, 'agreement')}"
+        yield ExportEntry(f"{folder}/{get_safe_name(filename)}", agreement.attachment, {
+            'type': 'agreement_attachment',
+            'record_id': agreement.pk,
+            'reference': agreement.agreement_id,
+            'title': agreement.title,
+            'date': agreement.start_date.isoformat(),
+            'department': agreement.department.name if agreement.department else '',
+            'category': agreement.agreement_type.name if agreement.agreement_type else '',
+            'vendor': agreement.party_name.name if agreement.party_name else '',
+        })
+
+
+def iter_export_entries(export_filter):
+    if 'letters' in export_filter.kinds:
+        yield from iter_letter_entries(export_filter)
+    if 'agreements' in export_filter.kinds:
+        yield from iter_agreement_entries(export_filter)
+
+
+class ZipStreamBuffer:
+    """
+    Write-only file object for zipfile. It has no seek(), so zipfile writes
+    data descriptors instead of going back to patch headers, and whatever was
+    written since the last pop() can be handed to the client right away.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_export_zip(export_filter, stats=None):
+    """
+    Generate a ZIP of every document matched by export_filter, plus a
+    manifest.csv listing them, as a sequence of byte chunks.
+
+    Files are copied into the archive EXPORT_READ_SIZE bytes at a time and
+    each chunk is handed out as soon as it is compressed, so memory does not
+    grow with the size of the export. The manifest is spooled to a temporary
+    file and added last. Files missing from storage are listed in the
+    manifest with status 'missing'. stats, when given, is filled with the
+    number of files, missing files and bytes read.
+    """
+    stats = stats if stats is not None else {}
+    stats.update({'files': 0, 'missing': 0, 'bytes': 0})
+    buffer = ZipStreamBuffer()
+
+    with tempfile.SpooledTemporaryFile(max_size=1024 * 1024, mode='w+', newline='') as manifest_file:
+        manifest = csv.DictWriter(manifest_file, fieldnames=MANIFEST_FIELDS)
+        manifest.writeheader()
+
+        with zipfile.ZipFile(
+            buffer, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=EXPORT_COMPRESSLEVEL
+        ) as archive:
+            for entry in iter_export_entries(export_filter):
+                row = {**entry.row, 'path': entry.path, 'size': '', 'sha256': '', 'status': 'ok'}
+                storage = entry.field_file.storage
+                try:
+                    size = storage.size(entry.field_file.name)
+                    source = storage.open(entry.field_file.name, 'rb')
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Skipping {entry.field_file.name} in export: {str(e)}")
+                    manifest.writerow({**row, 'status': 'missing'})
+                    stats['missing'] += 1
+                    continue
+
+                digest = hashlib.sha256()
+                # Entries over 2GB need ZIP64 headers, which must be chosen up front
+                with source, archive.open(entry.path, 'w', force_zip64=size > ZIP64_THRESHOLD) as target:
+                    while True:
+                        data = source.read(EXPORT_READ_SIZE)
+                        if not data:
+                            break
+                        digest.update(data)
+                        target.write(data)
+                        stats['bytes'] += len(data)
+                        chunk = buffer.pop()
+                        if chunk:
+                            yield chunk
+                chunk = buffer.pop()
+                if chunk:
+                    yield chunk
+
+                sha256 = digest.hexdigest()
+                if is_blob_name(entry.field_file.name) and sha256 not in entry.field_file.name:
+                    logger.warning(f"Blob {entry.field_file.name} does not match its checksum")
+                manifest.writerow({**row, 'size': size, 'sha256': sha256})
+                stats['files'] += 1
+
+            manifest_file.seek(0)
+            with archive.open('manifest.csv', 'w') as target:
+                while True:
+                    data = manifest_file.read(EXPORT_READ_SIZE)
+                    if not data:
+                        break
+                    target.write(data.encode())
+
+    # Central directory
+    yield buffer.pop()
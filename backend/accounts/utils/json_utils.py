@@ -0,0 +1,106 @@
+import json
+
+# Characters read from the file at a time
+JSON_READ_SIZE = 64 * 1024
+
+WHITESPACE = ' \t\n\r'
+DELIMITERS = WHITESPACE + ',:]}'
+
+
+class JSONStreamReader:
+    """
+    Reads the items of a JSON array one at a time, so a large backup never
+    has to be in memory as a whole. Each item is decoded with the standard
+    json decoder as soon as it is complete in the buffer.
+    """
+
+    def __init__(self, file, read_size=JSON_READ_SIZE):
+        self.file = file
+        self.read_size = read_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.position = 0
+        self.eof = False
+
+    def fill(self):
+        """Read more of the file, dropping what was already consumed. Returns False at the end of the file."""
+        if self.eof:
+            return False
+        data = self.file.read(self.read_size)
+        if not data:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.position:] + data
+        self.position = 0
+        return True
+
+    def peek(self):
+        """Next character that is not whitespace, or '' at the end of the file."""
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in WHITESPACE:
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self.fill():
+                return ''
+
+    def expect(self, character):
+        if self.peek() != character:
+            raise ValueError(f"Expected '{character}' at character {self.position} of the JSON buffer")
+        self.position += 1
+
+    def decode(self):
+        """Decode the value at the current position."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                if self.fill():
+                    continue
+                raise
+            # In a complete document a value is followed by a delimiter. A
+            # number cut by the end of the read (1 of 1.5) is not, read on
+            if (end == len(self.buffer) or self.buffer[end] not in DELIMITERS) and self.fill():
+                continue
+            self.position = end
+            return value
+
+    def iter_array(self):
+        self.expect('[')
+        if self.peek() == ']':
+            self.position += 1
+            return
+        while True:
+            yield self.decode()
+            if self.peek() == ',':
+                self.position += 1
+                continue
+            self.expect(']')
+            return
+
+    def iter_items(self, key='data'):
+        """
+        Yield the items of the top-level array, or of the array under key
+        when the document is an object (other members are skipped).
+        """
+        if self.peek() == '[':
+            yield from self.iter_array()
+            return
+        self.expect('{')
+        while self.peek() != '}':
+            name = self.decode()
+            self.expect(':')
+            if name == key and self.peek() == '[':
+                yield from self.iter_array()
+                return
+            self.decode()
+            if self.peek() == ',':
+                self.position += 1
+        raise ValueError(f"No '{key}' array in the JSON document")
+
+
+def iter_json_items(path, key='data'):
+    """Items of the array stored in the JSON file at path, see JSONStreamReader.iter_items."""
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        yield from JSONStreamReader(f).iter_items(key)
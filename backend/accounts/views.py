@@ -1,4 +1,6 @@
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.http import content_disposition_header
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, viewsets
@@ -6,6 +8,8 @@ from django.contrib.auth import authenticate, login, logout
 from django.middleware.csrf import get_token
 from rest_framework import generics
 from .models import Department, Designation, Organization, DepartmentPermission, User, Signatory
+from .utils.access_utils import get_access_context
+from .utils.export_utils import ExportFilter, stream_export_zip
 from .serializers import DepartmentSerializer, DesignationSerializer, VendorSerializer, UserSerializer, SignatorySerializer, MyCompanyCCSerializer
 from rest_framework.permissions import IsAuthenticated
 from django.contrib.auth.decorators import login_required
@@ -80,26 +84,13 @@ class DashboardView(APIView):
     def get(self, request):
         """Get dashboard data for the authenticated user"""
         user = request.user
+        access = get_access_context(request)
         
-        # Get user's department and permissions
-        department_ids = set()
-        if user.department:
-            department_ids.add(user.department.id)
-        
-        permitted_dept_ids = DepartmentPermission.objects.filter(
-            user=user,
-            permission_type='edit'
-        ).values_list('department_id', flat=True)
-        department_ids.update(permitted_dept_ids)
-        
-        # Get permitted departments
-        permitted_departments = Department.objects.filter(id__in=department_ids)
+        # Get permitted departments (user's department and edit permissions)
+        permitted_departments = Department.objects.filter(id__in=access.editable_department_ids)
         
         # Check if user is executive
-        is_executive = Department.objects.filter(
-            executive=True,
-            users=user
-        ).exists()
+        is_executive = access.is_executive
         
         # Prepare dashboard data
         dashboard_data = {
@@ -234,4 +225,29 @@ class UserCRUDAPIView(viewsets.ModelViewSet):
 class SignatoryCRUDAPIView(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     queryset = Signatory.objects.all()
-    serializer_class = SignatorySerializer
\ No newline at end of file
+    serializer_class = SignatorySerializer
+
+
+class DocumentExportAPIView(APIView):
+    """
+    Streams a ZIP of letter documents, letter attachments and agreement
+    attachments with a manifest.csv.
+    Query params: date_from, date_to, category, department, vendor and
+    include (letters, agreements or both, comma separated).
+    Agreements are limited to the ones the user can view.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            export_filter = ExportFilter.from_params(request.query_params, user=request.user)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = StreamingHttpResponse(stream_export_zip(export_filter), content_type='application/zip')
+        response['Content-Disposition'] = content_disposition_header(
+            True, f"documents-{timezone.localdate().isoformat()}.zip"
+        )
+        # Pass chunks on as they come instead of buffering the whole archive
+        response['X-Accel-Buffering'] = 'no'
+        return response
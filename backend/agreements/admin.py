@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Agreement, AgreementType  # Add AgreementType to imports
+from .models import Agreement, AgreementType, ReminderDispatch, NotificationOutbox  # Add AgreementType to imports
 
 @admin.register(AgreementType)
 class AgreementTypeAdmin(admin.ModelAdmin):
@@ -74,3 +74,19 @@ class AgreementAdmin(admin.ModelAdmin):
             for child in children
         ])
     get_child_agreements.short_description = 'Child Agreements'
+
+
+@admin.register(ReminderDispatch)
+class ReminderDispatchAdmin(admin.ModelAdmin):
+    list_display = ('agreement', 'reminder_kind', 'due_date', 'recipient_email', 'status', 'attempts', 'sent_at')
+    list_filter = ('status', 'reminder_kind', 'due_date')
+    search_fields = ('agreement__agreement_id', 'agreement__title', 'recipient_email')
+    readonly_fields = ('claimed_by', 'claimed_at', 'sent_at', 'attempts', 'last_error', 'created_at', 'updated_at')
+
+
+@admin.register(NotificationOutbox)
+class NotificationOutboxAdmin(admin.ModelAdmin):
+    list_display = ('agreement', 'action', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status', 'action')
+    search_fields = ('agreement__agreement_id', 'agreement__title')
+    readonly_fields = ('locked_by', 'locked_at', 'sent_at', 'attempts', 'last_error', 'created_at', 'updated_at')
@@ -0,0 +1,53 @@
+# management/commands/process_notifications.py
+import time
+from django.core.management.base import BaseCommand
+from agreements.utils.outbox_utils import drain_notification_outbox
+from agreements.utils.reminder_utils import send_pending_reminders
+
+class Command(BaseCommand):
+    help = 'Sends queued agreement notifications from the notification outbox and queued reminders'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='Number of outbox entries claimed per batch (defaults to NOTIFICATION_OUTBOX_BATCH_SIZE)'
+        )
+        parser.add_argument(
+            '--worker',
+            type=str,
+            default=None,
+            help='Name recorded on claimed outbox entries (defaults to host:pid)'
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep polling the outbox instead of exiting once it is empty'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5.0,
+            help='Seconds to wait between polls in --loop mode'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            stats = drain_notification_outbox(
+                worker=options['worker'],
+                batch_size=options['batch_size'],
+            )
+            # Reminders queued when an agreement was saved (see Agreement.save)
+            reminders = send_pending_reminders(worker=options['worker'])
+            if stats['sent'] or stats['failed'] or not options['loop']:
+                self.stdout.write(
+                    f"Notifications sent: {stats['sent']}, failed: {stats['failed']}."
+                )
+            if reminders['sent'] or reminders['failed'] or not options['loop']:
+                self.stdout.write(
+                    f"Reminders sent: {reminders['sent']}, failed: {reminders['failed']}."
+                )
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
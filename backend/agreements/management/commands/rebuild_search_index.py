@@ -0,0 +1,18 @@
+# management/commands/rebuild_search_index.py
+from django.core.management.base import BaseCommand
+from agreements.utils.search_utils import rebuild_search_index
+
+class Command(BaseCommand):
+    help = 'Rebuilds the agreement search index (run once after migrating and after bulk imports)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of agreements loaded per batch'
+        )
+
+    def handle(self, *args, **options):
+        reindexed = rebuild_search_index(batch_size=options['batch_size'])
+        self.stdout.write(f"Reindexed {reindexed} agreements.")
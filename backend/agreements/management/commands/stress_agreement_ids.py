@@ -0,0 +1,111 @@
+# management/commands/stress_agreement_ids.py
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, connection, connections, transaction
+from django.utils import timezone
+from agreements.models import Agreement, AgreementIdSequence
+
+
+def create_agreements(year, count):
+    """
+    Create count scratch agreements numbered in the given year.
+    Returns (created agreement ids, number of collisions, other errors).
+    """
+    today = timezone.now().date()
+    created, collisions, errors = [], 0, []
+    try:
+        for _ in range(count):
+            agreement = Agreement(
+                title='Agreement id stress test',
+                start_date=today,
+                expiry_date=today + timedelta(days=365),
+                reminder_time=today + timedelta(days=185),
+            )
+            try:
+                with transaction.atomic():
+                    agreement.agreement_id = agreement.generate_agreement_id(year)
+                    agreement.save()
+                created.append(agreement.agreement_id)
+            except IntegrityError:
+                collisions += 1
+            except Exception as e:
+                errors.append(str(e))
+    finally:
+        # Threads and processes each hold their own connection
+        connection.close()
+    return created, collisions, errors
+
+
+class Command(BaseCommand):
+    help = (
+        'Hammers Agreement creation from concurrent threads or processes and checks '
+        'that every agreement_id is unique. Run it against the production database engine.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=8,
+            help='Number of concurrent creators'
+        )
+        parser.add_argument(
+            '--agreements',
+            type=int,
+            default=50,
+            help='Number of agreements created by each creator'
+        )
+        parser.add_argument(
+            '--processes',
+            action='store_true',
+            help='Run creators as separate processes instead of threads'
+        )
+        parser.add_argument(
+            '--year',
+            type=int,
+            default=9999,
+            help='Scratch year used for the ids, its agreements and sequence are deleted afterwards'
+        )
+
+    def handle(self, *args, **options):
+        year = options['year']
+        workers = options['workers']
+        scratch = Agreement.objects.filter(agreement_id__startswith=f"A_{year}_")
+        if scratch.exists() or AgreementIdSequence.objects.filter(year=year).exists():
+            raise CommandError(f"Agreement ids for {year} already exist, pick another --year")
+
+        if options['processes']:
+            # Children must not inherit the parent's open connections
+            connections.close_all()
+            executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork'))
+        else:
+            executor = ThreadPoolExecutor(workers)
+
+        try:
+            started = time.monotonic()
+            with executor:
+                results = list(executor.map(create_agreements, [year] * workers, [options['agreements']] * workers))
+            elapsed = time.monotonic() - started
+
+            ids = [agreement_id for created, _, _ in results for agreement_id in created]
+            collisions = sum(result[1] for result in results)
+            errors = [error for _, _, worker_errors in results for error in worker_errors]
+            stored = scratch.count()
+
+            kind = 'processes' if options['processes'] else 'threads'
+            self.stdout.write(
+                f"Created {len(ids)} agreements from {workers} {kind} in {elapsed:.2f}s "
+                f"({len(ids) / elapsed:.1f}/s), {stored} stored, "
+                f"{len(ids) - len(set(ids))} duplicate ids, {collisions} collisions"
+            )
+            for error in errors[:10]:
+                self.stderr.write(error)
+            if collisions or len(set(ids)) != len(ids) or stored != len(ids):
+                raise CommandError("agreement_id allocation is not race free")
+        finally:
+            scratch.delete()
+            AgreementIdSequence.objects.filter(year=year).delete()
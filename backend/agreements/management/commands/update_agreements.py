@@ -2,22 +2,67 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from agreements.models import Agreement
+from agreements.utils.reminder_utils import dispatch_due_reminders
+from agreements.utils.stats_utils import invalidate_dashboard_stats
+from agreements.utils.upload_utils import remove_expired_uploads
 
 class Command(BaseCommand):
     help = 'Updates statuses and sends reminders'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='Number of due agreements loaded per batch (defaults to REMINDER_BATCH_SIZE)'
+        )
+        parser.add_argument(
+            '--worker',
+            type=str,
+            default=None,
+            help='Name recorded on claimed reminder dispatches (defaults to host:pid)'
+        )
+        parser.add_argument(
+            '--shard',
+            type=int,
+            default=0,
+            help='Index of the agreement shard handled by this worker'
+        )
+        parser.add_argument(
+            '--shards',
+            type=int,
+            default=None,
+            help='Total number of workers sharing the reminder job'
+        )
+
     def handle(self, *args, **options):
         today = timezone.now().date()
-        
+
         # 1. Update statuses for everything that expired before today or today
         expired_count = Agreement.objects.filter(
-            expiry_date__lte=today, 
+            expiry_date__lte=today,
             status='Ongoing'
-        ).update(status='Expired')
+        ).update(status='Expired', updated_at=timezone.now())
+        # update() skips the model signals and auto_now (incremental backups
+        # select rows by updated_at), refresh the dashboard snapshot here
+        if expired_count:
+            invalidate_dashboard_stats()
+
+        # 2. Queue and send reminders only for agreements that are due one today.
+        #    Already sent reminders are recorded in the ledger, so reruns are safe.
+        stats = dispatch_due_reminders(
+            today=today,
+            batch_size=options['batch_size'],
+            worker=options['worker'],
+            shard=options['shard'],
+            shards=options['shards'],
+        )
 
-        # 2. Trigger reminders for all agreements (both Ongoing and Expired)
-        agreements = Agreement.objects.filter(status__in=['Ongoing', 'Expired'])
-        for agreement in agreements:
-            agreement.check_and_send_reminders()
+        # 3. Drop chunked uploads that were abandoned or never attached
+        removed_uploads = remove_expired_uploads()
 
-        self.stdout.write(f"Updated {expired_count} agreements to Expired.")
\ No newline at end of file
+        self.stdout.write(f"Updated {expired_count} agreements to Expired.")
+        self.stdout.write(
+            f"Reminders planned: {stats['planned']}, sent: {stats['sent']}, failed: {stats['failed']}."
+        )
+        self.stdout.write(f"Removed {removed_uploads} expired chunked uploads.")
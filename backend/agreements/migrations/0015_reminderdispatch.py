@@ -0,0 +1,42 @@
+# Generated by Django 5.2.4 on 2026-10-18 05:53
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agreements', '0014_remove_agreement_party_name_agreement_party_name_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReminderDispatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reminder_kind', models.CharField(max_length=20)),
+                ('due_date', models.DateField(help_text='First day of the reminder window this dispatch belongs to')),
+                ('recipient_email', models.EmailField(max_length=254)),
+                ('recipient_name', models.CharField(blank=True, max_length=150)),
+                ('status', models.CharField(choices=[('Pending', 'Pending'), ('Sending', 'Sending'), ('Sent', 'Sent'), ('Failed', 'Failed')], default='Pending', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('claimed_by', models.CharField(blank=True, max_length=100)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('agreement', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reminder_dispatches', to='agreements.agreement')),
+                ('recipient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reminder_dispatches', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Reminder Dispatch',
+                'verbose_name_plural': 'Reminder Dispatches',
+                'indexes': [models.Index(fields=['status', 'claimed_at'], name='agreements__status_9b17d7_idx')],
+                'unique_together': {('agreement', 'reminder_kind', 'due_date', 'recipient')},
+            },
+        ),
+    ]
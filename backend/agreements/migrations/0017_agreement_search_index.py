@@ -0,0 +1,40 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agreements', '0016_notificationoutbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AgreementSearchDocument',
+            fields=[
+                ('agreement', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='agreements.agreement')),
+                ('content', models.TextField(blank=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Agreement Search Document',
+                'verbose_name_plural': 'Agreement Search Documents',
+            },
+        ),
+        migrations.CreateModel(
+            name='AgreementSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=100)),
+                ('weight', models.PositiveSmallIntegerField(default=1)),
+                ('agreement', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='agreements.agreement')),
+            ],
+            options={
+                'verbose_name': 'Agreement Search Term',
+                'verbose_name_plural': 'Agreement Search Terms',
+                'unique_together': {('term', 'agreement')},
+            },
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:11
+
+import re
+
+from django.db import migrations, models
+
+# Copied from agreements.utils.sequence_utils so later changes there can't
+# change what this migration does
+AGREEMENT_ID_PATTERN = re.compile(r'^A_(\d{4})_(\d{4,})$')
+
+
+def get_highest_agreement_numbers(agreement_ids):
+    """
+    Return {year: highest number} for the well-formed A_{year}_{NNNN} ids in
+    agreement_ids. Legacy ids with a random suffix are ignored.
+    """
+    highest = {}
+    for agreement_id in agreement_ids:
+        match = AGREEMENT_ID_PATTERN.match(agreement_id or '')
+        if match:
+            year, number = int(match.group(1)), int(match.group(2))
+            highest[year] = max(highest.get(year, 0), number)
+    return highest
+
+
+def seed_sequences(apps, schema_editor):
+    """Start every year's sequence after the highest agreement_id already stored."""
+    Agreement = apps.get_model('agreements', 'Agreement')
+    AgreementIdSequence = apps.get_model('agreements', 'AgreementIdSequence')
+    highest = get_highest_agreement_numbers(
+        Agreement.objects.values_list('agreement_id', flat=True).iterator()
+    )
+    AgreementIdSequence.objects.bulk_create([
+        AgreementIdSequence(year=year, last_number=number)
+        for year, number in highest.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agreements', '0017_agreement_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AgreementIdSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveIntegerField(unique=True)),
+                ('last_number', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Agreement ID Sequence',
+                'verbose_name_plural': 'Agreement ID Sequences',
+            },
+        ),
+        migrations.RunPython(seed_sequences, migrations.RunPython.noop),
+    ]
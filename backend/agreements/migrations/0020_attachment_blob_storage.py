@@ -0,0 +1,21 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:19
+
+import accounts.utils.blob_utils
+import agreements.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_storedblob'),
+        ('agreements', '0019_chunkedupload'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='agreement',
+            name='attachment',
+            field=models.FileField(blank=True, max_length=255, null=True, storage=accounts.utils.blob_utils.get_blob_storage, upload_to=agreements.models.agreement_file_path),
+        ),
+    ]
@@ -5,10 +5,16 @@ from accounts.models import Department, User, Organization
 from django.core.exceptions import ValidationError
 import os
 import uuid
-from django.db import transaction, IntegrityError
+from django.db import transaction
 import logging
 from django.utils import timezone
 from django.contrib.auth import get_user_model
+from django.dispatch import receiver
+from django.db.models.signals import post_save, post_delete
+from .utils.stats_utils import invalidate_dashboard_stats
+from .utils.search_utils import INDEXED_ATTRIBUTES, index_agreement, index_agreements_in_batches
+from .utils.sequence_utils import allocate_agreement_number, format_agreement_id
+from accounts.utils.blob_utils import get_blob_storage, track_blob_references
 
 logger = logging.getLogger(__name__)
 
@@ -91,6 +97,7 @@ class Agreement(models.Model):
     )
     attachment = models.FileField(
         upload_to=agreement_file_path,
+        storage=get_blob_storage,
         max_length=255,
         blank=True,
         null=True
@@ -156,132 +163,72 @@ class Agreement(models.Model):
                     {'reminder_time': 'Reminder must be before expiry date.'}
                 )
 
-    def check_and_send_reminders(self):
-        """
-        Check if reminders need to be sent and send them if necessary.
-        Uses range-based logic to trigger reminders within their windows.
-        """
-        try:
-            today = timezone.now().date()
-            days_until_expiry = (self.expiry_date - today).days
+    # Fields whose database values are remembered on load, see has_changed()
+    TRACKED_FIELDS = ('expiry_date', 'reminder_time') + INDEXED_ATTRIBUTES
 
-            # (today == self.reminder_time)
-            
-            from .utils.email_utils import send_agreement_reminder
-
-            # Initial reminder - send on the reminder date
-            if self.reminder_time == today:
-                logger.info(f"Sending initial reminder for agreement {self.id}")
-                send_agreement_reminder(
-                    agreement=self,
-                    reminder_type='before',
-                    time_remaining=f"{days_until_expiry} days"
-                )
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {
+            name: value for name, value in zip(field_names, values)
+            if name in cls.TRACKED_FIELDS
+        }
+        return instance
 
-            # 30 days (1 month) reminder - send when between 30 days until expiry
-            elif 29 <= days_until_expiry <= 30:
-                logger.info(f"Sending 1-month reminder for agreement {self.id}")
-                send_agreement_reminder(
-                    agreement=self,
-                    reminder_type='before',
-                    time_remaining="30 days"
-                )
+    def get_tracked_value(self, name):
+        field = self._meta.get_field(name)
+        return field.get_prep_value(getattr(self, field.attname))
 
-            # 15 days reminder - send when between 15 days until expiry
-            elif 14 <= days_until_expiry <= 15:
-                logger.info(f"Sending 15-day reminder for agreement {self.id}")
-                send_agreement_reminder(
-                    agreement=self,
-                    reminder_type='before',
-                    time_remaining="15 days"
-                )
+    def has_changed(self, name):
+        """
+        Compare a tracked field with the value loaded from the database.
+        New agreements and fields that were not loaded count as changed.
+        """
+        loaded_values = getattr(self, '_loaded_values', {})
+        if self._state.adding or name not in loaded_values:
+            return True
+        return loaded_values[name] != self.get_tracked_value(name)
 
-            # 7 days reminder - send when between 7 days until expiry
-            elif 6 <= days_until_expiry <= 7:
-                logger.info(f"Sending 7-day reminder for agreement {self.id}")
-                send_agreement_reminder(
-                    agreement=self,
-                    reminder_type='before',
-                    time_remaining="7 days"
-                )
+    def queue_reminders_if_due(self):
+        """
+        Queue the reminder due today, if any, in the reminder ledger once the
+        save commits. The process_notifications job sends it, so saving never
+        waits on SMTP, and nothing is queried when no reminder is due.
+        """
+        from .utils.reminder_utils import get_reminder_kind, queue_reminders_after_save
 
-            # Expiration day reminder - send on the day of expiration
-            elif days_until_expiry == 0:
-                logger.info(f"Sending expiration day reminder for agreement {self.id}")
-                send_agreement_reminder(
-                    agreement=self,
-                    reminder_type='on'
-                )
-            # elif (today >= self.reminder_time - timedelta(days=2)) and (today <= self.reminder_time + timedelta(days=2)):
-            #     # Around reminder date - send reminder (within 2 days before or after)
-            #     logger.info(f"Sending reminder around reminder date for agreement {self.id}")
-            #     send_agreement_reminder(
-            #         agreement=self,
-            #         reminder_type='before',
-            #         time_remaining=f"{days_until_expiry} days"
-            #     )   
-
-
-            # After expiry - send reminder around 1 month after expiry (20-40 days)
-            elif  -30 <= days_until_expiry <= -29:
-                logger.info(f"Sending after-expiry reminder for agreement {self.id} ({abs(days_until_expiry)} days expired)")
-                send_agreement_reminder(
-                    agreement=self,
-                    reminder_type='after',
-                    months_since_expiration="1 month"
-                )
+        # The reminder windows (reminder date, 30/15/7 days, expiry day and
+        # one month after expiry) are shared with the nightly reminder job,
+        # and sending goes through the same ledger so nothing is sent twice
+        if self.status in ('Ongoing', 'Expired') and get_reminder_kind(self):
+            agreement_id = self.pk
+            transaction.on_commit(lambda: queue_reminders_after_save(agreement_id))
 
-        except Exception as e:
-            logger.error(f"Error in check_and_send_reminders for agreement {self.id}: {str(e)}")
+    def generate_agreement_id(self, year=None):
+        """
+        Return the next A_{year}_{NNNN} id, numbered by the per-year
+        AgreementIdSequence (see agreements.utils.sequence_utils).
+        """
+        year = year or datetime.now().year
+        return format_agreement_id(year, allocate_agreement_number(year))
 
     def save(self, *args, **kwargs):
-        # Store the old expiry date if this is an existing agreement
-        old_expiry_date = None
-        if self.pk:
-            try:
-                old_instance = Agreement.objects.get(pk=self.pk)
-                old_expiry_date = old_instance.expiry_date
-            except Agreement.DoesNotExist:
-                pass
+        # Compare with the values loaded from the database, no extra query needed
+        reminder_dates_changed = self.has_changed('expiry_date') or self.has_changed('reminder_time')
 
         # Auto-generate agreement_id if new record
         if not self.pk and not self.agreement_id:
-            with transaction.atomic():
-                year = datetime.now().year
-                try:
-                    # Get the maximum existing ID number for this year
-                    max_id = Agreement.objects.filter(
-                        agreement_id__startswith=f"A_{year}_",
-                        agreement_id__regex=r'^A_\d{4}_\d{4}$'  # Ensure proper format
-                    ).order_by('-agreement_id').first()
-                    
-                    if max_id:
-                        last_num = int(max_id.agreement_id.split('_')[-1])
-                        count = last_num + 1
-                    else:
-                        count = 1
-                        
-                    self.agreement_id = f"A_{year}_{count:04d}"
-                    
-                    # Verify this ID doesn't already exist (final safety check)
-                    if Agreement.objects.filter(agreement_id=self.agreement_id).exists():
-                        raise IntegrityError(f"Duplicate ID generated: {self.agreement_id}")
-                        
-                except (ValueError, IndexError) as e:
-                    logger.error(f"Error parsing agreement ID: {e}")
-                    # Fallback to UUID if ID parsing fails
-                    self.agreement_id = f"A_{year}_{uuid.uuid4().hex[:4]}"
+            self.agreement_id = self.generate_agreement_id()
             
         # Set default reminder if not set
         if not self.reminder_time and self.expiry_date:
             self.reminder_time = self.expiry_date - timedelta(days=180)
             
-        # If a new file is uploaded, set the original filename
-        if self.attachment and hasattr(self.attachment, 'file'):
-            # Only set if the file is new or changed
-            if not self.pk or not Agreement.objects.filter(pk=self.pk, attachment=self.attachment.name).exists():
-                # Use the uploaded file's original name
-                self.original_filename = self.attachment.file.name
+        # If a new file is uploaded, set the original filename. Files already
+        # in storage are not opened, their name is a storage path.
+        if self.attachment and not self.attachment._committed:
+            # Use the uploaded file's original name
+            self.original_filename = self.attachment.file.name
         
         # Auto-manage status based on expiry date
         if self.expiry_date:
@@ -294,17 +241,11 @@ class Agreement(models.Model):
         
         # Save the model
         super().save(*args, **kwargs)
+        self._loaded_values = {name: self.get_tracked_value(name) for name in self.TRACKED_FIELDS}
 
-        # Check if this is a new agreement or if the expiry date has changed
-        if not old_expiry_date or (old_expiry_date and old_expiry_date != self.expiry_date):
-            # Check and send reminders
-            self.check_and_send_reminders()
-
-    def delete(self, *args, **kwargs):
-        """Delete associated files when agreement is deleted"""
-        if self.attachment:
-            self.attachment.delete(save=False)
-        super().delete(*args, **kwargs)
+        # New agreements and changed dates may be due a reminder today
+        if reminder_dates_changed:
+            self.queue_reminders_if_due()
 
     def __str__(self):
         return f"{self.agreement_id} - {self.title}"
@@ -341,49 +282,22 @@ class Agreement(models.Model):
         - All users from the same department
         - Users with department permissions for this department
         - All executive users (from executive departments)
+        Resolved with a single query, see agreements.utils.recipient_utils.
         """
+        from .utils.recipient_utils import get_recipient_filter
         User = get_user_model()
-        logger.info(f"Getting users to notify for agreement {self.id}")
-    
-        # Start with assigned users and creator
-        assigned_users = set(list(self.assigned_users.all()))
-        logger.info(f"Found {len(assigned_users)} assigned users")
-    
-        users = assigned_users.copy()
-    
-        # Add creator if not already included
-        if self.creator:
-            users.add(self.creator)
-            logger.info(f"Added creator: {self.creator.email}")
-    
-        # Add all users from the same department
-        if self.department:
-            logger.info(f"Looking for users in department: {self.department.name}")
-            department_users = User.objects.filter(department=self.department)
-            users.update(department_users)
-            logger.info(f"Added {department_users.count()} department users")
-    
-        # Add users with department permissions for this department
-        if self.department:
-            from accounts.models import DepartmentPermission
-            permission_users = User.objects.filter(
-                department_permissions__department=self.department
-            ).distinct()
-            users.update(permission_users)
-            logger.info(f"Added {permission_users.count()} users with department permissions")
-    
-        # Add all executive users (users from executive departments)
-        executive_users = User.objects.filter(
-            department__executive=True
-        ).distinct()
-        users.update(executive_users)
-        logger.info(f"Added {executive_users.count()} executive users")
-    
-        final_users = list(users)
-        logger.info(f"Total users to notify: {len(final_users)}")
-        logger.info(f"User emails: {[user.email for user in final_users]}")
-        
-        return final_users
+
+        users = list(User.objects.filter(get_recipient_filter(self)).order_by('id'))
+        logger.info(f"Total users to notify for agreement {self.id}: {len(users)}")
+        return users
+
+    def get_notification_recipients(self):
+        """
+        Same recipients as get_users_to_notify, as lightweight
+        {'id', 'email', 'full_name'} dicts instead of User instances.
+        """
+        from .utils.recipient_utils import resolve_recipients
+        return resolve_recipients(self)
     
     ## for agreement creation or update notification
     # THIS FUNCTION MAY BE REDUNDENT IF VIEWS HANDLE NOTIFICATIONS DIRECTLY xx send_agreement_action_notification
@@ -537,3 +451,249 @@ class Agreement(models.Model):
     #     except Exception as e:
     #         logger.error(f"Failed to send reminder notification for agreement {self.id}: {str(e)}")
     #         return False
+
+
+class AgreementIdSequence(models.Model):
+    """
+    Last agreement_id number handed out per year. Agreement.save increments
+    it atomically instead of looking up the highest existing id.
+    """
+    year = models.PositiveIntegerField(unique=True)
+    last_number = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.year}: {self.last_number}"
+
+    class Meta:
+        verbose_name = 'Agreement ID Sequence'
+        verbose_name_plural = 'Agreement ID Sequences'
+
+
+class ReminderDispatch(models.Model):
+    """
+    Ledger of reminder emails. One row per agreement, reminder kind, due date
+    and recipient, so reruns of update_agreements never send the same reminder twice.
+    """
+    DISPATCH_STATUS = (
+        ('Pending', 'Pending'),
+        ('Sending', 'Sending'),
+        ('Sent', 'Sent'),
+        ('Failed', 'Failed'),
+    )
+
+    agreement = models.ForeignKey(
+        Agreement,
+        on_delete=models.CASCADE,
+        related_name='reminder_dispatches'
+    )
+    reminder_kind = models.CharField(max_length=20)
+    due_date = models.DateField(
+        help_text="First day of the reminder window this dispatch belongs to"
+    )
+    recipient = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='reminder_dispatches'
+    )
+    recipient_email = models.EmailField()
+    recipient_name = models.CharField(max_length=150, blank=True)
+    status = models.CharField(
+        max_length=10,
+        choices=DISPATCH_STATUS,
+        default='Pending'
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    claimed_by = models.CharField(max_length=100, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.agreement_id} - {self.reminder_kind} ({self.due_date}) to {self.recipient_email}"
+
+    class Meta:
+        unique_together = ('agreement', 'reminder_kind', 'due_date', 'recipient')
+        indexes = [
+            models.Index(fields=['status', 'claimed_at']),
+        ]
+        verbose_name = 'Reminder Dispatch'
+        verbose_name_plural = 'Reminder Dispatches'
+
+
+class NotificationOutbox(models.Model):
+    """
+    Agreement created/updated notifications waiting to be emailed.
+    Rows are written in the same transaction as the agreement and drained by
+    the process_notifications command, so requests never wait on SMTP.
+    """
+    OUTBOX_STATUS = (
+        ('Pending', 'Pending'),
+        ('Processing', 'Processing'),
+        ('Sent', 'Sent'),
+        ('Failed', 'Failed'),
+    )
+
+    agreement = models.ForeignKey(
+        Agreement,
+        on_delete=models.CASCADE,
+        related_name='notification_outbox'
+    )
+    action = models.CharField(max_length=20)
+    triggered_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='triggered_notifications'
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=OUTBOX_STATUS,
+        default='Pending'
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.agreement_id} - {self.action} ({self.status})"
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+        verbose_name = 'Notification Outbox Entry'
+        verbose_name_plural = 'Notification Outbox'
+
+
+
+class ChunkedUpload(models.Model):
+    """
+    A resumable upload of a large attachment. Chunks are appended to a part
+    file in CHUNKED_UPLOAD_DIR until offset reaches size, then the finished
+    upload is attached to an agreement by id (see agreements.utils.upload_utils).
+    """
+    UPLOAD_STATUS = (
+        ('Uploading', 'Uploading'),
+        ('Complete', 'Complete'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='chunked_uploads'
+    )
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    sha256 = models.CharField(
+        max_length=64,
+        blank=True,
+        help_text="Expected checksum sent by the client, replaced by the computed one on completion"
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=UPLOAD_STATUS,
+        default='Uploading'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def part_path(self):
+        return os.path.join(settings.CHUNKED_UPLOAD_DIR, f"{self.pk}.part")
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size}, {self.status})"
+
+    class Meta:
+        verbose_name = 'Chunked Upload'
+        verbose_name_plural = 'Chunked Uploads'
+
+
+class AgreementSearchDocument(models.Model):
+    """
+    Denormalized searchable text of an agreement, kept up to date on save.
+    The matching terms live in AgreementSearchTerm.
+    """
+    agreement = models.OneToOneField(
+        Agreement,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='search_document'
+    )
+    content = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Search document for {self.agreement_id}"
+
+    class Meta:
+        verbose_name = 'Agreement Search Document'
+        verbose_name_plural = 'Agreement Search Documents'
+
+
+class AgreementSearchTerm(models.Model):
+    """
+    Inverted index entry: one row per distinct term of an agreement, with the
+    weight of the field it was found in. Prefix searches use the index on term.
+    """
+    agreement = models.ForeignKey(
+        Agreement,
+        on_delete=models.CASCADE,
+        related_name='search_terms'
+    )
+    term = models.CharField(max_length=100)
+    weight = models.PositiveSmallIntegerField(default=1)
+
+    def __str__(self):
+        return f"{self.term} ({self.agreement_id})"
+
+    class Meta:
+        unique_together = ('term', 'agreement')
+        verbose_name = 'Agreement Search Term'
+        verbose_name_plural = 'Agreement Search Terms'
+
+# Keep the cached dashboard snapshot (see agreements.utils.stats_utils) in sync.
+# Invalidate after commit so a concurrent request can't re-cache the old counts.
+@receiver([post_save, post_delete], sender=Agreement)
+@receiver([post_save, post_delete], sender=Department)
+def invalidate_dashboard_stats_on_change(sender, **kwargs):
+    transaction.on_commit(invalidate_dashboard_stats)
+
+
+# Remove the part file of finished, cancelled or expired chunked uploads
+@receiver(post_delete, sender=ChunkedUpload)
+def delete_chunked_upload_part(sender, instance, **kwargs):
+    if os.path.exists(instance.part_path):
+        os.remove(instance.part_path)
+
+
+# Attachments live in the shared blob store, the files are removed by
+# collect_blob_garbage once no agreement points at them
+track_blob_references(Agreement, 'attachment')
+
+
+# Keep the search index (see agreements.utils.search_utils) in sync
+@receiver(post_save, sender=Agreement)
+def index_agreement_on_save(sender, instance, raw=False, **kwargs):
+    # post_save runs before save() refreshes the loaded values, so has_changed()
+    # still compares with the database row
+    if not raw and any(instance.has_changed(name) for name in INDEXED_ATTRIBUTES):
+        index_agreement(instance)
+
+
+@receiver(post_save, sender=Organization)
+def index_party_agreements_on_save(sender, instance, raw=False, **kwargs):
+    # Every agreement of the party carries its name, reindex them in batches
+    if not raw:
+        index_agreements_in_batches(instance.agreements.all())
@@ -0,0 +1,23 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class AgreementCursorPagination(CursorPagination):
+    """
+    Cursor pagination for the agreement list, newest first. Each page costs
+    the same however deep the user scrolls, unlike offset pagination.
+    """
+    ordering = '-created_at'
+    page_size = getattr(settings, 'AGREEMENT_LIST_PAGE_SIZE', 50)
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'AGREEMENT_LIST_MAX_PAGE_SIZE', 500)
+
+
+class AgreementSearchPagination(PageNumberPagination):
+    """
+    Page number pagination for search results, which are ordered by relevance
+    and so can't use a cursor.
+    """
+    page_size = getattr(settings, 'AGREEMENT_LIST_PAGE_SIZE', 50)
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'AGREEMENT_LIST_MAX_PAGE_SIZE', 500)
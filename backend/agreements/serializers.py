@@ -1,4 +1,7 @@
+from django.db.models import F
+from django.urls import reverse
 from rest_framework import serializers
+from accounts.utils.download_utils import get_download_url
 from .models import Agreement, AgreementType  # Add AgreementType to imports
 from accounts.models import User, Organization, Department
 
@@ -35,6 +38,7 @@ class AgreementSerializer(serializers.ModelSerializer):
     parent_agreement_title = serializers.CharField(source='parent_agreement.title', read_only=True)
     parent_agreement = ParentAgreementSerializer(read_only=True)
     child_agreements = serializers.SerializerMethodField()
+    download_url = serializers.SerializerMethodField()
 
     def get_assigned_users(self, obj):
         return [user.full_name for user in obj.assigned_users.all()]
@@ -48,22 +52,43 @@ class AgreementSerializer(serializers.ModelSerializer):
         } for child in children]
     
     def get_executive_users(self, obj):
-        executives = User.objects.filter(department__executive=True)
-        return [
-            {
-                'id': user.id,
-                'full_name': user.full_name,
-                'department__name': user.department.name if user.department else ''
-            }
-            for user in executives
-        ]
+        # Same list for every agreement, so load it once per serialization
+        # (shared by all items of a many=True serializer through the context)
+        if 'executive_users' not in self.context:
+            executives = User.objects.filter(department__executive=True).select_related('department')
+            self.context['executive_users'] = [
+                {
+                    'id': user.id,
+                    'full_name': user.full_name,
+                    'department__name': user.department.name if user.department else ''
+                }
+                for user in executives
+            ]
+        return self.context['executive_users']
+
+    def get_download_url(self, obj):
+        # Signed link to the access-checked download endpoint, None without a request
+        if not obj.attachment:
+            return None
+        return get_download_url(self.context.get('request'), reverse('api-agreement-attachment', args=[obj.pk]))
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """Load every relation used by this serializer up front."""
+        return queryset.select_related(
+            'department',
+            'agreement_type',
+            'party_name',
+            'creator',
+            'parent_agreement__parent_agreement',
+        ).prefetch_related('assigned_users', 'child_agreements')
 
     class Meta:
         model = Agreement
         fields = [
             'id', 'title', 'agreement_reference', 'agreement_type', 'agreement_type_name', 'agreement_type_detail',
             'status', 'start_date', 'expiry_date', 'reminder_time', 'remarks',
-            'party_name', 'party_name_display', 'attachment', 'original_filename','created_at', 'updated_at',
+            'party_name', 'party_name_display', 'attachment', 'original_filename', 'download_url', 'created_at', 'updated_at',
             'agreement_id', 'assigned_users', 'department', 'department_name', 'creator', 'creator_name', 'executive_users',
             'parent_agreement', 'parent_agreement_title', 'child_agreements'
         ]
@@ -78,6 +103,79 @@ class AgreementSerializer(serializers.ModelSerializer):
         # Department must be set explicitly; do not assign agreement_type to department
         return super().update(instance, validated_data)
 
+class AgreementListRowSerializer(serializers.Serializer):
+    """
+    Lightweight serializer for the agreement list. Works on plain rows from
+    QuerySet.values() (see get_list_values), so listing agreements never
+    builds model instances or follows relations per row.
+
+    Pass fields=[...] to only return a subset of LIST_FIELDS.
+    """
+    # Output name -> ORM lookup used to fetch it
+    LIST_FIELDS = {
+        'id': 'id',
+        'agreement_id': 'agreement_id',
+        'title': 'title',
+        'agreement_reference': 'agreement_reference',
+        'status': 'status',
+        'start_date': 'start_date',
+        'expiry_date': 'expiry_date',
+        'reminder_time': 'reminder_time',
+        'agreement_type': 'agreement_type',
+        'agreement_type_name': 'agreement_type__name',
+        'party_name': 'party_name',
+        'party_name_display': 'party_name__name',
+        'department': 'department',
+        'department_name': 'department__name',
+        'creator': 'creator',
+        'creator_name': 'creator__full_name',
+        'parent_agreement': 'parent_agreement',
+        'parent_agreement_title': 'parent_agreement__title',
+        'created_at': 'created_at',
+        'updated_at': 'updated_at',
+    }
+
+    id = serializers.IntegerField(read_only=True)
+    agreement_id = serializers.CharField(read_only=True)
+    title = serializers.CharField(read_only=True)
+    agreement_reference = serializers.CharField(read_only=True)
+    status = serializers.CharField(read_only=True)
+    start_date = serializers.DateField(read_only=True)
+    expiry_date = serializers.DateField(read_only=True)
+    reminder_time = serializers.DateField(read_only=True)
+    agreement_type = serializers.IntegerField(read_only=True)
+    agreement_type_name = serializers.CharField(read_only=True)
+    party_name = serializers.IntegerField(read_only=True)
+    party_name_display = serializers.CharField(read_only=True)
+    department = serializers.IntegerField(read_only=True)
+    department_name = serializers.CharField(read_only=True)
+    creator = serializers.IntegerField(read_only=True)
+    creator_name = serializers.CharField(read_only=True)
+    parent_agreement = serializers.IntegerField(read_only=True)
+    parent_agreement_title = serializers.CharField(read_only=True)
+    created_at = serializers.DateTimeField(read_only=True)
+    updated_at = serializers.DateTimeField(read_only=True)
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def get_list_values(cls, queryset, fields=None):
+        """
+        Return queryset.values() restricted to the requested fields. id and
+        created_at are always fetched as the list is paginated on them.
+        """
+        names = set(fields or cls.LIST_FIELDS) | {'id', 'created_at'}
+        lookups = {name: lookup for name, lookup in cls.LIST_FIELDS.items() if name in names}
+        return queryset.values(
+            *[name for name, lookup in lookups.items() if name == lookup],
+            **{name: F(lookup) for name, lookup in lookups.items() if name != lookup}
+        )
+
+
 class AgreementListSerializer(serializers.ModelSerializer):
     child_agreements = serializers.SerializerMethodField()
     
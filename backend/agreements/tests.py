@@ -0,0 +1,846 @@
+import csv
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import zipfile
+from datetime import date, datetime, timedelta
+from unittest import mock
+
+from django.core import mail
+from django.core.mail import EmailMessage, get_connection
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.template.loader import render_to_string
+from django.db import connection
+from django.test import TestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.models import Department, DepartmentPermission, Organization, User
+from .models import (
+    Agreement, AgreementIdSequence, AgreementSearchTerm, AgreementType, ChunkedUpload, NotificationOutbox, ReminderDispatch,
+)
+from .utils.email_utils import get_reminder_context, send_bulk_messages
+from .utils.outbox_utils import (
+    claim_outbox_entries, drain_notification_outbox, get_retry_delay, queue_agreement_notification,
+)
+from .utils.recipient_utils import resolve_recipients, resolve_recipients_bulk
+from .utils.reminder_utils import (
+    claim_reminder_dispatches, dispatch_due_reminders, plan_due_reminders, queue_due_reminders,
+    send_pending_reminders,
+)
+from .utils.render_utils import RECIPIENT_NAME_PLACEHOLDER, AgreementEmailRenderer
+from .utils.sequence_utils import sync_agreement_id_sequences
+from .utils.stats_utils import get_dashboard_stats
+from .utils.upload_utils import get_completed_upload
+
+
+class AgreementListQueryCountTests(TestCase):
+    """The agreement list endpoints must not issue queries per agreement."""
+
+    def setUp(self):
+        cache.clear()
+        self.department = Department.objects.create(name='IT')
+        executives = Department.objects.create(name='Board', executive=True)
+        self.user = User.objects.create(email='user@example.com', full_name='User', department=self.department)
+        for i in range(3):
+            User.objects.create(email=f'exec{i}@example.com', full_name=f'Exec {i}', department=executives)
+        self.agreement_type = AgreementType.objects.create(name='Service')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_agreements(self, count):
+        today = timezone.now().date()
+        for i in range(count):
+            parent = Agreement.objects.create(
+                title=f'Parent {i}',
+                agreement_type=self.agreement_type,
+                department=self.department,
+                creator=self.user,
+                start_date=today,
+                expiry_date=today + timedelta(days=400),
+            )
+            child = Agreement.objects.create(
+                title=f'Child {i}',
+                agreement_type=self.agreement_type,
+                department=self.department,
+                creator=self.user,
+                start_date=today,
+                expiry_date=today + timedelta(days=400),
+                parent_agreement=parent,
+            )
+            child.assigned_users.add(self.user)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assert_constant_queries(self, url):
+        self.create_agreements(2)
+        self.client.get(url)  # warm up the user's access context
+        small = self.count_queries(url)
+        self.create_agreements(8)
+        self.assertEqual(self.count_queries(url), small)
+
+    def test_agreement_list_api_view(self):
+        self.assert_constant_queries('/api/agreements/')
+
+    def test_agreement_viewset_list(self):
+        self.assert_constant_queries('/api/agreements/agreements/list/')
+
+    def test_executive_users_loaded_once(self):
+        self.create_agreements(5)
+        response = self.client.get('/api/agreements/agreements/list/')
+        agreements = response.data['agreements']
+        self.assertEqual(len(agreements), 10)
+        self.assertEqual(len(agreements[0]['executive_users']), 3)
+        self.assertTrue(all(a['executive_users'] == agreements[0]['executive_users'] for a in agreements))
+
+    def test_permission_change_reaches_cached_access_context(self):
+        today = timezone.now().date()
+        other = Department.objects.create(name='HR')
+        Agreement.objects.create(
+            title='HR agreement', department=other, start_date=today, expiry_date=today + timedelta(days=400)
+        )
+        self.assertEqual(self.client.get('/api/agreements/agreements/list/').data['agreements'], [])
+
+        DepartmentPermission.objects.create(user=self.user, department=other, permission_type='view')
+        agreements = self.client.get('/api/agreements/agreements/list/').data['agreements']
+        self.assertEqual([a['title'] for a in agreements], ['HR agreement'])
+
+
+class AgreementListPaginationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        department = Department.objects.create(name='IT')
+        self.user = User.objects.create(email='user@example.com', full_name='User', department=department)
+        today = timezone.now().date()
+        for i in range(5):
+            Agreement.objects.create(
+                title=f'Agreement {i}',
+                department=department,
+                creator=self.user,
+                start_date=today,
+                expiry_date=today + timedelta(days=400),
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_cursor_pages_cover_every_agreement(self):
+        titles = []
+        response = self.client.get('/api/agreements/', {'page_size': 2})
+        self.assertIn('departments', response.data)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            titles.extend(row['title'] for row in response.data['agreements'])
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+            self.assertNotIn('departments', response.data)
+        self.assertEqual(titles, [f'Agreement {i}' for i in reversed(range(5))])
+
+    def test_fields_projection(self):
+        response = self.client.get('/api/agreements/', {'fields': 'id,title,department_name'})
+        self.assertEqual(set(response.data['agreements'][0]), {'id', 'title', 'department_name'})
+        self.assertEqual(response.data['agreements'][0]['department_name'], 'IT')
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get('/api/agreements/', {'fields': 'title,body'})
+        self.assertEqual(response.status_code, 400)
+
+
+class AgreementSearchTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        department = Department.objects.create(name='IT')
+        self.user = User.objects.create(email='user@example.com', full_name='User', department=department)
+        self.vendor = Organization.objects.create(name='Acme Networks')
+        today = timezone.now().date()
+        self.agreements = [
+            Agreement.objects.create(
+                title=title,
+                remarks=remarks,
+                party_name=self.vendor if with_vendor else None,
+                department=department,
+                start_date=today,
+                expiry_date=today + timedelta(days=400),
+            )
+            for title, remarks, with_vendor in [
+                ('Network maintenance', 'Yearly contract', True),
+                ('Office cleaning', 'Covers network closets', False),
+                ('Printer lease', '', False),
+            ]
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def search(self, **params):
+        response = self.client.get('/api/agreements/search/', params)
+        self.assertEqual(response.status_code, 200)
+        return [row['title'] for row in response.data['results']]
+
+    def test_ranks_title_matches_first(self):
+        self.assertEqual(self.search(search='network'), ['Network maintenance', 'Office cleaning'])
+
+    def test_every_word_must_match(self):
+        self.assertEqual(self.search(search='network yearly'), ['Network maintenance'])
+
+    def test_agreement_id_prefix(self):
+        agreement_id = self.agreements[2].agreement_id
+        self.assertEqual(self.search(search=agreement_id), ['Printer lease'])
+        self.assertEqual(len(self.search(search=agreement_id[:-2])), 3)
+
+    def test_index_follows_party_name_changes(self):
+        self.vendor.name = 'Globex'
+        self.vendor.save()
+        self.assertEqual(self.search(search='globex'), ['Network maintenance'])
+        self.assertEqual(self.search(search='acme'), [])
+
+    def test_party_rename_reindexes_in_constant_queries(self):
+        def rename_queries(name):
+            self.vendor.name = name
+            with CaptureQueriesContext(connection) as queries:
+                self.vendor.save()
+            return len(queries)
+
+        few = rename_queries('Globex')
+        today = timezone.now().date()
+        for i in range(5):
+            Agreement.objects.create(
+                title=f'Support {i}', party_name=self.vendor, start_date=today, expiry_date=today + timedelta(days=400)
+            )
+        self.assertEqual(rename_queries('Initech'), few)
+        self.assertEqual(len(self.search(search='initech')), 6)
+
+
+class DashboardStatsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_buckets_use_the_local_date(self):
+        # 20:00 UTC on January 1st is already January 2nd in Dhaka
+        now = datetime.fromisoformat('2026-01-01T20:00:00+00:00')
+        Agreement.objects.create(title='Ends on the 1st', start_date=date(2025, 1, 1), expiry_date=date(2026, 1, 1))
+        Agreement.objects.update(status='Ongoing')
+        with override_settings(TIME_ZONE='Asia/Dhaka'), mock.patch('django.utils.timezone.now', return_value=now):
+            stats = get_dashboard_stats()
+        self.assertEqual(stats['active'], 0)
+        self.assertTrue(cache.get('agreements:dashboard_stats:2026-01-02'))
+
+
+class AgreementIdSequenceTests(TestCase):
+
+    def create_agreement(self, **kwargs):
+        today = timezone.now().date()
+        return Agreement.objects.create(
+            title='Agreement', start_date=today, expiry_date=today + timedelta(days=400), **kwargs
+        )
+
+    def test_ids_are_numbered_per_year(self):
+        year = datetime.now().year
+        first = self.create_agreement()
+        second = self.create_agreement()
+        self.assertEqual(first.agreement_id, f'A_{year}_0001')
+        self.assertEqual(second.agreement_id, f'A_{year}_0002')
+        self.assertEqual(AgreementIdSequence.objects.get(year=year).last_number, 2)
+
+    def test_new_year_starts_after_stored_ids(self):
+        self.create_agreement(agreement_id='A_2030_0041')
+        self.create_agreement(agreement_id='A_2030_7f3a')
+        self.assertEqual(Agreement().generate_agreement_id(2030), 'A_2030_0042')
+        self.assertEqual(Agreement().generate_agreement_id(2030), 'A_2030_0043')
+
+    def test_sync_moves_sequences_past_imported_ids(self):
+        self.create_agreement(agreement_id='A_2031_0005')
+        AgreementIdSequence.objects.create(year=2031, last_number=2)
+        self.assertEqual(sync_agreement_id_sequences(), 1)
+        self.assertEqual(Agreement().generate_agreement_id(2031), 'A_2031_0006')
+
+
+class AgreementSaveTests(TestCase):
+
+    def setUp(self):
+        department = Department.objects.create(name='IT')
+        self.user = User.objects.create(email='user@example.com', full_name='User', department=department)
+        self.today = timezone.now().date()
+        mail.outbox = []
+
+    def create_agreement(self, reminder_time):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Agreement.objects.create(
+                title='Agreement', creator=self.user, start_date=self.today - timedelta(days=10),
+                expiry_date=self.today + timedelta(days=400), reminder_time=reminder_time,
+            )
+
+    def agreement_table_queries(self, queries):
+        return [query['sql'] for query in queries if '"agreements_agreement"' in query['sql']]
+
+    def test_update_is_a_single_query(self):
+        agreement = Agreement.objects.get(pk=self.create_agreement(self.today + timedelta(days=200)).pk)
+        agreement.expiry_date += timedelta(days=30)
+        with CaptureQueriesContext(connection) as queries:
+            agreement.save()
+        # Nothing searchable changed, so the search index is not touched
+        self.assertEqual(len(queries), 1)
+        self.assertTrue(queries[0]['sql'].startswith('UPDATE'))
+        self.assertFalse(agreement.has_changed('expiry_date'))
+
+    def test_title_change_reindexes_the_agreement(self):
+        agreement = Agreement.objects.get(pk=self.create_agreement(self.today + timedelta(days=200)).pk)
+        agreement.title = 'Renamed'
+        with CaptureQueriesContext(connection) as queries:
+            agreement.save()
+        self.assertEqual(len(self.agreement_table_queries(queries)), 1)
+        self.assertTrue(AgreementSearchTerm.objects.filter(agreement=agreement, term='renamed').exists())
+        self.assertFalse(agreement.has_changed('title'))
+
+    def test_reminder_due_today_is_queued_not_sent(self):
+        agreement = self.create_agreement(self.today)
+        dispatch = ReminderDispatch.objects.get(agreement=agreement)
+        self.assertEqual((dispatch.reminder_kind, dispatch.status), ('initial', 'Pending'))
+        self.assertEqual(len(mail.outbox), 0)
+
+        self.assertEqual(send_pending_reminders()['sent'], 1)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_unchanged_dates_do_not_queue_reminders(self):
+        agreement = Agreement.objects.get(pk=self.create_agreement(self.today).pk)
+        ReminderDispatch.objects.all().delete()
+        agreement.title = 'Renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            agreement.save()
+        self.assertFalse(ReminderDispatch.objects.exists())
+
+
+class ReminderPlanTests(TestCase):
+
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.agreements = {}
+        # Days until expiry, reminder date long past
+        for days in (31, 30, 29, 28, 15, 14, 7, 6, 1, 0, -28, -29, -30, -31):
+            self.agreements[days] = Agreement.objects.create(
+                title=f'Expires in {days} days', start_date=self.today - timedelta(days=400),
+                expiry_date=self.today + timedelta(days=days), reminder_time=self.today - timedelta(days=300),
+            )
+
+    def test_windows(self):
+        initial = Agreement.objects.create(
+            title='Reminder today', start_date=self.today, expiry_date=self.today + timedelta(days=30),
+            reminder_time=self.today,
+        )
+        # Not reminded whatever its dates
+        Agreement.objects.filter(pk=self.agreements[7].pk).update(status='Pending')
+
+        plan = {pk: (kind, due_date) for pk, kind, due_date in plan_due_reminders(self.today)}
+        expiry = {days: self.today + timedelta(days=days) for days in self.agreements}
+        expected = {
+            self.agreements[30].pk: ('30_days', expiry[30] - timedelta(days=30)),
+            self.agreements[29].pk: ('30_days', expiry[29] - timedelta(days=30)),
+            self.agreements[15].pk: ('15_days', expiry[15] - timedelta(days=15)),
+            self.agreements[14].pk: ('15_days', expiry[14] - timedelta(days=15)),
+            self.agreements[6].pk: ('7_days', expiry[6] - timedelta(days=7)),
+            self.agreements[0].pk: ('expiry_day', self.today),
+            self.agreements[-29].pk: ('after_expiry', expiry[-29] + timedelta(days=29)),
+            self.agreements[-30].pk: ('after_expiry', expiry[-30] + timedelta(days=29)),
+            # The initial reminder comes first even inside an expiry window
+            initial.pk: ('initial', self.today),
+        }
+        self.assertEqual(plan, expected)
+        # Both days of a window share the due date, the second day adds nothing to the ledger
+        self.assertEqual(plan[self.agreements[30].pk][1], self.today)
+        self.assertEqual(plan[self.agreements[29].pk][1], self.today - timedelta(days=1))
+
+    def test_agreement_ids(self):
+        pks = [self.agreements[30].pk, self.agreements[31].pk]
+        self.assertEqual(
+            plan_due_reminders(self.today, agreement_ids=pks),
+            [(self.agreements[30].pk, '30_days', self.today)]
+        )
+
+    def test_shards_split_the_plan(self):
+        plan = plan_due_reminders(self.today)
+        shards = [plan_due_reminders(self.today, shard=shard, shards=3) for shard in range(3)]
+        for shard, shard_plan in enumerate(shards):
+            self.assertTrue(all(pk % 3 == shard for pk, _, _ in shard_plan))
+        self.assertEqual(sorted(sum(shards, [])), plan)
+
+
+class ReminderDispatchTests(TestCase):
+
+    def setUp(self):
+        self.department = Department.objects.create(name='IT')
+        self.user = User.objects.create(email='user@example.com', full_name='User', department=self.department)
+        self.today = timezone.now().date()
+        # Due its initial reminder today, queued by the tests themselves
+        self.agreement = Agreement.objects.create(
+            title='Agreement', creator=self.user, department=self.department,
+            start_date=self.today - timedelta(days=10), expiry_date=self.today + timedelta(days=400),
+            reminder_time=self.today,
+        )
+        mail.outbox = []
+
+    def test_running_twice_sends_once(self):
+        self.assertEqual(queue_due_reminders(self.today), 1)
+        self.assertEqual(queue_due_reminders(self.today), 1)
+        dispatch = ReminderDispatch.objects.get()
+        self.assertEqual((dispatch.reminder_kind, dispatch.due_date), ('initial', self.today))
+
+        self.assertEqual(send_pending_reminders(self.today), {'sent': 1, 'failed': 0})
+        self.assertEqual(dispatch_due_reminders(self.today), {'planned': 1, 'sent': 0, 'failed': 0})
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['user@example.com'])
+        self.assertEqual(ReminderDispatch.objects.get().status, 'Sent')
+
+    def test_rows_of_a_crashed_worker_are_reclaimed_after_the_timeout(self):
+        queue_due_reminders(self.today)
+        self.assertEqual(len(claim_reminder_dispatches('crashed', 10)), 1)
+        # Still within the claim timeout, another worker leaves it alone
+        self.assertEqual(send_pending_reminders(self.today, worker='next'), {'sent': 0, 'failed': 0})
+
+        ReminderDispatch.objects.update(claimed_at=timezone.now() - timedelta(minutes=16))
+        self.assertEqual(send_pending_reminders(self.today, worker='next'), {'sent': 1, 'failed': 0})
+        dispatch = ReminderDispatch.objects.get()
+        self.assertEqual((dispatch.status, dispatch.claimed_by, dispatch.attempts), ('Sent', 'next', 2))
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_failed_rows_are_retried_by_later_runs(self):
+        queue_due_reminders(self.today)
+        with mock.patch(
+            'django.core.mail.backends.locmem.EmailBackend.send_messages',
+            side_effect=OSError('Connection refused'),
+        ):
+            # The run does not retry its own failures
+            self.assertEqual(send_pending_reminders(self.today), {'sent': 0, 'failed': 1})
+        dispatch = ReminderDispatch.objects.get()
+        self.assertEqual((dispatch.status, dispatch.attempts, dispatch.last_error), ('Failed', 1, 'Connection refused'))
+
+        self.assertEqual(send_pending_reminders(self.today), {'sent': 1, 'failed': 0})
+        dispatch.refresh_from_db()
+        self.assertEqual((dispatch.status, dispatch.attempts, dispatch.last_error), ('Sent', 2, ''))
+        self.assertEqual(len(mail.outbox), 1)
+
+    @override_settings(REMINDER_MAX_ATTEMPTS=2)
+    def test_failed_rows_stop_after_max_attempts(self):
+        queue_due_reminders(self.today)
+        ReminderDispatch.objects.update(status='Failed', attempts=2, claimed_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(claim_reminder_dispatches('worker', 10), [])
+        self.assertEqual(send_pending_reminders(self.today), {'sent': 0, 'failed': 0})
+        self.assertEqual(len(mail.outbox), 0)
+
+
+def get_users_to_notify_before_single_query(agreement):
+    """Agreement.get_users_to_notify as it was before recipient_utils, without the logging."""
+    users = set(agreement.assigned_users.all())
+    if agreement.creator:
+        users.add(agreement.creator)
+    if agreement.department:
+        users.update(User.objects.filter(department=agreement.department))
+        users.update(User.objects.filter(department_permissions__department=agreement.department).distinct())
+    users.update(User.objects.filter(department__executive=True).distinct())
+    return list(users)
+
+
+class RecipientResolutionTests(TestCase):
+
+    def setUp(self):
+        it = Department.objects.create(name='IT')
+        hr = Department.objects.create(name='HR')
+        finance = Department.objects.create(name='Finance')
+        board = Department.objects.create(name='Board', executive=True)
+        self.users = {
+            name: User.objects.create(email=f'{name}@example.com', full_name=name.title(), department=department)
+            for name, department in [
+                ('developer', it), ('admin', it), ('recruiter', hr), ('chair', board), ('auditor', finance),
+            ]
+        }
+        DepartmentPermission.objects.create(user=self.users['recruiter'], department=it, permission_type='view')
+        DepartmentPermission.objects.create(user=self.users['chair'], department=it, permission_type='edit')
+        today = timezone.now().date()
+
+        def create(department, creator, assigned=()):
+            agreement = Agreement.objects.create(
+                title='Agreement', department=department, creator=creator,
+                start_date=today, expiry_date=today + timedelta(days=400),
+            )
+            agreement.assigned_users.set(assigned)
+            return agreement
+
+        self.agreements = [
+            create(it, self.users['developer'], [self.users['auditor'], self.users['admin']]),
+            create(hr, self.users['auditor']),
+            create(None, None, [self.users['developer']]),
+            create(None, None),
+        ]
+
+    def expected(self, agreement):
+        return sorted(
+            ({'id': user.pk, 'email': user.email, 'full_name': user.full_name}
+             for user in get_users_to_notify_before_single_query(agreement)),
+            key=lambda user: user['id']
+        )
+
+    def test_same_recipients_as_before(self):
+        for agreement in self.agreements:
+            self.assertEqual(resolve_recipients(agreement), self.expected(agreement))
+        self.assertEqual(
+            resolve_recipients_bulk(self.agreements),
+            {agreement.pk: self.expected(agreement) for agreement in self.agreements}
+        )
+        self.assertEqual(
+            [user['full_name'] for user in resolve_recipients(self.agreements[0])],
+            ['Developer', 'Admin', 'Recruiter', 'Chair', 'Auditor']
+        )
+
+
+class ReminderEmailTests(TestCase):
+
+    def setUp(self):
+        today = timezone.now().date()
+        self.agreement = Agreement.objects.create(
+            title='Lease & <Service>', start_date=today, expiry_date=today + timedelta(days=30),
+            department=Department.objects.create(name='IT'),
+        )
+
+    def test_renderer_matches_rendering_per_recipient(self):
+        context = get_reminder_context(self.agreement, 'before', time_remaining='1 month')
+        renderer = AgreementEmailRenderer('emails/agreement_reminder.txt', 'emails/agreement_reminder.html', context)
+        for name in ('Rahim Uddin', 'O\'Brien & <Sons>'):
+            text, html = renderer.render(name)
+            context['recipient_name'] = name
+            self.assertEqual(text, render_to_string('emails/agreement_reminder.txt', context))
+            self.assertEqual(html, render_to_string('emails/agreement_reminder.html', context))
+            self.assertNotIn(RECIPIENT_NAME_PLACEHOLDER, text + html)
+        self.assertIn('Dear O&#x27;Brien &amp; &lt;Sons&gt;,', html)
+        self.assertIn('O&#x27;Brien &amp; &lt;Sons&gt;', text)
+        self.assertNotIn('<Sons>', text + html)
+
+    def test_bulk_messages_share_a_connection_per_batch(self):
+        messages = [EmailMessage('Reminder', 'Body', to=[f'user{number}@example.com']) for number in range(5)]
+        with mock.patch('agreements.utils.email_utils.get_connection', wraps=get_connection) as connect:
+            stats = send_bulk_messages(messages, batch_size=2)
+        self.assertEqual(connect.call_count, 3)
+        self.assertEqual((stats['sent'], stats['failed']), (5, 0))
+        self.assertEqual([message.to for message in mail.outbox], [message.to for message in messages])
+
+    def test_bulk_messages_fail_the_batch_that_cannot_connect(self):
+        messages = [EmailMessage('Reminder', 'Body', to=[f'user{number}@example.com']) for number in range(4)]
+        connections = [get_connection(), mock.Mock(open=mock.Mock(side_effect=OSError('Connection refused')))]
+        with mock.patch('agreements.utils.email_utils.get_connection', side_effect=connections):
+            stats = send_bulk_messages(messages, batch_size=2)
+        self.assertEqual((stats['sent'], stats['failed']), (2, 2))
+        self.assertEqual(stats['failures'], {
+            'user2@example.com': 'Connection refused', 'user3@example.com': 'Connection refused',
+        })
+        self.assertEqual(len(mail.outbox), 2)
+
+
+class NotificationOutboxTests(TestCase):
+
+    def setUp(self):
+        today = timezone.now().date()
+        self.agreement = Agreement.objects.create(
+            title='Agreement', start_date=today, expiry_date=today + timedelta(days=400)
+        )
+        self.entry = queue_agreement_notification(self.agreement, 'created')
+
+    def send(self, **kwargs):
+        return mock.patch('agreements.utils.outbox_utils.send_agreement_action_notification', **kwargs)
+
+    def make_due(self):
+        NotificationOutbox.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+
+    @override_settings(NOTIFICATION_RETRY_BACKOFF=60, NOTIFICATION_RETRY_MAX_DELAY=300)
+    def test_retry_delay_doubles_up_to_the_max(self):
+        self.assertEqual(
+            [get_retry_delay(attempts).total_seconds() for attempts in range(1, 6)],
+            [60, 120, 240, 300, 300]
+        )
+
+    def test_failed_entry_is_retried_after_the_backoff(self):
+        with self.send(side_effect=OSError('Connection refused')):
+            self.assertEqual(drain_notification_outbox(), {'sent': 0, 'failed': 1})
+        entry = NotificationOutbox.objects.get()
+        self.assertEqual((entry.status, entry.attempts, entry.last_error), ('Failed', 1, 'Connection refused'))
+        self.assertAlmostEqual(
+            (entry.next_attempt_at - entry.updated_at).total_seconds(), get_retry_delay(1).total_seconds(), delta=1
+        )
+
+        # Not due before the delay is over
+        with self.send(return_value=True) as send:
+            self.assertEqual(drain_notification_outbox(), {'sent': 0, 'failed': 0})
+            self.make_due()
+            self.assertEqual(drain_notification_outbox(), {'sent': 1, 'failed': 0})
+        self.assertEqual(send.call_count, 1)
+        entry.refresh_from_db()
+        self.assertEqual((entry.status, entry.attempts, entry.last_error), ('Sent', 2, ''))
+
+    @override_settings(NOTIFICATION_MAX_ATTEMPTS=2)
+    def test_gives_up_after_max_attempts(self):
+        with self.send(side_effect=OSError('Connection refused')) as send:
+            self.assertEqual(drain_notification_outbox(), {'sent': 0, 'failed': 1})
+            self.make_due()
+            self.assertEqual(drain_notification_outbox(), {'sent': 0, 'failed': 1})
+            self.make_due()
+            self.assertEqual(drain_notification_outbox(), {'sent': 0, 'failed': 0})
+        self.assertEqual(send.call_count, 2)
+        entry = NotificationOutbox.objects.get()
+        self.assertEqual((entry.status, entry.attempts), ('Failed', 2))
+
+    def test_claimed_entries_are_left_to_their_worker(self):
+        second = queue_agreement_notification(self.agreement, 'updated')
+        self.assertEqual([e.pk for e in claim_outbox_entries('first', 1)], [self.entry.pk])
+        self.assertEqual([e.pk for e in claim_outbox_entries('second', 10)], [second.pk])
+        self.assertEqual(claim_outbox_entries('third', 10), [])
+
+        # A worker that crashed loses its entries after the claim timeout
+        NotificationOutbox.objects.filter(pk=self.entry.pk).update(locked_at=timezone.now() - timedelta(minutes=11))
+        claimed = claim_outbox_entries('third', 10)
+        self.assertEqual([(e.pk, e.locked_by, e.attempts) for e in claimed], [(self.entry.pk, 'third', 2)])
+
+    @override_settings(NOTIFICATION_MAX_ATTEMPTS=2)
+    def test_stale_claims_stop_at_max_attempts(self):
+        NotificationOutbox.objects.update(
+            status='Processing', attempts=2, locked_at=timezone.now() - timedelta(minutes=11)
+        )
+        self.assertEqual(claim_outbox_entries('worker', 10), [])
+
+    def test_agreement_without_recipients_is_not_retried(self):
+        self.assertEqual(drain_notification_outbox(), {'sent': 1, 'failed': 0})
+        entry = NotificationOutbox.objects.get()
+        self.assertEqual((entry.status, entry.attempts, entry.last_error), ('Sent', 1, 'No recipients'))
+        self.assertEqual(len(mail.outbox), 0)
+
+    @skipUnlessDBFeature('has_select_for_update_skip_locked')
+    def test_claim_skips_rows_locked_by_other_workers(self):
+        with CaptureQueriesContext(connection) as queries:
+            claim_outbox_entries('worker', 10)
+        self.assertTrue(any('SKIP LOCKED' in query['sql'] for query in queries))
+
+
+class ChunkedUploadTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.media_root,
+            CHUNKED_UPLOAD_DIR=os.path.join(self.media_root, 'chunked_uploads'),
+            CHUNKED_UPLOAD_CHUNK_SIZE=4,
+        )
+        self.settings_override.enable()
+        self.department = Department.objects.create(name='IT')
+        self.user = User.objects.create(email='user@example.com', full_name='User', department=self.department)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.content = b'scanned contract'
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def send_chunk(self, upload_id, start, data):
+        return self.client.put(
+            f'/api/agreements/uploads/{upload_id}/', data,
+            content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {start}-{start + len(data) - 1}/{len(self.content)}',
+        )
+
+    def upload(self):
+        response = self.client.post('/api/agreements/uploads/', {
+            'filename': 'contract.pdf',
+            'size': len(self.content),
+            'sha256': hashlib.sha256(self.content).hexdigest(),
+        })
+        self.assertEqual(response.status_code, 201)
+        upload_id = response.data['upload_id']
+        for start in range(0, len(self.content), 4):
+            response = self.send_chunk(upload_id, start, self.content[start:start + 4])
+            self.assertEqual(response.status_code, 200, response.data)
+        return upload_id, response.data
+
+    def test_chunks_must_resume_from_offset(self):
+        upload_id = self.client.post('/api/agreements/uploads/', {
+            'filename': 'contract.pdf', 'size': len(self.content)
+        }).data['upload_id']
+        self.assertEqual(self.send_chunk(upload_id, 0, self.content[:4]).status_code, 200)
+        response = self.send_chunk(upload_id, 8, self.content[8:12])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['offset'], 4)
+        self.assertEqual(self.client.get(f'/api/agreements/uploads/{upload_id}/').data['offset'], 4)
+
+    def test_completed_upload_is_attached_on_submit(self):
+        upload_id, state = self.upload()
+        self.assertEqual(state['status'], 'Complete')
+        self.assertEqual(state['sha256'], hashlib.sha256(self.content).hexdigest())
+
+        today = timezone.now().date()
+        response = self.client.post('/api/agreements/submit/', {
+            'title': 'Scanned contract',
+            'agreement_type': AgreementType.objects.create(name='Service').pk,
+            'department': self.department.pk,
+            'party_name': Organization.objects.create(name='Acme').pk,
+            'start_date': today,
+            'expiry_date': today + timedelta(days=400),
+            'reminder_time': today + timedelta(days=200),
+            'upload_id': upload_id,
+        })
+        self.assertEqual(response.status_code, 200, response.data)
+        agreement = Agreement.objects.get(pk=response.data['agreement_id'])
+        self.assertEqual(agreement.original_filename, 'contract.pdf')
+        with agreement.attachment.open('rb') as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertFalse(ChunkedUpload.objects.exists())
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'chunked_uploads')), [])
+
+    def test_invalid_submit_closes_the_upload(self):
+        upload_id, _ = self.upload()
+        opened = []
+
+        def get_opened_upload(user, upload_id):
+            upload_file = get_completed_upload(user, upload_id)
+            upload_file.open()
+            opened.append(upload_file)
+            return upload_file
+
+        with mock.patch('agreements.views.get_completed_upload', side_effect=get_opened_upload):
+            response = self.client.post('/api/agreements/submit/', {'upload_id': upload_id})
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(opened[0].closed)
+        # Kept for another submit
+        self.assertTrue(ChunkedUpload.objects.filter(pk=upload_id).exists())
+        self.assertTrue(get_completed_upload(self.user, upload_id).closed)
+
+    def test_agreement_id_is_reserved_outside_the_submit_transaction(self):
+        upload_id, _ = self.upload()
+        today = timezone.now().date()
+        with mock.patch(
+            'agreements.views.AgreementNotificationService.queue_creation_notification',
+            side_effect=RuntimeError('outbox unavailable'),
+        ):
+            response = self.client.post('/api/agreements/submit/', {
+                'title': 'Scanned contract',
+                'agreement_type': AgreementType.objects.create(name='Service').pk,
+                'department': self.department.pk,
+                'party_name': Organization.objects.create(name='Acme').pk,
+                'start_date': today,
+                'expiry_date': today + timedelta(days=400),
+                'reminder_time': today + timedelta(days=200),
+                'upload_id': upload_id,
+            })
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(Agreement.objects.exists())
+        # The number was taken before the rolled back transaction and is skipped
+        self.assertEqual(AgreementIdSequence.objects.get(year=datetime.now().year).last_number, 1)
+
+
+class AttachmentDownloadTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, DOWNLOAD_X_ACCEL_REDIRECT_PREFIX='')
+        self.settings_override.enable()
+        self.department = Department.objects.create(name='IT')
+        self.user = User.objects.create(email='user@example.com', full_name='User', department=self.department)
+        self.content = b'0123456789abcdef'
+        today = timezone.now().date()
+        self.agreement = Agreement.objects.create(
+            title='Lease',
+            agreement_type=AgreementType.objects.create(name='Service'),
+            department=self.department,
+            creator=self.user,
+            start_date=today,
+            expiry_date=today + timedelta(days=400),
+            reminder_time=today + timedelta(days=200),
+            attachment=SimpleUploadedFile('lease.pdf', self.content),
+        )
+        self.url = f'/api/agreements/{self.agreement.pk}/attachment/'
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_download_with_etag_and_range(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        etag = response['ETag']
+        self.assertEqual(etag, f'"{hashlib.sha256(self.content).hexdigest()}"')
+        self.assertIn('lease.pdf', response['Content-Disposition'])
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=4-7')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 4-7/{len(self.content)}')
+        self.assertEqual(b''.join(response.streaming_content), b'4567')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(response.streaming_content), b'def')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+
+        # A stale If-Range sends the whole file again
+        response = self.client.get(self.url, HTTP_RANGE='bytes=4-7', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_download_requires_view_access(self):
+        other = User.objects.create(
+            email='other@example.com', full_name='Other', department=Department.objects.create(name='HR')
+        )
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_signed_download_url(self):
+        download_url = self.client.get(f'/api/agreements/{self.agreement.pk}/').data['download_url']
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+        self.assertEqual(self.client.get(download_url).status_code, 200)
+        # The token is bound to the path it was issued for
+        token = download_url.split('?', 1)[1]
+        other_url = f'/api/agreements/{self.agreement.pk + 1}/attachment/?{token}'
+        self.assertEqual(self.client.get(other_url).status_code, 401)
+
+    def export(self, **params):
+        response = self.client.get('/api/accounts/export/documents/', params)
+        self.assertEqual(response.status_code, 200)
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        manifest = list(csv.DictReader(io.StringIO(archive.read('manifest.csv').decode())))
+        return archive, manifest
+
+    def test_export_streams_zip_with_manifest(self):
+        archive, manifest = self.export(department=self.department.pk, include='agreements')
+        self.assertEqual(len(manifest), 1)
+        self.assertEqual(manifest[0]['reference'], self.agreement.agreement_id)
+        self.assertEqual(manifest[0]['sha256'], hashlib.sha256(self.content).hexdigest())
+        self.assertEqual(archive.read(manifest[0]['path']), self.content)
+        self.assertTrue(manifest[0]['path'].endswith('/lease.pdf'))
+
+        # Outside the date range, or not viewable by the user
+        _, manifest = self.export(date_from=(self.agreement.start_date + timedelta(days=1)).isoformat())
+        self.assertEqual(manifest, [])
+        self.client.force_authenticate(User.objects.create(
+            email='other@example.com', full_name='Other', department=Department.objects.create(name='HR')
+        ))
+        _, manifest = self.export()
+        self.assertEqual(manifest, [])
+        self.assertEqual(self.client.get('/api/accounts/export/documents/', {'date_from': 'soon'}).status_code, 400)
+
+    @override_settings(DOWNLOAD_X_ACCEL_REDIRECT_PREFIX='/protected-media/')
+    def test_x_accel_redirect(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.agreement.attachment.name}')
+        self.assertEqual(response.content, b'')
@@ -20,6 +20,8 @@ urlpatterns = [
     # Match frontend expectations - explicit paths BEFORE router patterns
     path('form-data/', AgreementFormDataAPIView.as_view(), name='api-agreement-form-data'),
     path('submit/', SubmitAgreementAPIView.as_view(), name='api-submit-agreement'),
+    path('uploads/', views.ChunkedUploadAPIView.as_view(), name='api-chunked-upload'),
+    path('uploads/<uuid:upload_id>/', views.ChunkedUploadDetailAPIView.as_view(), name='api-chunked-upload-detail'),
     path('edit/<int:agreement_id>/', EditAgreementAPIView.as_view(), name='api-edit-agreement'),
     path('users/available/', available_users, name='available_users'),
     path('dashboard-stats/', DashboardStatsAPIView.as_view(), name='dashboard-stats'),
@@ -32,6 +34,7 @@ urlpatterns = [
     # Main list and detail endpoints
     path('', AgreementListAPIView.as_view(), name='api-agreement-list'),
     path('<int:pk>/', AgreementDetailAPIView.as_view(), name='api-agreement-detail'),
+    path('<int:pk>/attachment/', views.AgreementAttachmentDownloadAPIView.as_view(), name='api-agreement-attachment'),
     
     # Router patterns last (lowest priority)
     path('', include(router.urls)),
@@ -1,14 +1,165 @@
 import logging
-from django.core.mail import send_mail
+import time
+from django.core.mail import send_mail, get_connection
 from django.template.loader import render_to_string
 from django.conf import settings
 from django.utils import timezone
 from django.core.mail import EmailMultiAlternatives
 from django.utils.html import strip_tags
 
+from .render_utils import AgreementEmailRenderer
+
 
 logger = logging.getLogger(__name__)
 
+def get_reminder_context(agreement, reminder_type, months_since_expiration=None, time_remaining=None):
+    """
+    Build the reminder template context shared by every recipient of an agreement.
+    """
+    return {
+        'agreement_name': agreement.title,
+        'partner_name': agreement.party_name.name if agreement.party_name else '',
+        'expiration_date': agreement.expiry_date,
+        'agreement_id': agreement.agreement_id,
+        'company_name': getattr(settings, 'COMPANY_NAME', 'Your Company Name'),
+        'support_contact': getattr(settings, 'SUPPORT_CONTACT', 'Support Email/Phone'),
+        'reminder_type': reminder_type,
+        'months_since_expiration': months_since_expiration,
+        'time_remaining': time_remaining,
+        'department': agreement.department.name if agreement.department else 'N/A',
+        'agreement_type': agreement.agreement_type.name if agreement.agreement_type else 'N/A',
+        'application_link': f"{settings.FRONTEND_URL}/agreements/{agreement.id}",
+    }
+
+
+def get_reminder_subject(agreement, reminder_type):
+    if reminder_type == 'before':
+        return f"Reminder: Agreement '{agreement.title}' expires on {agreement.expiry_date}"
+    elif reminder_type == 'on':
+        return f"Agreement '{agreement.title}' has expired today ({agreement.expiry_date})"
+    elif reminder_type == 'after':
+        return f"Follow-up: Agreement '{agreement.title}' expired on {agreement.expiry_date}"
+    return f"Agreement Notification: {agreement.title}"
+
+
+def send_bulk_messages(messages, batch_size=None):
+    """
+    Send prepared email messages reusing one SMTP connection per batch instead
+    of opening a new connection for every message.
+
+    Messages are sent one by one over the open connection so a failure can be
+    attributed to its recipients without resending the rest of the batch.
+    Returns a dict with the sent/failed counts, a mapping of failed recipient
+    emails to their error, the list of (message, error) pairs that failed,
+    the elapsed seconds and the messages per second.
+    """
+    batch_size = batch_size or getattr(settings, 'EMAIL_BATCH_SIZE', 50)
+    stats = {
+        'sent': 0, 'failed': 0, 'failures': {}, 'failed_messages': [],
+        'elapsed': 0.0, 'rate': 0.0,
+    }
+
+    def record_failure(message, error):
+        stats['failed'] += 1
+        stats['failed_messages'].append((message, str(error)))
+        for email in message.to:
+            stats['failures'][email] = str(error)
+
+    started = time.monotonic()
+
+    for start in range(0, len(messages), batch_size):
+        batch = messages[start:start + batch_size]
+        connection = None
+        try:
+            connection = get_connection(fail_silently=False)
+            connection.open()
+            for message in batch:
+                try:
+                    if connection.send_messages([message]):
+                        stats['sent'] += 1
+                    else:
+                        record_failure(message, "Message was not accepted for delivery")
+                except Exception as e:
+                    record_failure(message, e)
+        except Exception as e:
+            # Could not connect at all, so nothing in this batch was sent
+            logger.error(f"Failed to open SMTP connection: {str(e)}")
+            for message in batch:
+                record_failure(message, e)
+        finally:
+            if connection is not None:
+                try:
+                    connection.close()
+                except Exception:
+                    pass
+
+    stats['elapsed'] = time.monotonic() - started
+    if stats['elapsed'] > 0:
+        stats['rate'] = stats['sent'] / stats['elapsed']
+    logger.info(
+        f"Sent {stats['sent']} email(s), {stats['failed']} failed in "
+        f"{stats['elapsed']:.2f}s ({stats['rate']:.1f} msg/s)"
+    )
+    return stats
+
+
+def build_reminder_messages(agreement, recipients, reminder_type, months_since_expiration=None, time_remaining=None):
+    """
+    Build one personalised reminder message per (email, name) pair in recipients.
+    Returns the list of messages and a dict mapping the email of every
+    recipient whose message could not be built to its error message.
+    """
+    base_context = get_reminder_context(
+        agreement, reminder_type,
+        months_since_expiration=months_since_expiration,
+        time_remaining=time_remaining
+    )
+    subject = get_reminder_subject(agreement, reminder_type)
+
+    # Render the agreement-specific part once; only the recipient name differs
+    renderer = AgreementEmailRenderer(
+        'emails/agreement_reminder.txt', 'emails/agreement_reminder.html', base_context
+    )
+
+    failures = {}
+    messages = []
+    for email, name in recipients:
+        try:
+            text_body, html_body = renderer.render(name or 'User')
+            message = EmailMultiAlternatives(
+                subject=subject,
+                body=text_body,
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                to=[email],
+            )
+            message.attach_alternative(html_body, "text/html")
+            messages.append(message)
+        except Exception as e:
+            logger.error(f"Failed to build reminder for {email}: {str(e)}")
+            failures[email] = str(e)
+
+    return messages, failures
+
+
+def send_reminder_to_recipients(agreement, recipients, reminder_type, months_since_expiration=None, time_remaining=None):
+    """
+    Send a personalised reminder email to each (email, name) pair in recipients.
+    Returns a dict mapping the email of every failed recipient to its error message.
+    """
+    messages, failures = build_reminder_messages(
+        agreement, recipients, reminder_type,
+        months_since_expiration=months_since_expiration,
+        time_remaining=time_remaining
+    )
+    stats = send_bulk_messages(messages)
+    failures.update(stats['failures'])
+    logger.info(
+        f"Sent {reminder_type} reminder for agreement {agreement.id} to "
+        f"{stats['sent']} recipient(s), {len(failures)} failed"
+    )
+    return failures
+
+
 def send_agreement_reminder(agreement, reminder_type, months_since_expiration=None, time_remaining=None):
     """
     Send event-based reminder email for an agreement to all associated users.
@@ -16,70 +167,109 @@ def send_agreement_reminder(agreement, reminder_type, months_since_expiration=No
     """
     try:
         # Get all users associated with the agreement
-        recipients = agreement.get_users_to_notify()
+        recipients = agreement.get_notification_recipients()
         if not recipients:
             logger.warning(f"No recipients found for agreement {agreement.id}")
             return False
 
         # Get all valid email addresses
-        recipient_emails = [user.email for user in recipients if user.email]
-        if not recipient_emails:
+        recipients = [
+            (user['email'], user['full_name'] or 'User')
+            for user in recipients if user['email']
+        ]
+        if not recipients:
             logger.warning(f"No valid email addresses found for agreement {agreement.id}")
             return False
 
-        # Base context without recipient-specific info
-        base_context = {
-            'agreement_name': agreement.title,
-            'partner_name': agreement.party_name.name if agreement.party_name else '',
-            'expiration_date': agreement.expiry_date,
-            'agreement_id': agreement.agreement_id,
-            'company_name': getattr(settings, 'COMPANY_NAME', 'Your Company Name'),
-            'support_contact': getattr(settings, 'SUPPORT_CONTACT', 'Support Email/Phone'),
-            'reminder_type': reminder_type,
-            'months_since_expiration': months_since_expiration,
-            'time_remaining': time_remaining,
-            'department': agreement.department.name if agreement.department else 'N/A',
-            'agreement_type': agreement.agreement_type.name if agreement.agreement_type else 'N/A',
-            'application_link': f"{settings.FRONTEND_URL}/agreements/{agreement.id}",
-        }
-
-        if reminder_type == 'before':
-            subject = f"Reminder: Agreement '{agreement.title}' expires on {agreement.expiry_date}"
-        elif reminder_type == 'on':
-            subject = f"Agreement '{agreement.title}' has expired today ({agreement.expiry_date})"
-        elif reminder_type == 'after':
-            subject = f"Follow-up: Agreement '{agreement.title}' expired on {agreement.expiry_date}"
-        else:
-            subject = f"Agreement Notification: {agreement.title}"
-
-        # Send personalized email to each recipient
-        for user in recipients:
-            try:
-                # Add recipient-specific context
-                context = base_context.copy()
-                context['recipient_name'] = getattr(user, 'full_name', getattr(user, 'username', 'User'))
-                
-                message = render_to_string('emails/agreement_reminder.txt', context)
-                html_message = render_to_string('emails/agreement_reminder.html', context)
-
-                send_mail(
-                    subject,
-                    message,
-                    settings.DEFAULT_FROM_EMAIL,
-                    [user.email],
-                    fail_silently=False,
-                    html_message=html_message
-                )
-                logger.info(f"Sent {reminder_type} reminder for agreement {agreement.id} to {user.email}")
-            except Exception as e:
-                logger.error(f"Failed to send reminder to {user.email}: {str(e)}")
-                continue
-
+        send_reminder_to_recipients(
+            agreement, recipients, reminder_type,
+            months_since_expiration=months_since_expiration,
+            time_remaining=time_remaining
+        )
         return True
     except Exception as e:
         logger.error(f"Failed to send {reminder_type} reminder for agreement {agreement.id}: {str(e)}")
         return False
 
+def send_agreement_action_notification(agreement, action, user):
+    """
+    Email the created/updated notification of an agreement to its recipients.
+    Returns False when there is nobody to notify, sending errors are raised
+    so the notification outbox can retry them.
+    """
+    logger.info(f"Attempting to send {action} notification for agreement {agreement.id}")
+
+    # Get recipient emails and log the count
+    recipients = agreement.get_notification_recipients()
+    if not recipients:
+        logger.warning(f"No recipients found for agreement {agreement.id}")
+        return False
+
+    recipient_emails = [recipient['email'] for recipient in recipients if recipient['email']]
+    if not recipient_emails:
+        logger.warning(f"No valid email addresses found for agreement {agreement.id}")
+        return False
+
+    logger.info(f"Found {len(recipient_emails)} recipient(s) for notification")
+    logger.info(f"Sending email notification to {recipient_emails}")
+
+    subject = f"Agreement {action}: {agreement.title}"
+
+    # Plain text fallback
+    plain_message = f"""
+    Dear Papertrails User,
+
+    A new agreement titled {agreement.title} has been {action} in the system by {agreement.creator}.
+
+    Key Details:
+
+    Title: {agreement.title}
+    Reference: {agreement.agreement_reference or 'N/A'}
+    Department: {agreement.department.name if agreement.department else 'N/A'}
+    Vendor: {agreement.party_name.name if agreement.party_name else 'N/A'}
+    Agreement Type: {agreement.agreement_type.name if agreement.agreement_type else 'N/A'}
+    Start Date: {agreement.start_date}
+    Expiry Date: {agreement.expiry_date}
+
+    To review the agreement, please click the link below:
+    {settings.FRONTEND_URL}/agreements/{agreement.id}
+
+    This is an automated notification from Papertrails Agreement Management System.
+    """
+
+    try:
+        context = {
+            'agreement': agreement,
+            'action': action,
+            'user': user,
+            'settings': settings
+        }
+        html_message = render_to_string(f'emails/agreement_{action}.html', context)
+
+        # Send the email with HTML alternative
+        email = EmailMultiAlternatives(
+            subject=subject,
+            body=plain_message,
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=recipient_emails
+        )
+        email.attach_alternative(html_message, "text/html")
+        email.send(fail_silently=False)
+        logger.info("Email sent successfully")
+    except Exception as template_error:
+        logger.error(f"Email template not found: {str(template_error)}")
+        # Fallback to plain text email, errors here reach the caller
+        send_mail(
+            subject=subject,
+            message=plain_message,
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            recipient_list=recipient_emails,
+            fail_silently=False
+        )
+        logger.info("Plain text email sent successfully (fallback)")
+    return True
+
+
 def send_agreement_notification(agreement, action, recipients):
     """
     Send notification about agreement creation/update
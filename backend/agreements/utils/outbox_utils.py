@@ -0,0 +1,143 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .email_utils import send_agreement_action_notification
+from .reminder_utils import get_default_worker_name
+
+logger = logging.getLogger(__name__)
+
+
+def queue_agreement_notification(agreement, action, user=None):
+    """
+    Record an agreement notification in the outbox. Call this inside the
+    transaction that saves the agreement so both commit (or roll back) together.
+    """
+    from agreements.models import NotificationOutbox
+
+    entry = NotificationOutbox.objects.create(
+        agreement=agreement,
+        action=action,
+        triggered_by=user if user is not None and user.is_authenticated else None,
+    )
+    logger.info(f"Queued {action} notification for agreement {agreement.id}")
+    return entry
+
+
+def get_retry_delay(attempts):
+    """
+    Exponential backoff between attempts, capped at NOTIFICATION_RETRY_MAX_DELAY seconds.
+    """
+    base = getattr(settings, 'NOTIFICATION_RETRY_BACKOFF', 60)
+    max_delay = getattr(settings, 'NOTIFICATION_RETRY_MAX_DELAY', 60 * 60)
+    return timedelta(seconds=min(base * 2 ** max(attempts - 1, 0), max_delay))
+
+
+def claim_outbox_entries(worker, limit):
+    """
+    Claim up to limit outbox entries that are due, skipping rows locked by
+    other workers. Failed entries are retried until they reach
+    NOTIFICATION_MAX_ATTEMPTS. Entries stuck in Processing for longer than
+    NOTIFICATION_CLAIM_TIMEOUT (a crashed worker) are claimed again, under
+    the same attempt limit.
+    """
+    from agreements.models import NotificationOutbox
+
+    now = timezone.now()
+    claim_timeout = timedelta(seconds=getattr(settings, 'NOTIFICATION_CLAIM_TIMEOUT', 10 * 60))
+    max_attempts = getattr(settings, 'NOTIFICATION_MAX_ATTEMPTS', 5)
+
+    claimable = NotificationOutbox.objects.filter(
+        Q(status='Pending', next_attempt_at__lte=now) |
+        Q(status='Failed', next_attempt_at__lte=now, attempts__lt=max_attempts) |
+        Q(status='Processing', locked_at__lt=now - claim_timeout, attempts__lt=max_attempts)
+    )
+
+    with transaction.atomic():
+        ids = list(
+            claimable.select_for_update(skip_locked=True)
+            .order_by('next_attempt_at', 'pk')
+            .values_list('pk', flat=True)[:limit]
+        )
+        NotificationOutbox.objects.filter(pk__in=ids).update(
+            status='Processing',
+            locked_by=worker,
+            locked_at=now,
+            attempts=F('attempts') + 1,
+            updated_at=now,
+        )
+
+    return list(
+        NotificationOutbox.objects.filter(pk__in=ids, locked_by=worker)
+        .select_related(
+            'agreement__department', 'agreement__agreement_type',
+            'agreement__party_name', 'agreement__creator', 'triggered_by'
+        )
+        .order_by('pk')
+    )
+
+
+def process_outbox_entry(entry):
+    """
+    Send a single outbox entry and record the result. Failed entries are
+    rescheduled with exponential backoff until NOTIFICATION_MAX_ATTEMPTS.
+    Agreements without recipients are done, retrying would not find any.
+    Returns True unless sending failed.
+    """
+    from agreements.models import NotificationOutbox
+
+    try:
+        sent = send_agreement_action_notification(entry.agreement, entry.action, entry.triggered_by)
+    except Exception as e:
+        error = str(e)
+    else:
+        NotificationOutbox.objects.filter(pk=entry.pk).update(
+            status='Sent', sent_at=timezone.now(), last_error='' if sent else 'No recipients',
+            updated_at=timezone.now()
+        )
+        return True
+
+    # update() skips auto_now, incremental backups select rows by updated_at
+    updates = {'status': 'Failed', 'last_error': error, 'updated_at': timezone.now()}
+    max_attempts = getattr(settings, 'NOTIFICATION_MAX_ATTEMPTS', 5)
+    if entry.attempts >= max_attempts:
+        logger.error(
+            f"Giving up on {entry.action} notification for agreement {entry.agreement_id} "
+            f"after {entry.attempts} attempts: {error}"
+        )
+    else:
+        updates['next_attempt_at'] = timezone.now() + get_retry_delay(entry.attempts)
+        logger.warning(
+            f"{entry.action} notification for agreement {entry.agreement_id} failed "
+            f"(attempt {entry.attempts}), retrying at {updates['next_attempt_at']}: {error}"
+        )
+    NotificationOutbox.objects.filter(pk=entry.pk).update(**updates)
+    return False
+
+
+def drain_notification_outbox(worker=None, batch_size=None):
+    """
+    Claim and send due outbox entries in batches until none are left.
+    Returns a dict with the number of sent and failed notifications.
+    """
+    worker = worker or get_default_worker_name()
+    batch_size = batch_size or getattr(settings, 'NOTIFICATION_OUTBOX_BATCH_SIZE', 50)
+    stats = {'sent': 0, 'failed': 0}
+
+    while True:
+        entries = claim_outbox_entries(worker, batch_size)
+        if not entries:
+            break
+        for entry in entries:
+            if process_outbox_entry(entry):
+                stats['sent'] += 1
+            else:
+                stats['failed'] += 1
+
+    if stats['sent'] or stats['failed']:
+        logger.info(f"Notification outbox drained by {worker}: {stats['sent']} sent, {stats['failed']} failed")
+    return stats
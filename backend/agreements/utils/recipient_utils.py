@@ -0,0 +1,108 @@
+import logging
+
+from django.contrib.auth import get_user_model
+from django.db.models import Q
+
+logger = logging.getLogger(__name__)
+
+RECIPIENT_FIELDS = ('id', 'email', 'full_name')
+
+
+def get_recipient_filter(agreement):
+    """
+    Q object matching every user who should be notified about an agreement:
+    assigned users, the creator, users of the agreement's department, users
+    with a DepartmentPermission on that department and all executive users.
+    """
+    from accounts.models import DepartmentPermission
+    from agreements.models import Agreement
+
+    recipient_filter = Q(department__executive=True) | Q(
+        pk__in=Agreement.assigned_users.through.objects.filter(
+            agreement_id=agreement.pk
+        ).values('user_id')
+    )
+    if agreement.creator_id:
+        recipient_filter |= Q(pk=agreement.creator_id)
+    if agreement.department_id:
+        recipient_filter |= Q(department_id=agreement.department_id) | Q(
+            pk__in=DepartmentPermission.objects.filter(
+                department_id=agreement.department_id
+            ).values('user_id')
+        )
+    return recipient_filter
+
+
+def resolve_recipients(agreement):
+    """
+    Return the deduplicated recipients of an agreement as a list of
+    {'id', 'email', 'full_name'} dicts, using a single query.
+    """
+    User = get_user_model()
+    return list(
+        User.objects.filter(get_recipient_filter(agreement))
+        .order_by('id')
+        .values(*RECIPIENT_FIELDS)
+    )
+
+
+def resolve_recipients_bulk(agreements):
+    """
+    Resolve recipients for many agreements at once. Returns a dict mapping
+    each agreement pk to its list of {'id', 'email', 'full_name'} dicts.
+
+    Uses a fixed number of queries however many agreements are passed, which
+    is what the nightly reminder job needs.
+    """
+    from accounts.models import DepartmentPermission
+    from agreements.models import Agreement
+
+    User = get_user_model()
+    agreements = list(agreements)
+    if not agreements:
+        return {}
+
+    agreement_ids = [agreement.pk for agreement in agreements]
+    department_ids = {agreement.department_id for agreement in agreements if agreement.department_id}
+    creator_ids = {agreement.creator_id for agreement in agreements if agreement.creator_id}
+
+    users = {}
+
+    def add_user(user_id, email, full_name):
+        users.setdefault(user_id, {'id': user_id, 'email': email, 'full_name': full_name})
+        return user_id
+
+    executive_ids = [
+        add_user(*row) for row in
+        User.objects.filter(department__executive=True).values_list(*RECIPIENT_FIELDS)
+    ]
+
+    creator_rows = User.objects.filter(pk__in=creator_ids).values_list(*RECIPIENT_FIELDS)
+    for row in creator_rows:
+        add_user(*row)
+
+    assigned = {}
+    for agreement_id, *row in Agreement.assigned_users.through.objects.filter(
+        agreement_id__in=agreement_ids
+    ).values_list('agreement_id', 'user__id', 'user__email', 'user__full_name'):
+        assigned.setdefault(agreement_id, []).append(add_user(*row))
+
+    by_department = {}
+    for department_id, *row in User.objects.filter(
+        department_id__in=department_ids
+    ).values_list('department_id', *RECIPIENT_FIELDS):
+        by_department.setdefault(department_id, []).append(add_user(*row))
+    for department_id, *row in DepartmentPermission.objects.filter(
+        department_id__in=department_ids
+    ).values_list('department_id', 'user__id', 'user__email', 'user__full_name'):
+        by_department.setdefault(department_id, []).append(add_user(*row))
+
+    recipients = {}
+    for agreement in agreements:
+        user_ids = set(executive_ids)
+        user_ids.update(assigned.get(agreement.pk, []))
+        user_ids.update(by_department.get(agreement.department_id, []))
+        if agreement.creator_id in users:
+            user_ids.add(agreement.creator_id)
+        recipients[agreement.pk] = [users[user_id] for user_id in sorted(user_ids)]
+    return recipients
@@ -0,0 +1,335 @@
+import logging
+import os
+import socket
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, CharField, F, Q, Value, When
+from django.db.models.functions import Mod
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Reminder windows expressed as (kind, min days until expiry, max days until expiry).
+# Order matters: an agreement only gets the first reminder it matches, same as
+# the original elif chain in Agreement.check_and_send_reminders.
+REMINDER_WINDOWS = (
+    ('30_days', 29, 30),
+    ('15_days', 14, 15),
+    ('7_days', 6, 7),
+    ('expiry_day', 0, 0),
+    ('after_expiry', -30, -29),
+)
+
+INITIAL_REMINDER = 'initial'
+
+
+def get_reminder_kind(agreement, today=None):
+    """
+    Return the reminder kind due for a single agreement today, or None.
+    """
+    today = today or timezone.now().date()
+    if agreement.reminder_time == today:
+        return INITIAL_REMINDER
+
+    days_until_expiry = (agreement.expiry_date - today).days
+    for kind, min_days, max_days in REMINDER_WINDOWS:
+        if min_days <= days_until_expiry <= max_days:
+            return kind
+    return None
+
+
+def get_reminder_kwargs(kind, days_until_expiry):
+    """
+    Map a reminder kind to the arguments expected by send_agreement_reminder.
+    """
+    if kind == INITIAL_REMINDER:
+        return {'reminder_type': 'before', 'time_remaining': f"{days_until_expiry} days"}
+    if kind == 'expiry_day':
+        return {'reminder_type': 'on'}
+    if kind == 'after_expiry':
+        return {'reminder_type': 'after', 'months_since_expiration': "1 month"}
+    # 30_days / 15_days / 7_days
+    return {'reminder_type': 'before', 'time_remaining': kind.replace('_', ' ')}
+
+
+def get_reminder_conditions(today):
+    """
+    Build the (kind, Q) pairs used to find due agreements in SQL.
+    """
+    conditions = [(INITIAL_REMINDER, Q(reminder_time=today))]
+    for kind, min_days, max_days in REMINDER_WINDOWS:
+        conditions.append((
+            kind,
+            Q(expiry_date__range=(today + timedelta(days=min_days), today + timedelta(days=max_days)))
+        ))
+    return conditions
+
+
+def get_reminder_due_date(kind, expiry_date, reminder_time):
+    """
+    Return the date a reminder window opens. Both days of a two-day window map
+    to the same due date, which is what keeps the ledger from sending twice.
+    """
+    if kind == INITIAL_REMINDER:
+        return reminder_time
+    for window_kind, _, max_days in REMINDER_WINDOWS:
+        if window_kind == kind:
+            return expiry_date - timedelta(days=max_days)
+    raise ValueError(f"Unknown reminder kind: {kind}")
+
+
+def get_default_worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def plan_due_reminders(today=None, agreement_ids=None, shard=None, shards=None):
+    """
+    Return a list of (agreement pk, reminder kind, due date) for every agreement
+    due a reminder today.
+
+    The whole plan is computed by a single query, so the cost depends on the
+    number of due agreements rather than the size of the agreement table.
+    """
+    from agreements.models import Agreement
+
+    today = today or timezone.now().date()
+    conditions = get_reminder_conditions(today)
+
+    due_filter = Q()
+    for _, condition in conditions:
+        due_filter |= condition
+
+    reminder_kind = Case(
+        *[When(condition, then=Value(kind)) for kind, condition in conditions],
+        default=Value(None),
+        output_field=CharField(),
+    )
+
+    agreements = Agreement.objects.filter(due_filter, status__in=['Ongoing', 'Expired'])
+    if agreement_ids is not None:
+        agreements = agreements.filter(pk__in=agreement_ids)
+    if shards:
+        agreements = agreements.alias(shard=Mod('pk', shards)).filter(shard=shard)
+
+    plan = [
+        (pk, kind, get_reminder_due_date(kind, expiry_date, reminder_time))
+        for pk, kind, expiry_date, reminder_time in agreements
+        .annotate(reminder_kind=reminder_kind)
+        .order_by('pk')
+        .values_list('pk', 'reminder_kind', 'expiry_date', 'reminder_time')
+    ]
+    logger.info(f"Planned {len(plan)} agreement reminders for {today}")
+    return plan
+
+
+def queue_due_reminders(today=None, batch_size=None, agreement_ids=None, shard=None, shards=None):
+    """
+    Write a pending ReminderDispatch row for every recipient of every reminder
+    due today. Rows that already exist are left untouched, so queueing is
+    idempotent and a rerun only adds what is missing.
+    Returns the number of planned agreement reminders.
+    """
+    from agreements.models import Agreement, ReminderDispatch
+    from .recipient_utils import resolve_recipients_bulk
+
+    batch_size = batch_size or getattr(settings, 'REMINDER_BATCH_SIZE', 200)
+    plan = plan_due_reminders(today, agreement_ids=agreement_ids, shard=shard, shards=shards)
+
+    for start in range(0, len(plan), batch_size):
+        batch = plan[start:start + batch_size]
+        agreements = Agreement.objects.only(
+            'pk', 'department_id', 'creator_id'
+        ).in_bulk([pk for pk, _, _ in batch])
+        recipients = resolve_recipients_bulk(agreements.values())
+
+        dispatches = []
+        for pk, kind, due_date in batch:
+            for user in recipients.get(pk, []):
+                if not user['email']:
+                    continue
+                dispatches.append(ReminderDispatch(
+                    agreement_id=pk,
+                    reminder_kind=kind,
+                    due_date=due_date,
+                    recipient_id=user['id'],
+                    recipient_email=user['email'],
+                    recipient_name=user['full_name'] or '',
+                ))
+        ReminderDispatch.objects.bulk_create(dispatches, ignore_conflicts=True)
+
+    return len(plan)
+
+
+def queue_reminders_after_save(agreement_id):
+    """
+    Queue the reminder due today for a single agreement that was just saved.
+    Used as an on_commit callback, so errors are logged instead of raised.
+    """
+    try:
+        queue_due_reminders(agreement_ids=[agreement_id])
+    except Exception as e:
+        logger.error(f"Error queueing reminders for agreement {agreement_id}: {str(e)}")
+
+
+def claim_reminder_dispatches(worker, limit, retry_before=None, agreement_ids=None, shard=None, shards=None):
+    """
+    Claim up to limit dispatches for this worker and return them.
+
+    Claimable rows are pending ones, failed ones that still have attempts left
+    and rows stuck in Sending for longer than REMINDER_CLAIM_TIMEOUT (a worker
+    that crashed mid-batch). Failed rows are only retried if they were last
+    claimed before retry_before, so a run never retries its own failures.
+    Locked rows are skipped so several workers can drain the ledger at the
+    same time.
+    """
+    from agreements.models import ReminderDispatch
+
+    now = timezone.now()
+    retry_before = retry_before or now
+    claim_timeout = timedelta(seconds=getattr(settings, 'REMINDER_CLAIM_TIMEOUT', 15 * 60))
+    max_attempts = getattr(settings, 'REMINDER_MAX_ATTEMPTS', 3)
+
+    claimable = ReminderDispatch.objects.filter(
+        Q(status='Pending') |
+        Q(status='Failed', attempts__lt=max_attempts, claimed_at__lt=retry_before) |
+        Q(status='Sending', claimed_at__lt=now - claim_timeout)
+    )
+    if agreement_ids is not None:
+        claimable = claimable.filter(agreement_id__in=agreement_ids)
+    if shards:
+        claimable = claimable.alias(shard=Mod('agreement_id', shards)).filter(shard=shard)
+
+    with transaction.atomic():
+        ids = list(
+            claimable.select_for_update(skip_locked=True)
+            .order_by('pk')
+            .values_list('pk', flat=True)[:limit]
+        )
+        ReminderDispatch.objects.filter(pk__in=ids).update(
+            status='Sending',
+            claimed_by=worker,
+            claimed_at=now,
+            attempts=F('attempts') + 1,
+            updated_at=now,
+        )
+
+    return list(
+        ReminderDispatch.objects.filter(pk__in=ids, claimed_by=worker)
+        .select_related('agreement__department', 'agreement__agreement_type', 'agreement__party_name')
+        .order_by('agreement_id', 'reminder_kind', 'pk')
+    )
+
+
+def send_reminder_dispatches(dispatches, today=None):
+    """
+    Build the emails for a batch of claimed dispatches, send them over a pooled
+    SMTP connection and record the outcome of each row.
+    Returns a (sent, failed) tuple.
+    """
+    from agreements.models import ReminderDispatch
+    from .email_utils import build_reminder_messages, send_bulk_messages
+
+    today = today or timezone.now().date()
+
+    groups = {}
+    for dispatch in dispatches:
+        groups.setdefault((dispatch.agreement_id, dispatch.reminder_kind), []).append(dispatch)
+
+    # Messages and failures are keyed by dispatch pk, as one recipient can get
+    # several reminders in the same batch
+    messages = []
+    failures = {}
+    render_started = time.monotonic()
+    for (agreement_id, kind), rows in groups.items():
+        agreement = rows[0].agreement
+        days_until_expiry = (agreement.expiry_date - today).days
+        logger.info(f"Sending {kind} reminder for agreement {agreement_id} to {len(rows)} recipient(s)")
+        try:
+            built, build_failures = build_reminder_messages(
+                agreement,
+                [(row.recipient_email, row.recipient_name) for row in rows],
+                **get_reminder_kwargs(kind, days_until_expiry)
+            )
+        except Exception as e:
+            built, build_failures = [], {row.recipient_email: str(e) for row in rows}
+
+        built_by_email = {message.to[0]: message for message in built}
+        for row in rows:
+            if row.recipient_email in build_failures:
+                failures[row.pk] = build_failures[row.recipient_email]
+            else:
+                message = built_by_email[row.recipient_email]
+                message.dispatch_id = row.pk
+                messages.append(message)
+
+    logger.info(
+        f"Rendered {len(messages)} reminder email(s) for {len(groups)} agreement reminder(s) "
+        f"in {time.monotonic() - render_started:.3f}s"
+    )
+
+    stats = send_bulk_messages(messages)
+    for message, error in stats['failed_messages']:
+        failures[message.dispatch_id] = error
+
+    sent_ids = [message.dispatch_id for message in messages if message.dispatch_id not in failures]
+    # update() skips auto_now, incremental backups select rows by updated_at
+    now = timezone.now()
+    for pk, error in failures.items():
+        ReminderDispatch.objects.filter(pk=pk).update(status='Failed', last_error=error, updated_at=now)
+    ReminderDispatch.objects.filter(pk__in=sent_ids).update(
+        status='Sent', sent_at=now, last_error='', updated_at=now
+    )
+    return len(sent_ids), len(failures)
+
+
+def send_pending_reminders(today=None, batch_size=None, worker=None, agreement_ids=None, shard=None, shards=None):
+    """
+    Claim and send queued dispatches in batches until none are left for this
+    worker. Returns a dict with the number of sent and failed emails.
+    """
+    today = today or timezone.now().date()
+    batch_size = batch_size or getattr(settings, 'REMINDER_BATCH_SIZE', 200)
+    worker = worker or get_default_worker_name()
+    stats = {'sent': 0, 'failed': 0}
+
+    started_at = timezone.now()
+    while True:
+        dispatches = claim_reminder_dispatches(
+            worker, batch_size, retry_before=started_at,
+            agreement_ids=agreement_ids, shard=shard, shards=shards
+        )
+        if not dispatches:
+            break
+        sent, failed = send_reminder_dispatches(dispatches, today)
+        stats['sent'] += sent
+        stats['failed'] += failed
+    return stats
+
+
+def dispatch_due_reminders(today=None, batch_size=None, worker=None, agreement_ids=None, shard=None, shards=None):
+    """
+    Queue every reminder due today in the ledger, then claim and send pending
+    dispatches in batches until none are left for this worker.
+    Returns a dict with the number of planned agreement reminders and of sent
+    and failed emails.
+    """
+    today = today or timezone.now().date()
+    batch_size = batch_size or getattr(settings, 'REMINDER_BATCH_SIZE', 200)
+    worker = worker or get_default_worker_name()
+
+    planned = queue_due_reminders(
+        today, batch_size=batch_size, agreement_ids=agreement_ids, shard=shard, shards=shards
+    )
+    stats = {'planned': planned, **send_pending_reminders(
+        today, batch_size=batch_size, worker=worker,
+        agreement_ids=agreement_ids, shard=shard, shards=shards
+    )}
+
+    logger.info(
+        f"Reminder dispatch by {worker} finished: {stats['planned']} planned, "
+        f"{stats['sent']} sent, {stats['failed']} failed"
+    )
+    return stats
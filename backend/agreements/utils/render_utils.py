@@ -0,0 +1,41 @@
+import logging
+import time
+
+from django.template.loader import get_template
+from django.utils.html import escape
+
+logger = logging.getLogger(__name__)
+
+# Stands in for the recipient name while the shared part of an email is
+# rendered. Only letters and underscores, so autoescaping leaves it intact.
+RECIPIENT_NAME_PLACEHOLDER = '__PAPERTRAILS_RECIPIENT_NAME__'
+
+
+class AgreementEmailRenderer:
+    """
+    Renders a text/html template pair once for an agreement and splices in
+    the recipient name for each recipient, instead of rendering both
+    templates again for every recipient.
+
+    Templates are looked up through Django's template loaders, which cache
+    compiled templates per process. Templates rendered this way must output
+    recipient_name as-is (no filters), since it is substituted after rendering.
+    """
+
+    def __init__(self, text_template, html_template, context):
+        started = time.monotonic()
+        context = dict(context, recipient_name=RECIPIENT_NAME_PLACEHOLDER)
+        self.text = get_template(text_template).render(context)
+        self.html = get_template(html_template).render(context)
+        self.render_time = time.monotonic() - started
+
+    def render(self, recipient_name):
+        """
+        Return the (text, html) bodies for one recipient. The name is escaped
+        in both, matching what the template engine's autoescaping produced.
+        """
+        recipient_name = escape(recipient_name)
+        return (
+            self.text.replace(RECIPIENT_NAME_PLACEHOLDER, recipient_name),
+            self.html.replace(RECIPIENT_NAME_PLACEHOLDER, recipient_name),
+        )
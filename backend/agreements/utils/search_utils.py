@@ -0,0 +1,183 @@
+import logging
+import re
+
+from django.db import transaction
+from django.db.models import Case, IntegerField, Max, Q, Sum, Value, When
+
+logger = logging.getLogger(__name__)
+
+TERM_MAX_LENGTH = 100
+
+# Searchable agreement fields as (name, weight). Terms found in heavier
+# fields rank higher, a term keeps the weight of the heaviest field it is in.
+SEARCH_FIELDS = (
+    ('agreement_id', 4),
+    ('title', 3),
+    ('agreement_reference', 2),
+    ('party_name', 2),
+    ('remarks', 1),
+)
+
+# Agreement attributes get_search_values() reads, saves that change none of
+# them leave the search index alone
+INDEXED_ATTRIBUTES = ('agreement_id', 'title', 'agreement_reference', 'party_name_id', 'remarks')
+
+WORD_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """
+    Split text into lowercase search terms. Words containing underscores are
+    also indexed by their parts, so A_2025_0001 matches both "a_2025_00"
+    and "0001".
+    """
+    terms = []
+    for word in WORD_RE.findall((text or '').lower()):
+        terms.append(word[:TERM_MAX_LENGTH])
+        if '_' in word:
+            terms.extend(part[:TERM_MAX_LENGTH] for part in word.split('_') if part)
+    return terms
+
+
+def get_search_values(agreement):
+    """Return the searchable text of an agreement keyed by SEARCH_FIELDS name."""
+    return {
+        'agreement_id': agreement.agreement_id,
+        'title': agreement.title,
+        'agreement_reference': agreement.agreement_reference,
+        'party_name': agreement.party_name.name if agreement.party_name_id else '',
+        'remarks': agreement.remarks,
+    }
+
+
+def build_search_document(agreement):
+    """
+    Return (content, {term: weight}) for an agreement. content is the
+    denormalized text stored on AgreementSearchDocument.
+    """
+    values = get_search_values(agreement)
+    weights = {}
+    for field, weight in SEARCH_FIELDS:
+        for term in tokenize(values[field]):
+            weights[term] = max(weights.get(term, 0), weight)
+    content = '\n'.join(values[field] or '' for field, _ in SEARCH_FIELDS)
+    return content, weights
+
+
+def index_agreement(agreement):
+    """
+    Refresh the search document and inverted index terms of one agreement.
+    Nothing is written when the searchable text did not change.
+    """
+    from agreements.models import AgreementSearchDocument, AgreementSearchTerm
+
+    content, weights = build_search_document(agreement)
+    document = AgreementSearchDocument.objects.filter(agreement_id=agreement.pk).first()
+    if document is not None and document.content == content:
+        return False
+
+    with transaction.atomic():
+        AgreementSearchDocument.objects.update_or_create(
+            agreement_id=agreement.pk, defaults={'content': content}
+        )
+        AgreementSearchTerm.objects.filter(agreement_id=agreement.pk).delete()
+        AgreementSearchTerm.objects.bulk_create([
+            AgreementSearchTerm(agreement_id=agreement.pk, term=term, weight=weight)
+            for term, weight in weights.items()
+        ])
+    return True
+
+
+def index_agreements(agreements):
+    """
+    index_agreement for many agreements (party_name selected) with a fixed
+    number of queries, for bulk updates that skip post_save. Returns the
+    number of reindexed agreements.
+    """
+    from agreements.models import AgreementSearchDocument, AgreementSearchTerm
+
+    documents = {agreement.pk: build_search_document(agreement) for agreement in agreements}
+    current = dict(
+        AgreementSearchDocument.objects.filter(agreement_id__in=documents).values_list('agreement_id', 'content')
+    )
+    changed = [pk for pk, (content, _) in documents.items() if current.get(pk) != content]
+    if not changed:
+        return 0
+
+    with transaction.atomic():
+        # Replacing the documents is cheaper than a bulk_update of their content
+        AgreementSearchDocument.objects.filter(agreement_id__in=changed).delete()
+        AgreementSearchDocument.objects.bulk_create(
+            [AgreementSearchDocument(agreement_id=pk, content=documents[pk][0]) for pk in changed]
+        )
+        AgreementSearchTerm.objects.filter(agreement_id__in=changed).delete()
+        AgreementSearchTerm.objects.bulk_create([
+            AgreementSearchTerm(agreement_id=pk, term=term, weight=weight)
+            for pk in changed
+            for term, weight in documents[pk][1].items()
+        ])
+    return len(changed)
+
+
+def index_agreements_in_batches(agreements, batch_size=500):
+    """
+    index_agreements over an Agreement queryset, batch_size agreements at a
+    time. Returns the number of reindexed agreements.
+    """
+    reindexed = 0
+    batch = []
+    for agreement in agreements.select_related('party_name').order_by('pk').iterator(chunk_size=batch_size):
+        batch.append(agreement)
+        if len(batch) == batch_size:
+            reindexed += index_agreements(batch)
+            batch = []
+    if batch:
+        reindexed += index_agreements(batch)
+    return reindexed
+
+
+def rebuild_search_index(batch_size=500):
+    """
+    Reindex every agreement, e.g. after a bulk import that skipped signals.
+    Returns the number of reindexed agreements.
+    """
+    from agreements.models import Agreement
+
+    reindexed = index_agreements_in_batches(Agreement.objects.all(), batch_size=batch_size)
+    logger.info(f"Rebuilt search index, {reindexed} agreement(s) reindexed")
+    return reindexed
+
+
+def search_agreements_queryset(queryset, query):
+    """
+    Filter an Agreement queryset to agreements matching every word of query
+    (as a prefix of an indexed term) and order them by relevance, the sum of
+    the weights of their matching terms.
+
+    Matching starts from the indexed term column, so the cost depends on the
+    number of matching terms rather than the size of the agreement table.
+    """
+    tokens = [token[:TERM_MAX_LENGTH] for token in dict.fromkeys(WORD_RE.findall((query or '').lower()))]
+    if not tokens:
+        return queryset
+
+    any_token = Q()
+    for token in tokens:
+        any_token |= Q(search_terms__term__startswith=token)
+
+    # Filtering before annotating restricts the aggregates to matching terms.
+    # Each token_N flag tells whether query word N matched at least one term.
+    return (
+        queryset.filter(any_token)
+        .annotate(**{
+            f'search_token_{i}': Max(Case(
+                When(search_terms__term__startswith=token, then=Value(1)),
+                default=Value(0),
+                output_field=IntegerField(),
+            ))
+            for i, token in enumerate(tokens)
+        })
+        .filter(**{f'search_token_{i}': 1 for i in range(len(tokens))})
+        .annotate(search_rank=Sum('search_terms__weight'))
+        .order_by('-search_rank', '-created_at')
+    )
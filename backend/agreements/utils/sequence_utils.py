@@ -0,0 +1,92 @@
+import logging
+import re
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+AGREEMENT_ID_PATTERN = re.compile(r'^A_(\d{4})_(\d{4,})$')
+
+
+def format_agreement_id(year, number):
+    return f"A_{year}_{number:04d}"
+
+
+def get_highest_agreement_numbers(agreement_ids):
+    """
+    Return {year: highest number} for the well-formed A_{year}_{NNNN} ids in
+    agreement_ids. Legacy ids with a random suffix are ignored.
+    """
+    highest = {}
+    for agreement_id in agreement_ids:
+        match = AGREEMENT_ID_PATTERN.match(agreement_id or '')
+        if match:
+            year, number = int(match.group(1)), int(match.group(2))
+            highest[year] = max(highest.get(year, 0), number)
+    return highest
+
+
+def allocate_agreement_number(year):
+    """
+    Return the next agreement number for a year from AgreementIdSequence.
+
+    The sequence row is bumped with a single UPDATE ... last_number + 1, which
+    locks it until the surrounding transaction ends, so concurrent creators
+    always get distinct numbers without scanning the agreement table. The row
+    of a new year is seeded from the ids already stored for that year.
+
+    To keep that lock short, call this outside of any long transaction (the
+    create views reserve the id before theirs). Inside an outer transaction
+    the lock lasts until the outer commit.
+
+    Gap policy: numbers are never reused. A number allocated for an agreement
+    whose creation then fails is skipped, as with a database sequence.
+    """
+    from agreements.models import Agreement, AgreementIdSequence
+
+    with transaction.atomic():
+        updated = AgreementIdSequence.objects.filter(year=year).update(
+            last_number=F('last_number') + 1
+        )
+        if not updated:
+            existing = Agreement.objects.filter(
+                agreement_id__startswith=f"A_{year}_"
+            ).values_list('agreement_id', flat=True)
+            next_number = get_highest_agreement_numbers(existing).get(year, 0) + 1
+            try:
+                # First agreement of the year, another creator may be racing us
+                with transaction.atomic():
+                    AgreementIdSequence.objects.create(year=year, last_number=next_number)
+                return next_number
+            except IntegrityError:
+                AgreementIdSequence.objects.filter(year=year).update(
+                    last_number=F('last_number') + 1
+                )
+        return AgreementIdSequence.objects.filter(year=year).values_list('last_number', flat=True).get()
+
+
+def sync_agreement_id_sequences():
+    """
+    Move every sequence past the highest agreement_id stored for its year.
+    Run after agreements are inserted with explicit ids (restores, imports).
+    Returns the number of sequences created or moved.
+    """
+    from agreements.models import Agreement, AgreementIdSequence
+
+    highest = get_highest_agreement_numbers(
+        Agreement.objects.values_list('agreement_id', flat=True).iterator()
+    )
+    changed = 0
+    with transaction.atomic():
+        for year, number in highest.items():
+            sequence, created = AgreementIdSequence.objects.select_for_update().get_or_create(
+                year=year, defaults={'last_number': number}
+            )
+            if created or sequence.last_number < number:
+                if not created:
+                    sequence.last_number = number
+                    sequence.save(update_fields=['last_number'])
+                changed += 1
+    logger.info(f"Synced {changed} agreement id sequences")
+    return changed
@@ -0,0 +1,81 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DASHBOARD_STATS_CACHE_KEY = 'agreements:dashboard_stats:{today}'
+
+
+def build_dashboard_stats(today=None):
+    """
+    Compute the dashboard statistics with one conditional aggregation over
+    agreements grouped by department, plus one query for department names.
+    """
+    from accounts.models import Department
+    from agreements.models import Agreement
+
+    today = today or timezone.localdate()
+    one_month = today + timedelta(days=30)
+    three_months = today + timedelta(days=90)
+    six_months = today + timedelta(days=180)
+
+    buckets = {
+        'active': Q(status='Ongoing', expiry_date__gte=today),
+        'expiring_soon': Q(status='Ongoing', expiry_date__lte=three_months, expiry_date__gte=today),
+        'expired': Q(status='Expired'),
+        'expiry_in_1_month': Q(expiry_date__gt=today, expiry_date__lte=one_month),
+        'expiry_in_6_months': Q(expiry_date__lte=six_months, expiry_date__gt=three_months),
+    }
+    rows = Agreement.objects.order_by().values('department_id').annotate(
+        total=Count('pk'),
+        **{name: Count('pk', filter=condition) for name, condition in buckets.items()}
+    )
+
+    totals = dict.fromkeys(buckets, 0)
+    per_department = {}
+    for row in rows:
+        per_department[row['department_id']] = row['total']
+        for name in buckets:
+            totals[name] += row[name]
+
+    return {
+        'active': totals['active'],
+        'expiringSoon': totals['expiring_soon'],
+        'expired': totals['expired'],
+        'agreementDeptData': [
+            {'name': name, 'value': per_department.get(pk, 0)}
+            for pk, name in Department.objects.filter(executive=False).values_list('pk', 'name')
+        ],
+        'agreementStatusData': [
+            {'name': 'Expiry in 6 months', 'value': totals['expiry_in_6_months'], 'color': '#2980b9'},
+            {'name': 'Expiry in 3 months', 'value': totals['expiring_soon'], 'color': '#f39c12'},
+            {'name': 'Expiry within 1 month', 'value': totals['expiry_in_1_month'], 'color': '#e67e22'},
+            {'name': 'Expired', 'value': totals['expired'], 'color': '#e74c3c'},
+        ],
+    }
+
+
+def get_dashboard_stats(today=None):
+    """
+    Return the dashboard statistics from a cached snapshot, computing it when
+    missing. The key includes the date, so date based buckets roll over at
+    midnight even if nothing changed.
+    """
+    today = today or timezone.localdate()
+    key = DASHBOARD_STATS_CACHE_KEY.format(today=today.isoformat())
+    stats = cache.get(key)
+    if stats is None:
+        stats = build_dashboard_stats(today)
+        cache.set(key, stats, getattr(settings, 'DASHBOARD_STATS_CACHE_TIMEOUT', 60))
+    return stats
+
+
+def invalidate_dashboard_stats(today=None):
+    """Drop today's cached dashboard snapshot after agreements change."""
+    today = today or timezone.localdate()
+    cache.delete(DASHBOARD_STATS_CACHE_KEY.format(today=today.isoformat()))
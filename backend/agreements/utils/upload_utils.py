@@ -0,0 +1,187 @@
+import hashlib
+import logging
+import os
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+CONTENT_RANGE_PATTERN = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+# Bytes read from the request or the part file at a time
+READ_SIZE = 64 * 1024
+
+
+class UploadOffsetError(ValueError):
+    """A chunk did not start where the upload left off, the client should resume from offset."""
+
+    def __init__(self, offset):
+        super().__init__(f"Chunk must start at byte {offset}")
+        self.offset = offset
+
+
+class ChunkedUploadFile(File):
+    """
+    A finished chunked upload. Like TemporaryUploadedFile it exposes
+    temporary_file_path(), so FileSystemStorage moves the part file into
+    place instead of copying it.
+
+    The part file is only opened when its content is read, which the move
+    does not do, so a request that fails before saving leaves no open handle.
+    """
+
+    def __init__(self, upload):
+        self.upload = upload
+        super().__init__(None, name=upload.filename)
+        self.size = upload.size
+        self.sha256 = upload.sha256
+
+    @property
+    def file(self):
+        if self._file is None:
+            self._file = open(self.upload.part_path, 'rb')
+        return self._file
+
+    @file.setter
+    def file(self, file):
+        self._file = file
+
+    @property
+    def closed(self):
+        return self._file is None or self._file.closed
+
+    def open(self, mode='rb'):
+        if self.closed:
+            self._file = open(self.upload.part_path, mode)
+        else:
+            self.seek(0)
+        return self
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+    def temporary_file_path(self):
+        return self.upload.part_path
+
+
+def hash_file(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(READ_SIZE), b''):
+            hasher.update(data)
+    return hasher.hexdigest()
+
+
+def parse_content_range(header):
+    """Return (start, end, total) from a 'bytes start-end/total' header."""
+    match = CONTENT_RANGE_PATTERN.match(header or '')
+    if not match:
+        raise ValueError("Content-Range must look like 'bytes start-end/total'")
+    start, end, total = (int(value) for value in match.groups())
+    if end < start:
+        raise ValueError("Content-Range end is before its start")
+    return start, end, total
+
+
+def start_upload(user, filename, size, sha256=''):
+    """Register a new chunked upload and create its empty part file."""
+    from agreements.models import ChunkedUpload
+
+    max_size = getattr(settings, 'CHUNKED_UPLOAD_MAX_SIZE', 500 * 1024 * 1024)
+    if size <= 0 or size > max_size:
+        raise ValueError(f"File size must be between 1 and {max_size} bytes")
+
+    upload = ChunkedUpload.objects.create(
+        user=user,
+        filename=os.path.basename(filename)[:255],
+        size=size,
+        sha256=(sha256 or '').lower(),
+    )
+    os.makedirs(settings.CHUNKED_UPLOAD_DIR, exist_ok=True)
+    open(upload.part_path, 'wb').close()
+    logger.info(f"Started chunked upload {upload.pk} of {upload.filename} ({size} bytes)")
+    return upload
+
+
+def append_chunk(upload, stream, start, length):
+    """
+    Write length bytes read from stream at offset start of the part file.
+
+    The chunk must start at the current offset, so a client resumes by asking
+    for the offset and re-sending from there. The upload row is locked while
+    writing, and only READ_SIZE bytes are held in memory at a time. Once the
+    last byte arrives the part file is hashed and checked against the
+    checksum sent when the upload started.
+    """
+    from agreements.models import ChunkedUpload
+
+    chunk_size = getattr(settings, 'CHUNKED_UPLOAD_CHUNK_SIZE', 5 * 1024 * 1024)
+    if length <= 0 or length > chunk_size:
+        raise ValueError(f"Chunks must be between 1 and {chunk_size} bytes")
+
+    with transaction.atomic():
+        upload = ChunkedUpload.objects.select_for_update().get(pk=upload.pk)
+        if upload.status != 'Uploading':
+            raise ValueError("Upload is already complete")
+        if start != upload.offset:
+            raise UploadOffsetError(upload.offset)
+        if start + length > upload.size:
+            raise ValueError("Chunk goes past the end of the file")
+
+        with open(upload.part_path, 'r+b') as f:
+            # Drop whatever an interrupted request left after the offset
+            f.seek(start)
+            f.truncate()
+            remaining = length
+            while remaining:
+                data = stream.read(min(READ_SIZE, remaining))
+                if not data:
+                    raise ValueError(f"Chunk ended {remaining} bytes early")
+                f.write(data)
+                remaining -= len(data)
+
+        upload.offset = start + length
+        if upload.offset == upload.size:
+            checksum = hash_file(upload.part_path)
+            if upload.sha256 and upload.sha256 != checksum:
+                # Start over rather than attach a corrupted file
+                open(upload.part_path, 'wb').close()
+                ChunkedUpload.objects.filter(pk=upload.pk).update(offset=0, updated_at=timezone.now())
+                raise ValueError("Checksum mismatch, upload restarted")
+            upload.sha256 = checksum
+            upload.status = 'Complete'
+            logger.info(f"Completed chunked upload {upload.pk} of {upload.filename}")
+        upload.save(update_fields=['offset', 'sha256', 'status', 'updated_at'])
+    return upload
+
+
+def get_completed_upload(user, upload_id):
+    """Return the completed upload of this user as a file ready to be assigned, or raise ValueError."""
+    from agreements.models import ChunkedUpload
+
+    try:
+        upload = ChunkedUpload.objects.get(pk=upload_id, user=user, status='Complete')
+    except (ChunkedUpload.DoesNotExist, ValidationError):
+        raise ValueError("Upload not found or not complete")
+    return ChunkedUploadFile(upload)
+
+
+def remove_expired_uploads():
+    """Delete uploads untouched for CHUNKED_UPLOAD_EXPIRY_HOURS with their part files."""
+    from agreements.models import ChunkedUpload
+
+    hours = getattr(settings, 'CHUNKED_UPLOAD_EXPIRY_HOURS', 24)
+    expired = ChunkedUpload.objects.filter(updated_at__lt=timezone.now() - timedelta(hours=hours))
+    count = 0
+    # Delete one by one so the post_delete signal removes each part file
+    for upload in expired.iterator():
+        upload.delete()
+        count += 1
+    return count
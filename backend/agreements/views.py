@@ -6,21 +6,37 @@ from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticatedOrReadOnly, IsAuthenticated, AllowAny
 from rest_framework.views import APIView
+from rest_framework.settings import api_settings
 from django.core.files.storage import default_storage
 from django.core.files import File
 from django.shortcuts import get_object_or_404
+from django.db import transaction
 from django.db.models import Q
 import os
 import logging
 from .models import Agreement
 from .models import AgreementType
-from .serializers import AgreementSerializer, AgreementTypeSerializer, VendorSerializer
+from .models import ChunkedUpload
+from .serializers import AgreementSerializer, AgreementListRowSerializer, AgreementTypeSerializer, VendorSerializer
+from .pagination import AgreementCursorPagination, AgreementSearchPagination
 from .forms import AgreementForm
-from accounts.models import Department, User, DepartmentPermission, Organization
+from .utils.email_utils import send_agreement_action_notification
+from .utils.outbox_utils import queue_agreement_notification
+from .utils.stats_utils import get_dashboard_stats
+from .utils.search_utils import search_agreements_queryset
+from .utils.upload_utils import (
+    UploadOffsetError,
+    append_chunk,
+    get_completed_upload,
+    parse_content_range,
+    start_upload,
+)
+from accounts.utils.access_utils import get_access_context
+from accounts.utils.download_utils import SignedURLAuthentication, serve_file
+from accounts.models import Department, User, Organization
 from accounts.serializers import DepartmentSerializer
-from django.core.files.base import ContentFile
 from django.core.exceptions import PermissionDenied
-from datetime import date, timedelta
+from datetime import date
 
 from django.conf import settings
 from django.core.mail import EmailMessage
@@ -43,6 +59,16 @@ class AgreementNotificationService:
     def send_update_notification(cls, agreement, updated_by):
         """Send notification for agreement update"""
         return cls._send_action_notification(agreement, 'updated', updated_by)
+
+    @classmethod
+    def queue_creation_notification(cls, agreement, created_by):
+        """Queue a creation notification in the outbox, sent later by process_notifications"""
+        return queue_agreement_notification(agreement, 'created', created_by)
+
+    @classmethod
+    def queue_update_notification(cls, agreement, updated_by):
+        """Queue an update notification in the outbox, sent later by process_notifications"""
+        return queue_agreement_notification(agreement, 'updated', updated_by)
     
     @classmethod
     def send_reminder_notification(cls, agreement, reminder_type='before'):
@@ -75,8 +101,8 @@ Please take necessary actions before expiration.
                 from django.conf import settings
                 
                 # Get recipient emails
-                recipients = agreement.get_users_to_notify()
-                recipient_emails = [user.email for user in recipients if user.email]
+                recipients = agreement.get_notification_recipients()
+                recipient_emails = [user['email'] for user in recipients if user['email']]
                 
                 if recipient_emails:
                     send_mail(
@@ -96,92 +122,7 @@ Please take necessary actions before expiration.
     def _send_action_notification(cls, agreement, action, user):
         """Common method for sending action notifications"""
         try:
-            logger.info(f"Attempting to send {action} notification for agreement {agreement.id}")
-            
-            # Get recipient emails and log the count
-            recipients = agreement.get_users_to_notify()
-            if not recipients:
-                logger.warning(f"No recipients found for agreement {agreement.id}")
-                return False
-                
-            recipient_emails = [user.email for user in recipients if user.email]
-            if not recipient_emails:
-                logger.warning(f"No valid email addresses found for agreement {agreement.id}")
-                return False            
-            
-            logger.info(f"Found {len(recipient_emails)} recipient(s) for notification")
-            logger.info(f"Sending email notification to {recipient_emails}")
-            
-            try:
-                # Construct email content
-                subject = f"Agreement {action}: {agreement.title}"
-                
-                # Load and render HTML template
-                from django.template.loader import render_to_string
-                from django.core.mail import EmailMultiAlternatives
-                
-                context = {
-                    'agreement': agreement,
-                    'action': action,
-                    'user': user,
-                    'settings': settings
-                }
-                
-                # Try to render HTML template, fallback to plain text if template doesn't exist
-                html_message = render_to_string(f'emails/agreement_{action}.html', context)
-                
-                # Plain text fallback
-                plain_message = f"""
-    Dear Papertrails User,
-
-    A new agreement titled {agreement.title} has been {action} in the system by {agreement.creator}.
-
-    Key Details:
-
-    Title: {agreement.title}
-    Reference: {agreement.agreement_reference or 'N/A'}
-    Department: {agreement.department.name if agreement.department else 'N/A'}
-    Vendor: {agreement.party_name.name if agreement.party_name else 'N/A'}
-    Agreement Type: {agreement.agreement_type.name if agreement.agreement_type else 'N/A'}
-    Start Date: {agreement.start_date}
-    Expiry Date: {agreement.expiry_date}
-
-    To review the agreement, please click the link below:
-    {settings.FRONTEND_URL}/agreements/{agreement.id}
-
-    This is an automated notification from Papertrails Agreement Management System.
-    """
-                
-                # Send the email with HTML alternative
-                email = EmailMultiAlternatives(
-                    subject=subject,
-                    body=plain_message,
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    to=recipient_emails
-                )
-                email.attach_alternative(html_message, "text/html")
-                email.send(fail_silently=False)
-                
-                logger.info("Email sent successfully")
-                return True
-
-            except Exception as template_error:
-                logger.error(f"Email template not found: {str(template_error)}")
-                # Fallback to plain text email
-                send_mail(
-                    subject=subject,
-                    message=plain_message,
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=recipient_emails,
-                    fail_silently=False
-                )
-                logger.info("Plain text email sent successfully (fallback)")
-                return True
-                
-            except Exception as email_error:
-                logger.error(f"Failed to send email: {str(email_error)}")
-                return False
-                
+            return send_agreement_action_notification(agreement, action, user)
         except Exception as e:
             logger.error(f"Failed to send {action} notification for agreement {agreement.id}: {str(e)}")
             return False
@@ -195,40 +136,25 @@ class AgreementViewSet(viewsets.ModelViewSet):
     search_fields = ['title', 'party_name__name', 'agreement_type__name', 'status']
 
     def perform_create(self, serializer):
-        agreement = serializer.save(creator=self.request.user)
-        # Send notification to assigned users
-        AgreementNotificationService.send_creation_notification(agreement, self.request.user)
+        # Reserve the agreement id before the transaction below, so the
+        # sequence row is not locked while the agreement is written
+        agreement_id = Agreement().generate_agreement_id()
+        with transaction.atomic():
+            agreement = serializer.save(creator=self.request.user, agreement_id=agreement_id)
+            # Queue notification to assigned users, committed together with the agreement
+            AgreementNotificationService.queue_creation_notification(agreement, self.request.user)
 
     
     # get_queryset with permission filtering and search
     def get_queryset(self):
         """Apply permission filtering for user access"""
-        user = self.request.user
-        user_departments = [user.department] if user.department else []
-    
-        permitted_departments = Department.objects.filter(
-            permitted_users__user=user
-        ).distinct()
-        user_departments.extend(permitted_departments)
-        
-        # Check if user is in an executive department
-        is_executive = Department.objects.filter(
-            executive=True,
-            users=user
-        ).exists()
+        access = get_access_context(self.request)
     
         # Base queryset with all needed relationships
-        base_queryset = Agreement.objects.all().select_related(
-            'department', 
-            'agreement_type', 
-            'party_name',
-            'creator',
-            'parent_agreement'
-        ).prefetch_related('assigned_users')
+        base_queryset = AgreementSerializer.setup_eager_loading(Agreement.objects.all())
 
         # Filter by user permissions
-        if not is_executive:
-            base_queryset = base_queryset.filter(department__in=user_departments)
+        base_queryset = access.filter_viewable(base_queryset)
 
         return base_queryset.order_by('-created_at')
 
@@ -253,22 +179,10 @@ class AgreementViewSet(viewsets.ModelViewSet):
         agreement = self.get_object()
         
         # Check if user has access to this agreement
-        user = request.user
-        is_executive = Department.objects.filter(
-            executive=True,
-            users=user
-        ).exists()
-        
-        if not is_executive:
-            # Check if user has access to this agreement
-            if not (user.department == agreement.department or 
-                    DepartmentPermission.objects.filter(
-                        user=user,
-                        department=agreement.department
-                    ).exists()):
-                return Response({
-                    'error': 'You do not have permission to view this agreement.'
-                }, status=status.HTTP_403_FORBIDDEN)
+        if not get_access_context(request).can_view(agreement):
+            return Response({
+                'error': 'You do not have permission to view this agreement.'
+            }, status=status.HTTP_403_FORBIDDEN)
         
         serializer = self.get_serializer(agreement)
         return Response(serializer.data)
@@ -277,30 +191,15 @@ class AgreementViewSet(viewsets.ModelViewSet):
     def form_data(self, request):
         """Get form data for creating/editing agreements"""
         user = request.user
+        access = get_access_context(request)
 
-        # Check if user is in an executive department
-        is_executive = Department.objects.filter(
-            executive=True,
-            users=user
-        ).exists()
-
-        if is_executive:
+        if access.is_executive:
             return Response({
                 'error': 'Executive users cannot create agreements.'
             }, status=status.HTTP_403_FORBIDDEN)
 
-        # Get user's departments and permitted departments
-        department_ids = set()
-        if user.department:
-            department_ids.add(user.department.id)
-
-        permitted_dept_ids = DepartmentPermission.objects.filter(
-            user=user,
-            permission_type='edit'
-        ).values_list('department_id', flat=True)
-        department_ids.update(permitted_dept_ids)
-
-        permitted_departments = Department.objects.filter(id__in=department_ids)
+        # User's own department and departments with edit permission
+        permitted_departments = Department.objects.filter(id__in=access.editable_department_ids)
         department_serializer = DepartmentSerializer(permitted_departments, many=True)
 
         # Get active agreement types
@@ -325,31 +224,15 @@ class AgreementViewSet(viewsets.ModelViewSet):
     def edit_agreement(self, request, pk=None):
         """Edit an existing agreement"""
         agreement = self.get_object()
-        user = request.user
-        
-        # Check if user is in an executive department
-        is_executive = Department.objects.filter(
-            executive=True,
-            users=user
-        ).exists()
+        access = get_access_context(request)
         
-        if is_executive:
+        if access.is_executive:
             return Response({
                 'error': 'Executive users cannot edit agreements.'
             }, status=status.HTTP_403_FORBIDDEN)
         
         # Check if user has permission to edit
-        has_permission = (
-            user in agreement.assigned_users.all() or
-            (hasattr(user, 'department') and user.department == agreement.department) or
-            DepartmentPermission.objects.filter(
-                user=user,
-                department=agreement.department,
-                permission_type='edit'
-            ).exists()
-        )
-        
-        if not has_permission:
+        if not access.can_edit(agreement):
             return Response({
                 'error': 'You do not have permission to edit this agreement.'
             }, status=status.HTTP_403_FORBIDDEN)
@@ -361,9 +244,10 @@ class AgreementViewSet(viewsets.ModelViewSet):
         
         serializer = self.get_serializer(agreement, data=request.data, partial=True)
         if serializer.is_valid():
-            updated_agreement = serializer.save()
-            # Send notification to assigned users
-            AgreementNotificationService.send_update_notification(updated_agreement, request.user)
+            with transaction.atomic():
+                updated_agreement = serializer.save()
+                # Queue notification to assigned users, committed together with the update
+                AgreementNotificationService.queue_update_notification(updated_agreement, request.user)
             return Response({
                 'success': True,
                 'message': 'Agreement updated successfully!',
@@ -403,11 +287,15 @@ class AgreementViewSet(viewsets.ModelViewSet):
                 if form.is_valid():
                     agreement = form.save(commit=False)
                     agreement.creator = request.user
-                    agreement.save()
-                    form.save_m2m()  # Save many-to-many relationships
-                    
-                    # Send notification to assigned users
-                    AgreementNotificationService.send_creation_notification(agreement, request.user)
+                    # Reserve the agreement id before the transaction below, so the
+                    # sequence row is not locked while the attachment is written
+                    agreement.agreement_id = agreement.generate_agreement_id()
+                    with transaction.atomic():
+                        agreement.save()
+                        form.save_m2m()  # Save many-to-many relationships
+
+                        # Queue notification to assigned users
+                        AgreementNotificationService.queue_creation_notification(agreement, request.user)
                     
                     # Clear the preview form data from session if it exists
                     if 'preview_form_data' in request.session:
@@ -446,41 +334,37 @@ class AgreementListAPIView(APIView):
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
-        """Get list of agreements with user permissions"""
-        user = request.user
-        user_departments = [user.department] if user.department else []
-        
-        # Get departments where user has permissions through DepartmentPermission
-        permitted_departments = Department.objects.filter(
-            permitted_users__user=user
-        ).distinct()
-        user_departments.extend(permitted_departments)
-        
-        # Check if user is in an executive department
-        is_executive = Department.objects.filter(
-            executive=True,
-            users=user
-        ).exists()
-        
-        if is_executive:
-            # Executive users can see all agreements
-            agreements = Agreement.objects.all()
-        else:
-            # Regular users can only see agreements from their departments
-            agreements = Agreement.objects.filter(
-                department__in=user_departments
-            )
-        
-        agreements = agreements.order_by('-created_at')
-        departments = Department.objects.all()
-        
-        agreement_serializer = AgreementSerializer(agreements, many=True)
-        department_serializer = DepartmentSerializer(departments, many=True)
-        
-        return Response({
+        """
+        Get a page of agreements with user permissions.
+        Query params:
+        - cursor / page_size: cursor pagination on -created_at
+        - fields: comma separated subset of AgreementListRowSerializer.LIST_FIELDS
+        Departments are only included with the first page.
+        """
+        fields = [f.strip() for f in request.query_params.get('fields', '').split(',') if f.strip()]
+        unknown_fields = set(fields) - set(AgreementListRowSerializer.LIST_FIELDS)
+        if unknown_fields:
+            return Response({
+                'error': f"Unknown fields: {', '.join(sorted(unknown_fields))}"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        # Executive users can see all agreements, regular users only those
+        # from their own and permitted departments
+        agreements = get_access_context(request).filter_viewable(Agreement.objects.all())
+        agreements = AgreementListRowSerializer.get_list_values(agreements, fields)
+
+        paginator = AgreementCursorPagination()
+        page = paginator.paginate_queryset(agreements, request, view=self)
+        agreement_serializer = AgreementListRowSerializer(page, many=True, fields=fields)
+
+        data = {
+            'next': paginator.get_next_link(),
+            'previous': paginator.get_previous_link(),
             'agreements': agreement_serializer.data,
-            'departments': department_serializer.data
-        })
+        }
+        if paginator.cursor_query_param not in request.query_params:
+            data['departments'] = DepartmentSerializer(Department.objects.all(), many=True).data
+        return Response(data)
 
 class AgreementDetailAPIView(APIView):
     """API view for agreement detail - matches path('<int:pk>/', views.agreement_detail)"""
@@ -489,28 +373,38 @@ class AgreementDetailAPIView(APIView):
     def get(self, request, pk):
         """Get detailed information about a specific agreement"""
         agreement = get_object_or_404(Agreement, pk=pk)
-        user = request.user
         
-        # Check if user is in an executive department
-        is_executive = Department.objects.filter(
-            executive=True,
-            users=user
-        ).exists()
-        
-        if not is_executive:
-            # Check if user has access to this agreement
-            if not (user.department == agreement.department or 
-                    DepartmentPermission.objects.filter(
-                        user=user,
-                        department=agreement.department
-                    ).exists()):
-                return Response({
-                    'error': 'You do not have permission to view this agreement.'
-                }, status=status.HTTP_403_FORBIDDEN)
+        # Check if user has access to this agreement
+        if not get_access_context(request).can_view(agreement):
+            return Response({
+                'error': 'You do not have permission to view this agreement.'
+            }, status=status.HTTP_403_FORBIDDEN)
         
-        serializer = AgreementSerializer(agreement)
+        serializer = AgreementSerializer(agreement, context={'request': request})
         return Response(serializer.data)
 
+class AgreementAttachmentDownloadAPIView(APIView):
+    """
+    Send the attachment of an agreement the user can view. Accepts the signed
+    download_url token as well as the normal API authentication.
+    """
+    authentication_classes = [*api_settings.DEFAULT_AUTHENTICATION_CLASSES, SignedURLAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        agreement = get_object_or_404(Agreement, pk=pk)
+
+        if not get_access_context(request).can_view(agreement):
+            return Response({
+                'error': 'You do not have permission to view this agreement.'
+            }, status=status.HTTP_403_FORBIDDEN)
+
+        if not agreement.attachment:
+            return Response({'error': 'This agreement has no attachment.'}, status=status.HTTP_404_NOT_FOUND)
+
+        filename = agreement.original_filename or os.path.basename(agreement.attachment.name)
+        return serve_file(request, agreement.attachment, filename)
+
 class AgreementFormDataAPIView(APIView):
     """API view for form data - matches path('add/', views.add_agreement)"""
     permission_classes = [IsAuthenticated]
@@ -518,30 +412,15 @@ class AgreementFormDataAPIView(APIView):
     def get(self, request):
         """Get form data for creating/editing agreements"""
         user = request.user
+        access = get_access_context(request)
         
-        # Check if user is in an executive department
-        is_executive = Department.objects.filter(
-            executive=True,
-            users=user
-        ).exists()
-        
-        if is_executive:
+        if access.is_executive:
             return Response({
                 'error': 'Executive users cannot create agreements.'
             }, status=status.HTTP_403_FORBIDDEN)
         
-        # Get user's departments and permitted departments
-        department_ids = set()
-        if user.department:
-            department_ids.add(user.department.id)
-        
-        permitted_dept_ids = DepartmentPermission.objects.filter(
-            user=user,
-            permission_type='edit'
-        ).values_list('department_id', flat=True)
-        department_ids.update(permitted_dept_ids)
-        
-        permitted_departments = Department.objects.filter(id__in=department_ids)
+        # User's own department and departments with edit permission
+        permitted_departments = Department.objects.filter(id__in=access.editable_department_ids)
         department_serializer = DepartmentSerializer(permitted_departments, many=True)
 
         # Get active agreement types
@@ -566,14 +445,28 @@ class SubmitAgreementAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
+        upload_file = None
         try:
             # Debug logging
             logger.info("Starting agreement submission")
             logger.info(f"Request data: {request.data}")
             logger.info(f"Files: {request.FILES}")
 
+            # A large file may have been sent beforehand as a chunked upload
+            files = request.FILES
+            if request.data.get('upload_id'):
+                try:
+                    upload_file = get_completed_upload(request.user, request.data['upload_id'])
+                    files = request.FILES.copy()
+                    files['attachment'] = upload_file
+                except ValueError as e:
+                    return Response({
+                        'success': False,
+                        'message': str(e)
+                    }, status=status.HTTP_400_BAD_REQUEST)
+
             # Create form instance with the raw request data
-            form = AgreementForm(request.data, request.FILES, user=request.user)
+            form = AgreementForm(request.data, files, user=request.user)
 
             # For editing, make attachment not required if existing file exists
             if request.data.get('is_editing') == 'true':
@@ -591,52 +484,36 @@ class SubmitAgreementAPIView(APIView):
                     logger.info(f"Setting department to user's department: {request.user.department}")
 
 
-                # Handle file upload
-                if 'attachment' in request.FILES:
-                    if agreement.pk and agreement.attachment:
-                        agreement.attachment.delete(save=False)
-                    file = request.FILES['attachment']
-                    file_name = default_storage.save(f'agreements/{file.name}', ContentFile(file.read()))
-                    agreement.attachment = file_name
+                # Handle file upload. The upload is already on disk, the blob store
+                # moves it into place (or drops it if the same file is stored already)
+                # when the agreement is saved, instead of reading it into memory.
+                if 'attachment' in files:
+                    agreement.attachment = files['attachment']
+
+                # Reserve the agreement id before the transaction below, so the
+                # sequence row is not locked while the attachment is written
+                agreement.agreement_id = agreement.generate_agreement_id()
+
+                with transaction.atomic():
+                    agreement.save()
+                    form.save_m2m()
+
+                    # Ensure creator is in assigned users
+                    agreement.assigned_users.add(request.user)
+
+                    # If department exists, add department users
+                    if agreement.department:
+                        User = get_user_model()
+                        department_users = User.objects.filter(department=agreement.department)
+                        agreement.assigned_users.add(*department_users)
+
+                    # Queue the notification in the same transaction; it is sent by
+                    # the process_notifications worker so the request never waits on SMTP
+                    AgreementNotificationService.queue_creation_notification(agreement, request.user)
+
+                if upload_file is not None:
+                    upload_file.upload.delete()
 
-                agreement.save()
-                form.save_m2m()
-                
-                # Ensure creator is in assigned users
-                agreement.assigned_users.add(request.user)
-                
-                # If department exists, add department users
-                if agreement.department:
-                    User = get_user_model()
-                    department_users = User.objects.filter(department=agreement.department)
-                    agreement.assigned_users.add(*department_users)
-                    logger.info(f"Added {department_users.count()} department users to assigned users")
-
-                # Send notification with detailed logging and error handling
-                try:
-                    logger.info(f"Attempting to send notification for agreement {agreement.id}")
-                    logger.info(f"Agreement department: {agreement.department}")
-                    logger.info(f"Assigned users count: {agreement.assigned_users.count()}")
-                    
-                    # Get all users that should be notified
-                    recipients = agreement.get_users_to_notify()
-                    logger.info(f"Found {len(recipients)} potential recipients")
-                    
-                    if recipients:
-                        # Log recipient details for debugging
-                        for recipient in recipients:
-                            logger.info(f"Recipient: {recipient.email} (Department: {recipient.department})")
-                    
-                    notification_sent = AgreementNotificationService.send_creation_notification(agreement, request.user)
-                    
-                    if notification_sent:
-                        logger.info(f"Agreement {agreement.id} saved and notification sent successfully")
-                    else:
-                        logger.warning(f"Agreement {agreement.id} saved but no recipients found for notification")
-                except Exception as notify_error:
-                    logger.error(f"Agreement {agreement.id} saved but failed to send notification: {str(notify_error)}")
-                    # Continue execution - don't let notification failure block agreement creation
-                
                 logger.info(f"Agreement {agreement.id} saved successfully")
                 return Response({
                     'success': True,
@@ -655,6 +532,86 @@ class SubmitAgreementAPIView(APIView):
                 'success': False,
                 'message': f'Error creating agreement: {str(e)}'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        finally:
+            # The part file is kept for a retry when the agreement was not saved
+            if upload_file is not None:
+                upload_file.close()
+
+class ChunkedUploadAPIView(APIView):
+    """
+    Start a resumable upload for a large attachment.
+    Body: filename, size (bytes) and optionally sha256 of the whole file.
+    Chunks are then sent to ChunkedUploadDetailAPIView, and the finished
+    upload is attached by passing upload_id to SubmitAgreementAPIView.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        try:
+            upload = start_upload(
+                request.user,
+                request.data.get('filename', ''),
+                int(request.data.get('size', 0)),
+                sha256=request.data.get('sha256', ''),
+            )
+        except (TypeError, ValueError) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'upload_id': upload.pk,
+            'offset': upload.offset,
+            'chunk_size': getattr(settings, 'CHUNKED_UPLOAD_CHUNK_SIZE', 5 * 1024 * 1024),
+        }, status=status.HTTP_201_CREATED)
+
+
+class ChunkedUploadDetailAPIView(APIView):
+    """
+    GET: offset to resume from.
+    PUT: raw chunk in the body with a 'Content-Range: bytes start-end/total'
+    header. A chunk that does not start at the current offset gets a 409
+    with the offset to resume from.
+    DELETE: cancel the upload.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get_upload(self, request, upload_id):
+        return get_object_or_404(ChunkedUpload, pk=upload_id, user=request.user)
+
+    def upload_state(self, upload):
+        return {
+            'upload_id': upload.pk,
+            'offset': upload.offset,
+            'size': upload.size,
+            'status': upload.status,
+            'sha256': upload.sha256 if upload.status == 'Complete' else '',
+        }
+
+    def get(self, request, upload_id):
+        return Response(self.upload_state(self.get_upload(request, upload_id)))
+
+    def put(self, request, upload_id):
+        upload = self.get_upload(request, upload_id)
+        try:
+            start, end, total = parse_content_range(request.headers.get('Content-Range'))
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+            if total != upload.size or length != end - start + 1:
+                raise ValueError("Content-Range does not match the upload size or the chunk length")
+            # Read the body straight from the request stream, never request.data
+            upload = append_chunk(upload, request._request, start, length)
+        except UploadOffsetError as e:
+            return Response(
+                {'error': str(e), 'offset': e.offset},
+                status=status.HTTP_409_CONFLICT
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(self.upload_state(upload))
+
+    def delete(self, request, upload_id):
+        self.get_upload(request, upload_id).delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 
 class EditAgreementAPIView(APIView):
     """API view for editing agreements - matches path('edit/<int:agreement_id>/', views.edit_agreement)"""
@@ -663,75 +620,44 @@ class EditAgreementAPIView(APIView):
     def get(self, request, agreement_id):
         """Get agreement data for editing"""
         agreement = get_object_or_404(Agreement, id=agreement_id)
-        user = request.user
-        
-        # Check if user is in an executive department
-        is_executive = Department.objects.filter(
-            executive=True,
-            users=user
-        ).exists()
+        access = get_access_context(request)
         
-        if is_executive:
+        if access.is_executive:
             return Response({
                 'error': 'Executive users cannot edit agreements.'
             }, status=status.HTTP_403_FORBIDDEN)
         
         # Check if user has permission to edit
-        has_permission = (
-            user in agreement.assigned_users.all() or
-            (hasattr(user, 'department') and user.department == agreement.department) or
-            DepartmentPermission.objects.filter(
-                user=user,
-                department=agreement.department,
-                permission_type='edit'
-            ).exists()
-        )
-        
-        if not has_permission:
+        if not access.can_edit(agreement):
             return Response({
                 'error': 'You do not have permission to edit this agreement.'
             }, status=status.HTTP_403_FORBIDDEN)
         
-        serializer = AgreementSerializer(agreement)
+        serializer = AgreementSerializer(agreement, context={'request': request})
         return Response(serializer.data)
     
     def put(self, request, agreement_id):
         """Update an existing agreement"""
         agreement = get_object_or_404(Agreement, id=agreement_id)
-        user = request.user
-        
-        # Check if user is in an executive department
-        is_executive = Department.objects.filter(
-            executive=True,
-            users=user
-        ).exists()
+        access = get_access_context(request)
         
-        if is_executive:
+        if access.is_executive:
             return Response({
                 'error': 'Executive users cannot edit agreements.'
             }, status=status.HTTP_403_FORBIDDEN)
         
         # Check if user has permission to edit
-        has_permission = (
-            user in agreement.assigned_users.all() or
-            (hasattr(user, 'department') and user.department == agreement.department) or
-            DepartmentPermission.objects.filter(
-                user=user,
-                department=agreement.department,
-                permission_type='edit'
-            ).exists()
-        )
-        
-        if not has_permission:
+        if not access.can_edit(agreement):
             return Response({
                 'error': 'You do not have permission to edit this agreement.'
             }, status=status.HTTP_403_FORBIDDEN)
         
         serializer = AgreementSerializer(agreement, data=request.data, partial=True)
         if serializer.is_valid():
-            updated_agreement = serializer.save()
-            # Send notification to assigned users
-            AgreementNotificationService.send_update_notification(updated_agreement, request.user)
+            with transaction.atomic():
+                updated_agreement = serializer.save()
+                # Queue notification to assigned users, committed together with the update
+                AgreementNotificationService.queue_update_notification(updated_agreement, request.user)
             return Response({
                 'success': True,
                 'message': 'Agreement updated successfully!',
@@ -829,38 +755,9 @@ class DashboardStatsAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        # Agreement stats
-        today = date.today()
-        three_months = today + timedelta(days=90)
-        # Only include agreements that exist (not deleted)
-        agreements = Agreement.objects.all()
-        # If you have a soft delete field like is_active or deleted, filter here, e.g.:
-        # agreements = agreements.filter(is_active=True)
-        active = agreements.filter(status='Ongoing', expiry_date__gte=today).count()
-        expiring_soon = agreements.filter(status='Ongoing', expiry_date__lte=three_months, expiry_date__gte=today).count()
-        expired = agreements.filter(status='Expired').count()
-
-        # Mock chart data (replace with real aggregation if needed)
-        agreement_dept_data = [
-            { 'name': dept.name, 'value': agreements.filter(department=dept).count() }
-            for dept in Department.objects.filter(executive=False)
-        ]
-        one_month = today + timedelta(days=30)
-        expiry_in_1_month = agreements.filter(expiry_date__gt=today, expiry_date__lte=one_month).count()
-        agreement_status_data = [
-            { 'name': 'Expiry in 6 months', 'value': agreements.filter(expiry_date__lte=today + timedelta(days=180), expiry_date__gt=three_months).count(), 'color': '#2980b9' },
-            { 'name': 'Expiry in 3 months', 'value': expiring_soon, 'color': '#f39c12' },
-            { 'name': 'Expiry within 1 month', 'value': expiry_in_1_month, 'color': '#e67e22' },
-            { 'name': 'Expired', 'value': expired, 'color': '#e74c3c' },
-        ]
-
-        return Response({
-            'active': active,
-            'expiringSoon': expiring_soon,
-            'expired': expired,
-            'agreementDeptData': agreement_dept_data,
-            'agreementStatusData': agreement_status_data,
-        })
+        # Agreement stats, served from a short lived snapshot as the
+        # frontend polls this endpoint
+        return Response(get_dashboard_stats())
 
 
 
@@ -899,24 +796,10 @@ def search_agreements(request):
         agreement_type = request.GET.get('agreement_type', '')
         status = request.GET.get('status', '')
         
-        # Start with all agreements and optimize queries
-        agreements = Agreement.objects.all().select_related(
-            'department', 
-            'agreement_type', 
-            'party_name',  # This is a ForeignKey to Vendor
-            'creator',
-            'parent_agreement'
-        ).prefetch_related('assigned_users')
-        
-        # Apply search term filter (across multiple fields)
+        # Rank by the search index when a search term is given, newest first otherwise
+        agreements = Agreement.objects.order_by('-created_at')
         if search:
-            agreements = agreements.filter(
-                Q(title__icontains=search) |
-                Q(agreement_reference__icontains=search) |
-                Q(remarks__icontains=search) |
-                Q(party_name__name__icontains=search) |  # Retreving vendor name
-                Q(agreement_id__icontains=search)
-            )
+            agreements = search_agreements_queryset(agreements, search)
         
         # Apply additional filters
         if party_name:
@@ -940,10 +823,13 @@ def search_agreements(request):
                 # Handle other status values
                 agreements = agreements.filter(status=status)
         
-        # Serialize and return the results
-        from .serializers import AgreementSerializer
-        serializer = AgreementSerializer(agreements, many=True)
-        return Response(serializer.data)
+        # Serialize and return a page of lean results
+        paginator = AgreementSearchPagination()
+        page = paginator.paginate_queryset(
+            AgreementListRowSerializer.get_list_values(agreements), request
+        )
+        serializer = AgreementListRowSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
     
     except Exception as e:
         import traceback
@@ -75,12 +75,13 @@ CSRF_TRUSTED_ORIGINS = [
 # SESSION_COOKIE_SECURE = True
 
 # Add these to your existing CORS settings
-CORS_EXPOSE_HEADERS = ['Content-Type', 'x-refreshed-token', 'x-exp-time']
+CORS_EXPOSE_HEADERS = ['Content-Type', 'Retry-After', 'x-refreshed-token', 'x-exp-time']
 CORS_ALLOW_HEADERS = [
     'accept',
     'accept-encoding',
     'authorization',
     'content-type',
+    'content-range',
     'dnt',
     'origin',
     'user-agent',
@@ -94,6 +95,38 @@ CORS_ALLOW_HEADERS = [
 FILE_UPLOAD_PERMISSIONS = 0o644
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
+# Stream uploads to temporary files in chunks (hashing them on the way)
+# instead of buffering them in memory
+FILE_UPLOAD_HANDLERS = ['backend.uploadhandlers.HashingTemporaryFileUploadHandler']
+# Resumable chunked uploads for large scanned contracts (see agreements.utils.upload_utils)
+CHUNKED_UPLOAD_DIR = os.path.join(BASE_DIR, 'media', 'chunked_uploads')
+CHUNKED_UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024  # largest accepted chunk, 5MB
+CHUNKED_UPLOAD_MAX_SIZE = 500 * 1024 * 1024  # largest accepted file, 500MB
+CHUNKED_UPLOAD_EXPIRY_HOURS = 24  # unfinished uploads are removed after this
+# Unreferenced attachment blobs are kept this long before collect_blob_garbage deletes them
+BLOB_GC_GRACE_HOURS = 24
+# Attachment downloads: signed download_url links stay valid this long (seconds).
+# When served behind nginx, set the internal location prefix to hand the byte
+# transfer to nginx with X-Accel-Redirect (see frontend/nginx.conf)
+DOWNLOAD_URL_MAX_AGE = 60 * 60
+DOWNLOAD_X_ACCEL_REDIRECT_PREFIX = os.environ.get('DOWNLOAD_X_ACCEL_REDIRECT_PREFIX', '')
+# Server-side letter PDFs (see letters.utils.render_utils), built by the
+# render_letter_pdfs --loop worker: processes rendering at the same time,
+# seconds clients wait between polls (Retry-After), seconds before a render
+# is considered stuck and how many times a failing render is tried
+LETTER_PDF_RENDER_WORKERS = 2
+LETTER_PDF_RETRY_AFTER = 2
+LETTER_PDF_RENDER_TIMEOUT = 5 * 60
+LETTER_PDF_RENDER_MAX_ATTEMPTS = 3
+# Rows fetched and written at a time by the export_db command
+DB_EXPORT_CHUNK_SIZE = 5000
+# Rows per file of the backup command and gzip level of those files
+BACKUP_CHUNK_SIZE = 10000
+BACKUP_COMPRESSLEVEL = 6
+# Incremental backups and exports (export_db --incremental) re-read rows
+# updated this many seconds before the previous run started, to catch rows
+# committed after it read their table
+BACKUP_INCREMENTAL_OVERLAP = 15 * 60
 
 ROOT_URLCONF = 'backend.urls'
 
@@ -127,6 +160,16 @@ DATABASES = {
     }
 }
 
+# Cache shared by every gunicorn worker and management command, so a cached
+# entry dropped by one process (access contexts, dashboard statistics) is
+# gone for all of them. The table is created by `manage.py createcachetable`.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'django_cache',
+    }
+}
+
 AUTH_USER_MODEL = 'accounts.User'
 LOGIN_URL = '/accounts/userLogin/'
 LOGIN_REDIRECT_URL = '/accounts/dashboard/'
@@ -208,12 +251,49 @@ EMAIL_USE_TLS = True
 EMAIL_HOST_USER = 'noreply@sonaliintellect.com'  # Replace with your Office365 email
 EMAIL_HOST_PASSWORD = 'SP4ft@111'         # Replace with your password
 DEFAULT_FROM_EMAIL = 'noreply@sonaliintellect.com'  # Should match EMAIL_HOST_USER
+# Number of emails sent over a single SMTP connection by bulk senders
+EMAIL_BATCH_SIZE = 50
 
 
 # Company Information for Email Templates
 COMPANY_NAME = 'Sonali Intellect Limited'
 #SUPPORT_CONTACT = 'support@sonaliintellect.com'
 
+# Number of due agreements loaded per batch by the nightly reminder job
+REMINDER_BATCH_SIZE = 200
+# Seconds before a reminder claimed by a crashed worker can be claimed again
+REMINDER_CLAIM_TIMEOUT = 15 * 60
+# Attempts per reminder email before it is left as Failed
+REMINDER_MAX_ATTEMPTS = 3
+
+# Agreement notification outbox, drained by `manage.py process_notifications`
+NOTIFICATION_OUTBOX_BATCH_SIZE = 50
+NOTIFICATION_MAX_ATTEMPTS = 5
+# Retry delay in seconds, doubled after every failed attempt up to the max delay
+NOTIFICATION_RETRY_BACKOFF = 60
+NOTIFICATION_RETRY_MAX_DELAY = 60 * 60
+# Seconds before an entry claimed by a crashed worker can be claimed again
+NOTIFICATION_CLAIM_TIMEOUT = 10 * 60
+
+# Seconds a user's agreement access context (executive flag, viewable and
+# editable departments) stays cached. Changes are invalidated through signals,
+# the timeout bounds staleness for changes made without them (bulk updates).
+ACCESS_CONTEXT_CACHE_TIMEOUT = 5 * 60
+
+# Default and maximum page size of the cursor paginated agreement list
+AGREEMENT_LIST_PAGE_SIZE = 50
+AGREEMENT_LIST_MAX_PAGE_SIZE = 500
+# Same for the letter search results
+LETTER_LIST_PAGE_SIZE = 50
+LETTER_LIST_MAX_PAGE_SIZE = 500
+# innodb_ft_min_token_size of the MySQL server. Shorter words are not in the
+# FULLTEXT index, the letter search matches them with LIKE instead.
+FULLTEXT_MIN_TOKEN_SIZE = 3
+
+# Seconds the dashboard statistics snapshot is cached. It is also dropped
+# whenever an agreement or department is saved or deleted.
+DASHBOARD_STATS_CACHE_TIMEOUT = 60
+
 # Frontend URL for links in emails
 FRONTEND_URL = 'http://localhost:5173'  # Change this in production
 
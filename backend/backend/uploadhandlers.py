@@ -0,0 +1,26 @@
+import hashlib
+
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+
+
+class HashingTemporaryFileUploadHandler(TemporaryFileUploadHandler):
+    """
+    Stream every upload to a temporary file on disk, chunk by chunk, and
+    compute its SHA-256 on the way. Memory per request stays bounded by the
+    chunk size whatever the file size, and the storage can move the finished
+    temporary file into place instead of copying it.
+    The digest is available as uploaded_file.sha256.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.hasher = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.hasher.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        uploaded_file = super().file_complete(file_size)
+        uploaded_file.sha256 = self.hasher.hexdigest()
+        return uploaded_file
@@ -1,10 +1,11 @@
+import re
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
-from django.conf.urls.static import static
 
 from agreements import views
-from .views import get_csrf_token
+from .views import get_csrf_token, serve_media
 
 
 
@@ -22,5 +23,8 @@ urlpatterns = [
     path('api/get-csrf/', get_csrf_token),
 ]
 
-# ✅ Media file serving in development only
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# ✅ Media file serving in development only, blobs and chunked uploads stay private
+if settings.DEBUG:
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.*)$' % re.escape(settings.MEDIA_URL.lstrip('/')), serve_media),
+    ]
@@ -1,7 +1,28 @@
+import os
+import posixpath
 
+from django.conf import settings
 from django.views.decorators.csrf import ensure_csrf_cookie
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
+from django.views.static import serve
+
+from accounts.utils.blob_utils import BLOB_PREFIX
 
 @ensure_csrf_cookie
 def get_csrf_token(request):
-    return JsonResponse({'detail': 'CSRF cookie set'})
\ No newline at end of file
+    return JsonResponse({'detail': 'CSRF cookie set'})
+
+
+def serve_media(request, path):
+    """
+    Development (DEBUG) media server. The blob store and chunked upload parts
+    are left out, they are only handed out by the permission checked views.
+    """
+    private_dirs = [
+        BLOB_PREFIX.rstrip('/'),
+        os.path.relpath(settings.CHUNKED_UPLOAD_DIR, settings.MEDIA_ROOT).replace(os.sep, '/'),
+    ]
+    path = posixpath.normpath(path).lstrip('/')
+    if any(path == directory or path.startswith(f'{directory}/') for directory in private_dirs):
+        raise Http404
+    return serve(request, path, document_root=settings.MEDIA_ROOT)
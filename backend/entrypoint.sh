@@ -14,6 +14,10 @@ echo "Database is up!"
 echo "Applying database migrations..."
 #python manage.py migrate --noinput
 
+# Shared cache table (see CACHES), nothing is done when it exists
+echo "Creating cache table..."
+python manage.py createcachetable
+
 echo "Collecting static files..."
 python manage.py collectstatic --noinput
 
@@ -0,0 +1,108 @@
+# management/commands/benchmark_reference_allocator.py
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from letters.models import ReferenceCounter
+from letters.utils.reference_utils import allocate_reference_number
+
+MODES = ('inline', 'independent')
+
+
+class Command(BaseCommand):
+    help = (
+        'Stress tests the letter reference number allocator with concurrent creators. '
+        'Run it against the production database engine, sqlite serialises every writer.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=8,
+            help='Number of concurrent creators'
+        )
+        parser.add_argument(
+            '--letters',
+            type=int,
+            default=50,
+            help='Number of reference numbers allocated by each creator'
+        )
+        parser.add_argument(
+            '--hold-ms',
+            type=int,
+            default=20,
+            help='Time spent in the creation transaction per letter, standing in for attachment writes'
+        )
+        parser.add_argument(
+            '--mode',
+            choices=MODES + ('both',),
+            default='both',
+            help='inline: allocate inside the creation transaction (previous behaviour), '
+                 'independent: allocate in its own short transaction first (LetterCreateView)'
+        )
+        parser.add_argument(
+            '--year',
+            type=int,
+            default=9999,
+            help='Scratch counter year used by the benchmark, deleted afterwards'
+        )
+
+    def handle(self, *args, **options):
+        year = options['year']
+        if ReferenceCounter.objects.filter(year=year).exists():
+            raise CommandError(f"A reference counter for {year} already exists, pick another --year")
+
+        modes = MODES if options['mode'] == 'both' else (options['mode'],)
+        try:
+            for mode in modes:
+                self.run_mode(mode, year, options['workers'], options['letters'], options['hold_ms'] / 1000)
+                ReferenceCounter.objects.filter(year=year).delete()
+        finally:
+            ReferenceCounter.objects.filter(year=year).delete()
+
+    def run_mode(self, mode, year, workers, letters, hold):
+        numbers = []
+        errors = []
+        lock = threading.Lock()
+
+        def create_letters():
+            allocated = []
+            try:
+                for _ in range(letters):
+                    if mode == 'inline':
+                        with transaction.atomic():
+                            allocated.append(allocate_reference_number(year))
+                            time.sleep(hold)
+                    else:
+                        allocated.append(allocate_reference_number(year))
+                        with transaction.atomic():
+                            time.sleep(hold)
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+            finally:
+                # Each thread gets its own connection, close it before leaving
+                connection.close()
+                with lock:
+                    numbers.extend(allocated)
+
+        threads = [threading.Thread(target=create_letters) for _ in range(workers)]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        duplicates = len(numbers) - len(set(numbers))
+        gaps = (max(numbers) - len(set(numbers))) if numbers else 0
+        self.stdout.write(
+            f"{mode}: {len(numbers)} numbers from {workers} creators in {elapsed:.2f}s "
+            f"({len(numbers) / elapsed:.1f}/s), {duplicates} duplicates, {gaps} gaps"
+        )
+        for error in errors:
+            self.stderr.write(f"{mode}: {error}")
+        if duplicates:
+            raise CommandError(f"{mode}: allocator handed out {duplicates} duplicate numbers")
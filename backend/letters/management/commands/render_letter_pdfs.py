@@ -0,0 +1,66 @@
+# management/commands/render_letter_pdfs.py
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from letters.utils.render_utils import render_pending_letters
+
+class Command(BaseCommand):
+    help = 'Renders pending letter PDFs and retries failed ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=None,
+            help='Largest number of letters rendered per pass'
+        )
+        parser.add_argument(
+            '--worker',
+            type=str,
+            default=None,
+            help='Name recorded on claimed renders (defaults to host:pid)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=getattr(settings, 'LETTER_PDF_RENDER_WORKERS', 2),
+            help='Number of letters rendered at the same time (separate processes, 1 renders in this process)'
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep polling for renders instead of exiting once none are left'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=2.0,
+            help='Seconds to wait between polls in --loop mode'
+        )
+
+    def handle(self, *args, **options):
+        if options['workers'] > 1 and connections['default'].vendor == 'sqlite':
+            # SQLite allows a single writer
+            self.stdout.write('SQLite database, rendering one letter at a time.')
+            options['workers'] = 1
+        if options['workers'] == 1:
+            self.render(options)
+            return
+        # The pool is kept for the whole run, PDFs are CPU bound so each
+        # render gets a process of its own
+        with ProcessPoolExecutor(options['workers'], mp_context=multiprocessing.get_context('fork')) as executor:
+            self.render(options, executor)
+
+    def render(self, options, executor=None):
+        while True:
+            stats = render_pending_letters(worker=options['worker'], limit=options['limit'], executor=executor)
+            if stats['rendered'] or stats['failed'] or not options['loop']:
+                self.stdout.write(
+                    f"Letter PDFs rendered: {stats['rendered']}, failed: {stats['failed']}."
+                )
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
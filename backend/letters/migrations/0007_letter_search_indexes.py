@@ -0,0 +1,48 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+FULLTEXT_INDEX = 'letters_letter_subject_body_ft'
+
+
+def create_fulltext_index(apps, schema_editor):
+    # FULLTEXT indexes are MySQL specific, other backends fall back to LIKE
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute(
+            f"CREATE FULLTEXT INDEX {FULLTEXT_INDEX} ON letters_letter (subject, body)"
+        )
+
+
+def drop_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute(f"DROP INDEX {FULLTEXT_INDEX} ON letters_letter")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0008_delete_oldvendor'),
+        ('letters', '0006_alter_letter_organization_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='letter',
+            index=models.Index(fields=['reference_number'], name='letters_let_referen_ce6938_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='letter',
+            index=models.Index(fields=['subject'], name='letters_let_subject_3ec3b5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='letter',
+            index=models.Index(fields=['created_at'], name='letters_let_created_abe96f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='letter',
+            index=models.Index(fields=['category', 'created_at'], name='letters_let_categor_303b3e_idx'),
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
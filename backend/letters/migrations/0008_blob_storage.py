@@ -0,0 +1,24 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:19
+
+import accounts.utils.blob_utils
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('letters', '0007_letter_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='additionalletterattachment',
+            name='file',
+            field=models.FileField(storage=accounts.utils.blob_utils.get_blob_storage, upload_to='letter_attachments/%Y/%m/%d/'),
+        ),
+        migrations.AlterField(
+            model_name='letterfile',
+            name='document',
+            field=models.FileField(storage=accounts.utils.blob_utils.get_blob_storage, upload_to='letter_documents/%Y/%m/%d/'),
+        ),
+    ]
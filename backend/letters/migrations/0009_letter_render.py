@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:26
+
+import accounts.utils.blob_utils
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('letters', '0008_blob_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LetterRender',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64)),
+                ('status', models.CharField(choices=[('Pending', 'Pending'), ('Rendering', 'Rendering'), ('Complete', 'Complete'), ('Failed', 'Failed')], default='Pending', max_length=10)),
+                ('pdf', models.FileField(blank=True, storage=accounts.utils.blob_utils.get_blob_storage, upload_to='letter_renders/')),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('claimed_by', models.CharField(blank=True, max_length=100)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('rendered_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('letter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='renders', to='letters.letter')),
+            ],
+            options={
+                'unique_together': {('letter', 'content_hash')},
+            },
+        ),
+    ]
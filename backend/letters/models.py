@@ -1,8 +1,9 @@
 from django.utils import timezone
 from django.db import models
 from django.core.exceptions import ValidationError
-from django.db import transaction
 from accounts.models import User, Signatory, Organization, Recipient
+from accounts.utils.blob_utils import get_blob_storage, track_blob_references
+from .utils.reference_utils import allocate_reference_number
 
 class Category(models.Model):
     name = models.CharField(max_length=10, unique=True)
@@ -88,6 +89,14 @@ class Letter(models.Model):
         default=''  # Add default to handle existing records
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['reference_number']),
+            models.Index(fields=['subject']),
+            models.Index(fields=['created_at']),
+            models.Index(fields=['category', 'created_at']),
+        ]
+
     def __str__(self):
         return self.reference_number or f"Letter to {self.recipient.name} - {self.subject}"
     
@@ -119,32 +128,19 @@ class Letter(models.Model):
         # Get category name (using Category model's name field)
         category_name = self.category.name.upper()
         
-        # Use database transaction to prevent race conditions
-        with transaction.atomic():
-            # Get or create counter for current year and organization
-            counter, created = ReferenceCounter.objects.select_for_update().get_or_create(
-                # organization=self.organization,
-                year=current_year,
-                defaults={'last_number': 0}
-            )
-            
-            # Increment the counter
-            counter.last_number += 1
-            counter.save()
-            
-            # Format the incremental number with leading zeros
-            incremental_number = str(counter.last_number).zfill(4)
-            
-            # Build the reference number
-            reference_number = (
-                f"{sender_short_form}/"
-                f"{recipient_org_short_form}/"
-                f"{category_name}/"
-                f"{current_year}/"
-                f"{incremental_number}"
-            )
-            
-            return reference_number
+        # Reserve the next number with a single atomic counter update
+        incremental_number = str(allocate_reference_number(current_year)).zfill(4)
+        
+        # Build the reference number
+        reference_number = (
+            f"{sender_short_form}/"
+            f"{recipient_org_short_form}/"
+            f"{category_name}/"
+            f"{current_year}/"
+            f"{incremental_number}"
+        )
+        
+        return reference_number
         
 
     @classmethod
@@ -225,7 +221,7 @@ class Letter(models.Model):
 
 class LetterFile(models.Model):
     letter = models.ForeignKey(Letter, on_delete=models.CASCADE, related_name='documents')
-    document = models.FileField(upload_to='letter_documents/%Y/%m/%d/')
+    document = models.FileField(upload_to='letter_documents/%Y/%m/%d/', storage=get_blob_storage)
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -263,7 +259,7 @@ class AdditionalLetterAttachment(models.Model):
         on_delete=models.CASCADE, 
         related_name='attachments'
     )
-    file = models.FileField(upload_to='letter_attachments/%Y/%m/%d/')
+    file = models.FileField(upload_to='letter_attachments/%Y/%m/%d/', storage=get_blob_storage)
     title = models.CharField(max_length=155, blank=True, null=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     file_size = models.PositiveIntegerField(editable=False, null=True)
@@ -276,12 +272,13 @@ class AdditionalLetterAttachment(models.Model):
     def __str__(self):
         return self.title or f"Attachment for {self.letter.reference_number}"
     
-    def save(self, *args, **kwargs):
-        # Auto-calculate file size and type before saving
+    def set_file_metadata(self):
+        """Fill file size, type and default title from the file (also used before bulk_create)"""
+        import os
+        # Auto-calculate file size and type
         if self.file:
             self.file_size = self.file.size
             # Extract file extension
-            import os
             filename = self.file.name
             ext = os.path.splitext(filename)[1].lower()
             self.file_type = ext[1:] if ext else 'unknown'
@@ -289,7 +286,9 @@ class AdditionalLetterAttachment(models.Model):
         # Auto-generate title from filename if not provided
         if not self.title and self.file:
             self.title = os.path.basename(self.file.name)
-            
+
+    def save(self, *args, **kwargs):
+        self.set_file_metadata()
         super().save(*args, **kwargs)
     
     @property
@@ -302,3 +301,42 @@ class AdditionalLetterAttachment(models.Model):
                     return f"{size:.1f} {unit}"
                 size /= 1024.0
         return "0 B"
+
+
+class LetterRender(models.Model):
+    """
+    Server-side PDF of a letter. One row per letter and content hash, so a
+    letter is rendered once per version and the PDF is reused until the
+    letter or one of its related rows changes (see letters.utils.render_utils).
+    """
+    RENDER_STATUS = (
+        ('Pending', 'Pending'),
+        ('Rendering', 'Rendering'),
+        ('Complete', 'Complete'),
+        ('Failed', 'Failed'),
+    )
+
+    letter = models.ForeignKey(Letter, on_delete=models.CASCADE, related_name='renders')
+    content_hash = models.CharField(max_length=64)
+    status = models.CharField(max_length=10, choices=RENDER_STATUS, default='Pending')
+    pdf = models.FileField(upload_to='letter_renders/', storage=get_blob_storage, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    claimed_by = models.CharField(max_length=100, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    rendered_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('letter', 'content_hash')
+
+    def __str__(self):
+        return f"PDF of letter {self.letter_id} ({self.status})"
+
+
+# Documents and attachments live in the shared blob store, the files are
+# removed by collect_blob_garbage once no row points at them
+track_blob_references(LetterFile, 'document')
+track_blob_references(AdditionalLetterAttachment, 'file')
+track_blob_references(LetterRender, 'pdf')
@@ -0,0 +1,10 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class LetterCursorPagination(CursorPagination):
+    """Cursor pagination for the letter registry, newest first."""
+    ordering = '-created_at'
+    page_size = getattr(settings, 'LETTER_LIST_PAGE_SIZE', 50)
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'LETTER_LIST_MAX_PAGE_SIZE', 500)
@@ -1,4 +1,7 @@
+from django.db.models import F, Prefetch
+from django.urls import reverse
 from rest_framework import serializers
+from accounts.utils.download_utils import get_download_url
 from .models import Category, Letter, Organization, Recipient, Signatory, LetterCopyRecipient, AdditionalLetterAttachment, LetterReferences, LetterFile
 from accounts.models import User
 
@@ -30,12 +33,16 @@ class SignatorySerializer(serializers.ModelSerializer):
 
 
 class LetterAttachmentSerializer(serializers.ModelSerializer):
+    download_url = serializers.SerializerMethodField()
     
     class Meta:
         model = AdditionalLetterAttachment
-        fields = ['title', 'file', 'uploaded_at']
+        fields = ['title', 'file', 'uploaded_at', 'download_url']
         read_only_fields = ('id', 'file_size', 'file_type', 'uploaded_at')
 
+    def get_download_url(self, obj):
+        return get_download_url(self.context.get('request'), reverse('letter-attachment-download', args=[obj.pk]))
+
 
 class LetterSaveCopyRecipientSerializer(serializers.ModelSerializer):
         class Meta:
@@ -88,11 +95,56 @@ class LetterReferenceSerializer(serializers.ModelSerializer):
         model = LetterReferences
         fields = '__all__'
 class LetterFileSerializer(serializers.ModelSerializer):
+    download_url = serializers.SerializerMethodField()
+
     class Meta:
         model = LetterFile
-        fields = ['id', 'document', 'uploaded_at']
+        fields = ['id', 'document', 'uploaded_at', 'download_url']
         read_only_fields = ('id', 'uploaded_at')
 
+    def get_download_url(self, obj):
+        return get_download_url(self.context.get('request'), reverse('letter-document-download', args=[obj.pk]))
+
+class LetterSearchRowSerializer(serializers.Serializer):
+    """
+    Lean letter row for search results, built from QuerySet.values()
+    (see get_list_values) instead of nested model serializers.
+    """
+    # Output name -> ORM lookup used to fetch it
+    LIST_FIELDS = {
+        'id': 'id',
+        'reference_number': 'reference_number',
+        'subject': 'subject',
+        'created_at': 'created_at',
+        'category': 'category',
+        'category_name': 'category__name',
+        'recipient': 'recipient',
+        'recipient_name': 'recipient__fullName',
+        'recipient_organization': 'recipient__organization',
+        'recipient_organization_name': 'recipient__organization__name',
+        'recipient_organization_short_form': 'recipient__organization__short_form',
+    }
+
+    id = serializers.IntegerField(read_only=True)
+    reference_number = serializers.CharField(read_only=True)
+    subject = serializers.CharField(read_only=True)
+    created_at = serializers.DateTimeField(read_only=True)
+    category = serializers.IntegerField(read_only=True)
+    category_name = serializers.CharField(read_only=True)
+    recipient = serializers.IntegerField(read_only=True)
+    recipient_name = serializers.CharField(read_only=True)
+    recipient_organization = serializers.IntegerField(read_only=True)
+    recipient_organization_name = serializers.CharField(read_only=True)
+    recipient_organization_short_form = serializers.CharField(read_only=True)
+
+    @classmethod
+    def get_list_values(cls, queryset):
+        return queryset.values(
+            *[name for name, lookup in cls.LIST_FIELDS.items() if name == lookup],
+            **{name: F(lookup) for name, lookup in cls.LIST_FIELDS.items() if name != lookup}
+        )
+
+
 class LetterListSerializer(serializers.ModelSerializer):
     organization = OrganizationSerializer(read_only=True)
     recipient = RecipientSerializer(read_only=True)
@@ -105,6 +157,16 @@ class LetterListSerializer(serializers.ModelSerializer):
         model = Letter
         fields = ['id', 'reference_number', 'organization', 'recipient', 'category', 'signatory', 'created_at', 'attachments', 'documents']
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """Load every relation used by this serializer up front."""
+        return queryset.select_related(
+            'organization',
+            'recipient__organization',
+            'category',
+            'signatory__email__designation',
+        ).prefetch_related('attachments', 'documents')
+
 
 
 
@@ -125,6 +187,25 @@ class LetterDetailSerializer(serializers.ModelSerializer):
         fields = '__all__'  # This ensures subject and body are included
         read_only_fields = ('reference_number', 'created_at', 'updated_at', 'created_by')
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """Load every relation used by this serializer up front."""
+        references = LetterReferences.objects.select_related('internal_reference_number')
+        return queryset.select_related(
+            'organization',
+            'recipient__organization',
+            'category',
+            'signatory__email__designation',
+        ).prefetch_related(
+            Prefetch(
+                'cc_recipients',
+                queryset=LetterCopyRecipient.objects.select_related('recipient__organization', 'MyOrgRecipient')
+            ),
+            'attachments',
+            Prefetch('references', queryset=references),
+            Prefetch('internal_references', queryset=references),
+        )
+
 
 class LetterFileSerializer(serializers.ModelSerializer):
     class Meta:
@@ -1,3 +1,393 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta
 
-# Create your tests here.
+from unittest import skipUnless
+
+from django.db import connection
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.models import Department, Organization, Recipient, Signatory, StoredBlob, User
+from accounts.utils.blob_utils import collect_blob_garbage, get_blob_storage, reconcile_blob_references
+from .models import Category, Letter, LetterCopyRecipient, LetterReferences, LetterRender, ReferenceCounter
+from .utils.reference_utils import allocate_reference_numbers
+from .utils.render_utils import render_pending_letters
+
+
+class LetterSearchTests(TestCase):
+
+    def setUp(self):
+        department = Department.objects.create(name='IT')
+        self.user = User.objects.create(email='user@example.com', full_name='User', department=department)
+        self.own_org = Organization.objects.create(name='Sonali Intellect', short_form='SIL', address='Dhaka')
+        self.bank = Organization.objects.create(name='Central Bank', short_form='CB', address='Dhaka')
+        self.ministry = Organization.objects.create(name='Ministry', short_form='MIN', address='Dhaka')
+        self.category = Category.objects.create(name='GEN')
+        self.bank_recipient = Recipient.objects.create(
+            fullName='Bank Officer', email='officer@bank.example', organization=self.bank, designation='Officer'
+        )
+        self.ministry_recipient = Recipient.objects.create(
+            fullName='Secretary', email='secretary@ministry.example', organization=self.ministry, designation='Secretary'
+        )
+        self.create_letter(self.bank_recipient, 'Server maintenance window', 'Planned downtime', (2025, 1, 10))
+        self.create_letter(self.bank_recipient, 'Invoice', 'Payment for server hosting', (2025, 2, 10))
+        self.create_letter(self.ministry_recipient, 'Annual report', 'Report attached', (2025, 3, 10))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_letter(self, recipient, subject, body, day):
+        return Letter.objects.create(
+            organization=self.own_org,
+            created_by=self.user,
+            recipient=recipient,
+            category=self.category,
+            subject=subject,
+            body=body,
+            created_at=timezone.make_aware(datetime(*day, 12)),
+        )
+
+    def search(self, **params):
+        response = self.client.get('/api/letters/search/', params)
+        self.assertEqual(response.status_code, 200)
+        return [row['subject'] for row in response.data['results']]
+
+    def test_text_search_matches_subject_and_body(self):
+        self.assertEqual(self.search(q='server'), ['Invoice', 'Server maintenance window'])
+        self.assertEqual(self.search(q='server payment'), ['Invoice'])
+
+    def test_reference_prefix(self):
+        self.assertEqual(self.search(reference='SIL/MIN/'), ['Annual report'])
+
+    def test_organization_and_date_range(self):
+        self.assertEqual(self.search(organization=self.bank.pk, date_to='2025-01-10'), ['Server maintenance window'])
+        self.assertEqual(self.search(date_from='2025-02-10'), ['Annual report', 'Invoice'])
+
+    def test_invalid_date(self):
+        response = self.client.get('/api/letters/search/', {'date_from': '10/02/2025'})
+        self.assertEqual(response.status_code, 400)
+
+
+@skipUnless(connection.vendor == 'mysql', 'FULLTEXT search is MySQL only')
+class LetterFulltextSearchTests(TransactionTestCase):
+    """InnoDB adds rows to the FULLTEXT index on commit, so no TestCase transaction here."""
+
+    setUp = LetterSearchTests.setUp
+    create_letter = LetterSearchTests.create_letter
+    search = LetterSearchTests.search
+
+    def test_short_words_are_matched_outside_the_index(self):
+        self.create_letter(self.bank_recipient, 'IT budget', 'Budget for IT equipment', (2025, 4, 10))
+        self.assertEqual(self.search(q='budget'), ['IT budget'])
+        # "it" and "re" are shorter than innodb_ft_min_token_size
+        self.assertEqual(self.search(q='it budget'), ['IT budget'])
+        self.assertEqual(self.search(q='it'), ['IT budget'])
+        self.assertEqual(self.search(q='annual re'), ['Annual report'])
+
+
+class LetterListQueryCountTests(TestCase):
+    """The letter list and detail endpoints must not issue queries per row."""
+
+    def setUp(self):
+        department = Department.objects.create(name='IT')
+        self.user = User.objects.create(email='user@example.com', full_name='User', department=department)
+        self.own_org = Organization.objects.create(name='Sonali Intellect', short_form='SIL', address='Dhaka')
+        self.bank = Organization.objects.create(name='Central Bank', short_form='CB', address='Dhaka')
+        self.category = Category.objects.create(name='GEN')
+        self.signatory = Signatory.objects.create(email=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.previous = None
+
+    def create_letters(self, count):
+        for i in range(count):
+            recipient = Recipient.objects.create(
+                fullName=f'Officer {i}', email=f'officer{Recipient.objects.count()}@bank.example',
+                organization=self.bank, designation='Officer'
+            )
+            letter = Letter.objects.create(
+                organization=self.own_org,
+                created_by=self.user,
+                recipient=recipient,
+                category=self.category,
+                signatory=self.signatory,
+                subject=f'Letter {i}',
+                body='Body',
+            )
+            LetterCopyRecipient.objects.create(letter=letter, recipient=recipient)
+            LetterCopyRecipient.objects.create(letter=letter, MyOrgRecipient=self.user)
+            LetterReferences.objects.create(letter=letter, external_reference_number='EXT/1')
+            if self.previous:
+                LetterReferences.objects.create(letter=letter, internal_reference_number=self.previous)
+            self.previous = letter
+        return letter
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_list_query_count_is_constant(self):
+        self.create_letters(2)
+        small = self.count_queries('/api/letters/')
+        self.create_letters(8)
+        self.assertEqual(self.count_queries('/api/letters/'), small)
+
+    def test_detail_query_count_is_constant(self):
+        self.create_letters(1)
+        small = self.count_queries(f'/api/letters/{self.previous.pk}/')
+        letter = self.create_letters(1)
+        for _ in range(5):
+            LetterCopyRecipient.objects.create(letter=letter, MyOrgRecipient=self.user)
+            LetterReferences.objects.create(letter=letter, internal_reference_number=self.previous)
+        self.assertEqual(self.count_queries(f'/api/letters/{letter.pk}/'), small)
+
+
+class LetterCreateQueryCountTests(TestCase):
+    """Creating a letter must cost the same whatever the number of CCs and references."""
+
+    def setUp(self):
+        department = Department.objects.create(name='IT')
+        self.user = User.objects.create(email='user@example.com', full_name='User', department=department)
+        self.own_org = Organization.objects.create(name='Sonali Intellect', short_form='SIL', address='Dhaka')
+        self.bank = Organization.objects.create(name='Central Bank', short_form='CB', address='Dhaka')
+        self.category = Category.objects.create(name='GEN')
+        self.recipient = Recipient.objects.create(
+            fullName='Bank Officer', email='officer@bank.example', organization=self.bank, designation='Officer'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_letter(self, cc_count, reference_count):
+        for i in range(cc_count):
+            User.objects.create(email=f'cc{User.objects.count()}@example.com', full_name='Copy Holder', department=self.user.department)
+        reference_numbers = list(
+            Letter.objects.order_by('-id').values_list('reference_number', flat=True)[:reference_count]
+        )
+        data = {
+            'organization': self.own_org.pk,
+            'recipient': self.recipient.pk,
+            'category': self.category.pk,
+            'subject': 'Subject',
+            'body': 'Body',
+            'copyMyOrg': 'Copy Holder',
+            'internalReferences': reference_numbers + ['SIL/UNKNOWN/0001'],
+            'externalReferences': [f'EXT/{i}' for i in range(reference_count)],
+        }
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/letters/create/', data, format='multipart')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data, len(queries)
+
+    def test_create_query_count_is_constant(self):
+        for _ in range(6):
+            Letter.objects.create(
+                organization=self.own_org, created_by=self.user, recipient=self.recipient,
+                category=self.category, subject='Earlier', body='Body'
+            )
+        small, small_queries = self.create_letter(cc_count=1, reference_count=1)
+        self.assertEqual(len(small['cc_recipients']), 1)
+        self.assertEqual(len(small['references']), 2)
+        Letter.objects.filter(subject='Subject').update(subject='Earlier')
+
+        large, large_queries = self.create_letter(cc_count=5, reference_count=5)
+        self.assertEqual(len(large['cc_recipients']), 6)
+        self.assertEqual(len(large['references']), 10)
+        self.assertEqual(large_queries, small_queries)
+
+    def test_cc_recipients_are_matched_by_full_name(self):
+        Recipient.objects.create(
+            fullName='Bank Auditor', email='auditor@bank.example', organization=self.bank, designation='Auditor'
+        )
+        Recipient.objects.create(
+            fullName='Internal Auditor', email='auditor@sil.example', organization=self.own_org, designation='Auditor'
+        )
+        response = self.client.post('/api/letters/create/', {
+            'organization': self.own_org.pk,
+            'recipient': self.recipient.pk,
+            'category': self.category.pk,
+            'subject': 'Subject',
+            'body': 'Body',
+            'copySameOrg': 'auditor',
+            'copyOtherOrg': 'auditor',
+        }, format='multipart')
+        self.assertEqual(response.status_code, 201, response.data)
+        copied = LetterCopyRecipient.objects.filter(letter_id=response.data['id'])
+        self.assertEqual(
+            sorted(copied.values_list('recipient__email', flat=True)),
+            ['auditor@bank.example', 'auditor@sil.example']
+        )
+
+
+class ReferenceAllocatorTests(TestCase):
+
+    def test_blocks_are_consecutive_and_distinct(self):
+        self.assertEqual(list(allocate_reference_numbers(2030, 3)), [1, 2, 3])
+        self.assertEqual(list(allocate_reference_numbers(2030, 2)), [4, 5])
+        self.assertEqual(list(allocate_reference_numbers(2031)), [1])
+        self.assertEqual(ReferenceCounter.objects.get(year=2030).last_number, 5)
+
+    def test_letter_reference_uses_counter(self):
+        department = Department.objects.create(name='IT')
+        user = User.objects.create(email='user@example.com', full_name='User', department=department)
+        own_org = Organization.objects.create(name='Sonali Intellect', short_form='SIL', address='Dhaka')
+        bank = Organization.objects.create(name='Central Bank', short_form='CB', address='Dhaka')
+        recipient = Recipient.objects.create(
+            fullName='Bank Officer', email='officer@bank.example', organization=bank, designation='Officer'
+        )
+        category = Category.objects.create(name='gen')
+        allocate_reference_numbers(2025, 4)
+        self.assertEqual(
+            Letter.get_tentative_reference_number(own_org.pk, recipient.pk, category.pk, '2025-06-01'),
+            'SIL/CB/GEN/2025/0005'
+        )
+        letter = Letter.objects.create(
+            organization=own_org, created_by=user, recipient=recipient, category=category,
+            subject='Subject', body='Body', created_at=timezone.make_aware(datetime(2025, 6, 1, 12)),
+        )
+        self.assertEqual(letter.reference_number, 'SIL/CB/GEN/2025/0005')
+
+
+class AttachmentBlobStoreTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        department = Department.objects.create(name='IT')
+        self.user = User.objects.create(email='user@example.com', full_name='User', department=department)
+        self.own_org = Organization.objects.create(name='Sonali Intellect', short_form='SIL', address='Dhaka')
+        self.bank = Organization.objects.create(name='Central Bank', short_form='CB', address='Dhaka')
+        self.category = Category.objects.create(name='GEN')
+        self.recipient = Recipient.objects.create(
+            fullName='Bank Officer', email='officer@bank.example', organization=self.bank, designation='Officer'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def create_letter(self, *annexes):
+        response = self.client.post('/api/letters/create/', {
+            'organization': self.own_org.pk,
+            'recipient': self.recipient.pk,
+            'category': self.category.pk,
+            'subject': 'Subject',
+            'body': 'Body',
+            'attachments': [SimpleUploadedFile(name, content) for name, content in annexes],
+        }, format='multipart')
+        self.assertEqual(response.status_code, 201, response.data)
+        return Letter.objects.get(pk=response.data['id'])
+
+    def stored_files(self):
+        return sorted(
+            os.path.join(root, name)
+            for root, _, names in os.walk(os.path.join(self.media_root, 'blobs')) for name in names
+        )
+
+    def test_identical_annexes_are_stored_once(self):
+        first = self.create_letter(('annex.pdf', b'annex'), ('other.pdf', b'other'))
+        second = self.create_letter(('copy of annex.pdf', b'annex'))
+        self.assertEqual(len(self.stored_files()), 2)
+        self.assertEqual(
+            first.attachments.get(title='annex.pdf').file.name, second.attachments.get().file.name
+        )
+        blob = StoredBlob.objects.get(name=second.attachments.get().file.name)
+        self.assertEqual(blob.ref_count, 2)
+
+        first.delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 1)
+        self.assertEqual(collect_blob_garbage(grace_hours=0), (1, len(b'other')))
+        self.assertEqual(len(self.stored_files()), 1)
+        with second.attachments.get().file.open('rb') as f:
+            self.assertEqual(f.read(), b'annex')
+
+        second.delete()
+        self.assertEqual(collect_blob_garbage(grace_hours=0), (1, len(b'annex')))
+        self.assertEqual(self.stored_files(), [])
+        self.assertEqual(reconcile_blob_references(), 0)
+
+    def test_reused_blob_restarts_grace_period(self):
+        letter = self.create_letter(('annex.pdf', b'annex'))
+        name = letter.attachments.get().file.name
+        letter.delete()
+        StoredBlob.objects.filter(name=name).update(updated_at=timezone.now() - timedelta(days=2))
+
+        # Stored again by an upload whose row is not committed yet
+        self.assertEqual(get_blob_storage().save('annex.pdf', ContentFile(b'annex')), name)
+        self.assertEqual(collect_blob_garbage(grace_hours=24), (0, 0))
+        self.assertEqual(len(self.stored_files()), 1)
+
+    def test_annex_download_uses_title(self):
+        letter = self.create_letter(('annex.pdf', b'annex'))
+        attachment = letter.attachments.get()
+        response = self.client.get(f'/api/letters/attachments/{attachment.pk}/download/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'annex')
+        self.assertIn('annex.pdf', response['Content-Disposition'])
+
+
+class LetterPDFTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        department = Department.objects.create(name='IT')
+        self.user = User.objects.create(email='user@example.com', full_name='User', department=department)
+        own_org = Organization.objects.create(name='Sonali Intellect', short_form='SIL', address='Dhaka')
+        bank = Organization.objects.create(name='Central Bank', short_form='CB', address='Dhaka')
+        recipient = Recipient.objects.create(
+            fullName='Bank Officer', email='officer@bank.example', organization=bank, designation='Officer'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        response = self.client.post('/api/letters/create/', {
+            'organization': own_org.pk,
+            'recipient': recipient.pk,
+            'category': Category.objects.create(name='GEN').pk,
+            'subject': 'Account <b>opening</b>',
+            'body': '<p>Dear Sir,</p><ul><li>first &amp; <strong>bold</li><li>second</li></ul><p>Regards</p>',
+            'use_digital_letterhead': True,
+            'use_cc_name': True,
+            'copyMyOrg': 'User',
+            'externalReferences': ['EXT/1'],
+            'attachments': [SimpleUploadedFile('annex.pdf', b'annex')],
+        }, format='multipart')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.letter = Letter.objects.get(pk=response.data['id'])
+        self.url = f'/api/letters/{self.letter.pk}/pdf/'
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_pdf_is_rendered_once_per_version(self):
+        # Creating the letter queued its render
+        self.assertEqual(LetterRender.objects.get().status, 'Pending')
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response['Retry-After'], '2')
+
+        self.assertEqual(render_pending_letters(), {'rendered': 1, 'failed': 0})
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(render_pending_letters(), {'rendered': 0, 'failed': 0})
+
+        # A change to a related row is a new version
+        LetterReferences.objects.create(letter=self.letter, external_reference_number='EXT/2')
+        self.assertEqual(self.client.get(self.url).status_code, 202)
+        self.assertEqual(render_pending_letters(), {'rendered': 1, 'failed': 0})
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertEqual(LetterRender.objects.count(), 1)
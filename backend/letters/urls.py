@@ -15,9 +15,12 @@ urlpatterns = [
     path('<int:pk>/preview/', views.LetterPreviewAPIView.as_view(), name='letter-preview'),
     path('<int:pk>/pdf/', views.LetterPDFAPIView.as_view(), name='letter-pdf'),
     path('create/', views.LetterCreateView.as_view(), name='letter-create'),
+    path('search/', views.LetterSearchAPIView.as_view(), name='letter-search'),
     path('cc/same-organization/', views.CCSameOrgListView.as_view(), name='cc-same-organization-list'),
     path('cc/other-organization/', views.CCOtherOrgListView.as_view(), name='cc-other-organization-list'),
     path('internal-references/', views.InternalReferencesListView.as_view(), name='internal-references-list'),
     path('next-reference/', views.NextReferenceNumberAPIView.as_view(), name='next-reference'),
+    path('attachments/<int:pk>/download/', views.LetterAttachmentDownloadAPIView.as_view(), name='letter-attachment-download'),
+    path('documents/<int:pk>/download/', views.LetterDocumentDownloadAPIView.as_view(), name='letter-document-download'),
     path('letter_file/', views.LetterFileSaveView.as_view(), name='letter-file-upload-list'),
 ] + router.urls
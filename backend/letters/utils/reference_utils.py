@@ -0,0 +1,48 @@
+import logging
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+
+def allocate_reference_numbers(year, count=1):
+    """
+    Reserve count consecutive reference numbers for a year and return them
+    as a range.
+
+    The counter row is bumped with a single UPDATE ... SET last_number =
+    last_number + count, so its lock is held only for that statement and the
+    read that follows, and each caller gets a distinct block.
+
+    To keep that lock short, call this outside of any long transaction (see
+    LetterCreateView). Inside an outer transaction the lock lasts until the
+    outer commit.
+
+    Gap policy: numbers are never reused. A number allocated for a letter
+    whose creation then fails is skipped, as with a database sequence.
+    """
+    from letters.models import ReferenceCounter
+
+    with transaction.atomic():
+        updated = ReferenceCounter.objects.filter(year=year).update(
+            last_number=F('last_number') + count
+        )
+        if not updated:
+            # First letter of the year, another creator may be racing us
+            try:
+                with transaction.atomic():
+                    ReferenceCounter.objects.create(year=year, last_number=count)
+                return range(1, count + 1)
+            except IntegrityError:
+                ReferenceCounter.objects.filter(year=year).update(
+                    last_number=F('last_number') + count
+                )
+        last_number = ReferenceCounter.objects.filter(year=year).values_list('last_number', flat=True).get()
+
+    return range(last_number - count + 1, last_number + 1)
+
+
+def allocate_reference_number(year):
+    """Reserve a single reference number for a year."""
+    return allocate_reference_numbers(year)[0]
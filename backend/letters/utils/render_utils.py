@@ -0,0 +1,446 @@
+import hashlib
+import json
+import logging
+import os
+import socket
+from datetime import timedelta
+from html import unescape
+from html.parser import HTMLParser
+from io import BytesIO
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections
+from django.db.models import F, Prefetch, Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Bump when the layout changes, so every letter is rendered again
+RENDERER_VERSION = 1
+
+LETTERHEAD_LOGO = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'letters', 'SIL-logo.png')
+LETTERHEAD_FOOTER = (
+    "<b>A Sonali Intellect Joint Venture</b><br/>"
+    "Sonali Intellect Limited, Level 7, Abedin Tower, 35, Kemal Ataturk Avenue, "
+    "Banani C/A, Dhaka-1213, Bangladesh.<br/>"
+    "Phone: +880 96 6691 0800, URL: www.sonaliintellect.com"
+)
+
+def get_render_queryset():
+    """Letters with every row the PDF shows loaded up front."""
+    from letters.models import Letter, LetterCopyRecipient, LetterReferences
+
+    return Letter.objects.select_related(
+        'organization',
+        'recipient__organization',
+        'category',
+        'signatory__email__designation',
+    ).prefetch_related(
+        Prefetch(
+            'cc_recipients',
+            queryset=LetterCopyRecipient.objects.select_related('recipient__organization', 'MyOrgRecipient')
+        ),
+        'attachments',
+        Prefetch('references', queryset=LetterReferences.objects.select_related('internal_reference_number')),
+    )
+
+
+def get_cc_lines(letter):
+    lines = []
+    for cc in letter.cc_recipients.all():
+        if cc.recipient:
+            parts = [
+                cc.recipient.short_designation,
+                cc.recipient.department,
+                cc.recipient.organization.short_form if cc.recipient.organization else None,
+            ]
+            parts = [part.strip() for part in parts if part and part.strip()]
+            lines.append(", ".join(parts) if parts else cc.recipient.fullName)
+        elif cc.MyOrgRecipient:
+            lines.append(cc.MyOrgRecipient.full_name)
+    return lines
+
+
+def get_reference_lines(letter):
+    return [
+        ref.internal_reference_number.reference_number if ref.internal_reference_number else ref.external_reference_number
+        for ref in letter.references.all()
+    ]
+
+
+def get_letter_content(letter):
+    """Everything the PDF shows, as plain data. The content hash is computed over it."""
+    recipient = letter.recipient
+    signatory = letter.signatory
+    signer = signatory.email if signatory else None
+    return {
+        'version': RENDERER_VERSION,
+        'reference_number': letter.reference_number,
+        'date': letter.created_at.date().isoformat() if letter.created_at else '',
+        'subject': letter.subject,
+        'body': letter.body,
+        'use_recipient_name': letter.use_recipient_name,
+        'use_cc_name': letter.use_cc_name,
+        'use_digital_signature': letter.use_digital_signature,
+        'use_digital_letterhead': letter.use_digital_letterhead,
+        'recipient': {
+            'name': recipient.fullName,
+            'designation': recipient.designation,
+            'organization': recipient.organization.name if recipient.organization else '',
+        } if recipient else None,
+        'signatory': {
+            'name': signer.full_name,
+            'designation': signer.designation.designation if signer.designation else '',
+            # Blob names change with the image, other names do not
+            'signature': signatory.digital_signature.name if signatory.digital_signature else '',
+            'signature_updated_at': signatory.updated_at.isoformat(),
+        } if signer else None,
+        'cc': get_cc_lines(letter),
+        'references': get_reference_lines(letter),
+        'attachments': [attachment.title or os.path.basename(attachment.file.name) for attachment in letter.attachments.all()],
+    }
+
+
+def get_letter_content_hash(letter):
+    content = json.dumps(get_letter_content(letter), sort_keys=True, default=str)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+class RichTextParser(HTMLParser):
+    """
+    Turn the rich text editor HTML of a letter into a list of
+    (kind, markup) blocks, where markup only uses the inline tags
+    ReportLab paragraphs understand. kind is 'p', 'h' or 'li'.
+    """
+    INLINE_TAGS = {
+        'b': 'b', 'strong': 'b', 'i': 'i', 'em': 'i', 'u': 'u', 's': 'strike', 'strike': 'strike',
+    }
+    BLOCK_TAGS = {'p', 'div', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li', 'ul', 'ol', 'blockquote'}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.blocks = []
+        self.current = []
+        self.kind = 'p'
+        self.open_tags = []
+        self.lists = []
+
+    def flush(self):
+        markup = ''.join(self.current).strip()
+        # Reopen the inline tags still open in the next block
+        closing = ''.join(f'</{tag}>' for tag in reversed(self.open_tags))
+        if markup.replace('<br/>', '').strip():
+            self.blocks.append((self.kind, markup + closing))
+        self.current = [f'<{tag}>' for tag in self.open_tags]
+        self.kind = 'p'
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.INLINE_TAGS:
+            self.open_tags.append(self.INLINE_TAGS[tag])
+            self.current.append(f'<{self.INLINE_TAGS[tag]}>')
+        elif tag == 'br':
+            self.current.append('<br/>')
+        elif tag in self.BLOCK_TAGS:
+            self.flush()
+            if tag in ('ul', 'ol'):
+                self.lists.append([tag, 0])
+            elif tag == 'li':
+                self.kind = 'li'
+                if self.lists:
+                    self.lists[-1][1] += 1
+                    bullet = f"{self.lists[-1][1]}." if self.lists[-1][0] == 'ol' else '&bull;'
+                else:
+                    bullet = '&bull;'
+                self.current.append(f'{bullet} ')
+            elif tag.startswith('h'):
+                self.kind = 'h'
+
+    def handle_endtag(self, tag):
+        if tag in self.INLINE_TAGS:
+            mapped = self.INLINE_TAGS[tag]
+            if mapped in self.open_tags:
+                # Close the tags opened inside it too and reopen them, so the
+                # markup stays well nested whatever the editor produced
+                reopen = []
+                while self.open_tags[-1] != mapped:
+                    reopen.insert(0, self.open_tags.pop())
+                    self.current.append(f'</{reopen[0]}>')
+                self.open_tags.pop()
+                self.current.append(f'</{mapped}>')
+                for name in reopen:
+                    self.open_tags.append(name)
+                    self.current.append(f'<{name}>')
+        elif tag in self.BLOCK_TAGS:
+            self.flush()
+            if tag in ('ul', 'ol') and self.lists:
+                self.lists.pop()
+
+    def handle_data(self, data):
+        self.current.append(escape(data))
+
+    def close(self):
+        super().close()
+        self.flush()
+        return self.blocks
+
+
+def parse_rich_text(html):
+    """Return the (kind, markup) blocks of rich text, plain text is kept as one paragraph per line."""
+    if '<' not in (html or ''):
+        return [('p', escape(unescape(line))) for line in (html or '').splitlines() if line.strip()]
+    parser = RichTextParser()
+    parser.feed(html)
+    return parser.close()
+
+
+def get_signature_image(signatory, width, height):
+    from reportlab.platypus import Image
+
+    try:
+        with signatory.digital_signature.open('rb') as f:
+            data = BytesIO(f.read())
+    except (OSError, ValueError) as e:
+        logger.warning(f"Digital signature of signatory {signatory.pk} could not be read: {str(e)}")
+        return None
+    image = Image(data, width=width, height=height, kind='proportional')
+    image.hAlign = 'LEFT'
+    return image
+
+
+def build_letter_pdf(letter):
+    """Render a letter loaded with get_render_queryset to PDF bytes."""
+    from reportlab.lib.enums import TA_RIGHT
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+    from reportlab.lib.units import mm
+    from reportlab.platypus import KeepTogether, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+    sample = getSampleStyleSheet()
+    base = ParagraphStyle('LetterBase', parent=sample['Normal'], fontName='Helvetica', fontSize=11, leading=15)
+    styles = {
+        'p': ParagraphStyle('LetterBody', parent=base, spaceAfter=8),
+        'h': ParagraphStyle('LetterHeading', parent=base, fontName='Helvetica-Bold', fontSize=12, spaceAfter=6),
+        'li': ParagraphStyle('LetterListItem', parent=base, leftIndent=20, spaceAfter=4),
+    }
+    bold = ParagraphStyle('LetterBold', parent=base, fontName='Helvetica-Bold')
+    date_style = ParagraphStyle('LetterDate', parent=base, alignment=TA_RIGHT)
+    small = ParagraphStyle('LetterSmall', parent=base, fontSize=10, leading=13)
+    footer = ParagraphStyle('LetterFooter', parent=base, fontSize=8, leading=10, textColor='#555555')
+
+    content = get_letter_content(letter)
+    story = []
+
+    # Reference on the left, date on the right of the same line
+    date = letter.created_at.date() if letter.created_at else None
+    header = Table([[
+        Paragraph(f"Reference: {escape(content['reference_number'] or '')}", base),
+        Paragraph(f"{date.day} {date:%B}, {date.year}" if date else '', date_style),
+    ]], colWidths=['65%', '35%'])
+    header.setStyle(TableStyle([
+        ('LEFTPADDING', (0, 0), (-1, -1), 0),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 0),
+    ]))
+    story.append(header)
+    story.append(Spacer(1, 6 * mm))
+
+    recipient = content['recipient']
+    if recipient:
+        if letter.use_recipient_name:
+            story.append(Paragraph(escape(recipient['name']), base))
+            story.append(Paragraph(escape(recipient['designation']), base))
+        else:
+            story.append(Paragraph(f"The {escape(recipient['designation'])}", base))
+        story.append(Paragraph(escape(recipient['organization']), bold))
+    story.append(Spacer(1, 6 * mm))
+
+    story.append(Paragraph(f"Subject: {''.join(markup for _, markup in parse_rich_text(letter.subject))}", bold))
+    if content['references']:
+        story.append(Paragraph(f"Ref: {escape('; '.join(content['references']))}", small))
+    story.append(Spacer(1, 4 * mm))
+
+    for kind, markup in parse_rich_text(letter.body):
+        story.append(Paragraph(markup, styles[kind]))
+
+    closing = [Spacer(1, 8 * mm)]
+    signatory = letter.signatory
+    if signatory and letter.use_digital_signature and signatory.digital_signature:
+        image = get_signature_image(signatory, 50 * mm, 20 * mm)
+        if image:
+            closing.append(image)
+    elif not letter.use_digital_signature:
+        # Room for a wet signature
+        closing.append(Spacer(1, 15 * mm))
+    if content['signatory']:
+        closing.append(Paragraph(escape(content['signatory']['name']), bold))
+        closing.append(Paragraph(escape(content['signatory']['designation']), base))
+    story.append(KeepTogether(closing))
+
+    if content['attachments']:
+        story.append(Spacer(1, 6 * mm))
+        story.append(Paragraph("Attachment:", bold))
+        for index, title in enumerate(content['attachments']):
+            story.append(Paragraph(f"{chr(97 + index)}) {escape(title)}", small))
+
+    if letter.use_cc_name and content['cc']:
+        story.append(Spacer(1, 6 * mm))
+        story.append(Paragraph("C.C. to:", bold))
+        for index, line in enumerate(content['cc']):
+            story.append(Paragraph(f"{chr(97 + index)}) {escape(line)}", small))
+
+    def draw_letterhead(canvas, doc):
+        width, height = A4
+        canvas.saveState()
+        if os.path.exists(LETTERHEAD_LOGO):
+            canvas.drawImage(
+                LETTERHEAD_LOGO, width - 15 * mm - 53 * mm, height - 10 * mm - 18 * mm,
+                width=53 * mm, height=18 * mm, preserveAspectRatio=True, mask='auto'
+            )
+        text = Paragraph(LETTERHEAD_FOOTER, footer)
+        text.wrap(width - 30 * mm, 20 * mm)
+        text.drawOn(canvas, 15 * mm, 8 * mm)
+        canvas.restoreState()
+
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(
+        buffer,
+        pagesize=A4,
+        leftMargin=15 * mm,
+        rightMargin=15 * mm,
+        topMargin=32 * mm if letter.use_digital_letterhead else 20 * mm,
+        bottomMargin=25 * mm if letter.use_digital_letterhead else 18 * mm,
+        title=content['reference_number'] or f"Letter {letter.pk}",
+        subject=letter.subject,
+        # Fixed document id, so the same letter version gives the same bytes
+        invariant=True,
+    )
+    if letter.use_digital_letterhead:
+        doc.build(story, onFirstPage=draw_letterhead, onLaterPages=draw_letterhead)
+    else:
+        doc.build(story)
+    return buffer.getvalue()
+
+
+def get_claimable_renders(now=None):
+    """
+    Renders a worker may pick up: pending ones, failed ones with attempts left
+    and ones stuck in Rendering for longer than LETTER_PDF_RENDER_TIMEOUT (a
+    worker that died mid-render).
+    """
+    from letters.models import LetterRender
+
+    now = now or timezone.now()
+    timeout = timedelta(seconds=getattr(settings, 'LETTER_PDF_RENDER_TIMEOUT', 5 * 60))
+    max_attempts = getattr(settings, 'LETTER_PDF_RENDER_MAX_ATTEMPTS', 3)
+    return LetterRender.objects.filter(
+        Q(status='Pending') |
+        Q(status='Failed', attempts__lt=max_attempts) |
+        Q(status='Rendering', claimed_at__lt=now - timeout)
+    )
+
+
+def render_letter(render_id, worker=None):
+    """
+    Claim a LetterRender and build its PDF. Returns True when this call
+    stored the PDF, False when the render was taken by another worker, failed
+    or went stale because the letter changed in the meantime.
+    """
+    from letters.models import LetterRender
+
+    worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+    now = timezone.now()
+    claimed = get_claimable_renders().filter(pk=render_id).update(
+        status='Rendering',
+        claimed_by=worker,
+        claimed_at=now,
+        attempts=F('attempts') + 1,
+        updated_at=now,
+    )
+    if not claimed:
+        return False
+
+    render = LetterRender.objects.get(pk=render_id)
+    letter = get_render_queryset().get(pk=render.letter_id)
+    if get_letter_content_hash(letter) != render.content_hash:
+        # The letter changed since this version was requested, the next
+        # request for its PDF queues the current version
+        render.delete()
+        return False
+
+    try:
+        content = build_letter_pdf(letter)
+    except Exception as e:
+        logger.error(f"Error rendering PDF of letter {letter.pk}: {str(e)}")
+        LetterRender.objects.filter(pk=render_id).update(
+            status='Failed', last_error=str(e), updated_at=timezone.now()
+        )
+        return False
+
+    render.pdf.save(f"letter-{letter.pk}.pdf", ContentFile(content), save=False)
+    render.status = 'Complete'
+    render.rendered_at = timezone.now()
+    render.last_error = ''
+    render.save(update_fields=['pdf', 'status', 'rendered_at', 'last_error', 'updated_at'])
+
+    # Earlier versions are never served again
+    for old in LetterRender.objects.filter(letter_id=letter.pk, created_at__lt=render.created_at):
+        old.delete()
+
+    logger.info(f"Rendered PDF of letter {letter.pk} ({len(content)} bytes)")
+    return True
+
+
+def request_letter_render(letter):
+    """
+    Return the LetterRender of the current version of a letter loaded with
+    get_render_queryset, creating it as Pending when that version has not
+    been requested yet. The PDF is built by the render_letter_pdfs command,
+    never in the web process, which only reports the render status.
+    """
+    from letters.models import LetterRender
+
+    render, _ = LetterRender.objects.get_or_create(
+        letter=letter, content_hash=get_letter_content_hash(letter)
+    )
+    return render
+
+
+def render_letter_in_worker(render_id, worker=None):
+    """render_letter for a process pool worker, the connection inherited from the parent is not reused."""
+    connections.close_all()
+    try:
+        return render_letter(render_id, worker=worker)
+    except Exception as e:
+        # Left claimed, it is picked up again after LETTER_PDF_RENDER_TIMEOUT
+        logger.error(f"Error in letter PDF render {render_id}: {str(e)}")
+        return False
+    finally:
+        connections.close_all()
+
+
+def render_pending_letters(worker=None, limit=None, executor=None):
+    """
+    Render every claimable LetterRender, for the render_letter_pdfs command.
+    Letters are rendered in the calling thread, or several at a time by the
+    processes of executor when one is given.
+    Returns a dict with the number of rendered and failed letters.
+    """
+    from letters.models import LetterRender
+
+    stats = {'rendered': 0, 'failed': 0}
+    ids = list(get_claimable_renders().order_by('pk').values_list('pk', flat=True)[:limit])
+    if not ids:
+        return stats
+    if executor is None:
+        results = [render_letter(render_id, worker=worker) for render_id in ids]
+    else:
+        # Forked workers must open their own connections
+        connections.close_all()
+        results = list(executor.map(render_letter_in_worker, ids, [worker] * len(ids)))
+
+    stats['rendered'] = sum(results)
+    failed_ids = [render_id for render_id, rendered in zip(ids, results) if not rendered]
+    if failed_ids:
+        stats['failed'] = LetterRender.objects.filter(pk__in=failed_ids, status='Failed').count()
+    return stats
@@ -0,0 +1,81 @@
+import logging
+import re
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+WORD_RE = re.compile(r'\w+')
+
+
+def filter_letter_text(queryset, text):
+    """
+    Keep letters whose subject or body contain every word of text (as a word
+    prefix). Uses the FULLTEXT index on MySQL, plain LIKE matching elsewhere.
+    Words shorter than FULLTEXT_MIN_TOKEN_SIZE are not indexed by MySQL and
+    are always matched with LIKE.
+    """
+    words = WORD_RE.findall(text or '')
+    if not words:
+        return queryset
+
+    if connection.vendor == 'mysql':
+        min_length = getattr(settings, 'FULLTEXT_MIN_TOKEN_SIZE', 3)
+        indexed = [word for word in words if len(word) >= min_length]
+        words = [word for word in words if len(word) < min_length]
+        if indexed:
+            queryset = queryset.alias(
+                text_match=RawSQL(
+                    'MATCH (letters_letter.subject, letters_letter.body) AGAINST (%s IN BOOLEAN MODE)',
+                    [' '.join(f'+{word}*' for word in indexed)],
+                    output_field=FloatField(),
+                )
+            ).filter(text_match__gt=0)
+
+    for word in words:
+        queryset = queryset.filter(Q(subject__icontains=word) | Q(body__icontains=word))
+    return queryset
+
+
+def get_date_bounds(date_from=None, date_to=None):
+    """
+    Turn an inclusive date range into [start, end) datetimes, so created_at
+    is compared directly and its index can be used.
+    """
+    start = end = None
+    if date_from:
+        start = timezone.make_aware(datetime.combine(date_from, time.min))
+    if date_to:
+        end = timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min))
+    return start, end
+
+
+def search_letters(queryset, reference=None, text=None, organization=None, category=None,
+                   date_from=None, date_to=None):
+    """
+    Apply the letter search filters to a Letter queryset:
+    - reference: reference number prefix
+    - text: words searched in subject and body
+    - organization: recipient organization id
+    - category: category id
+    - date_from / date_to: inclusive letter date range
+    """
+    if reference:
+        queryset = queryset.filter(reference_number__startswith=reference.strip())
+    if organization:
+        queryset = queryset.filter(recipient__organization_id=organization)
+    if category:
+        queryset = queryset.filter(category_id=category)
+
+    start, end = get_date_bounds(date_from, date_to)
+    if start:
+        queryset = queryset.filter(created_at__gte=start)
+    if end:
+        queryset = queryset.filter(created_at__lt=end)
+
+    return filter_letter_text(queryset, text)
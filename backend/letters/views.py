@@ -1,8 +1,18 @@
+import logging
+import os
+
 from rest_framework import viewsets, status, generics
 from rest_framework.views import APIView
 from rest_framework.response import Response
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.settings import api_settings
+from django.conf import settings
 from django.db import transaction
+from django.shortcuts import get_object_or_404
+from django.utils.dateparse import parse_date
 from accounts.models import User
+from accounts.utils.blob_utils import add_blob_references
+from accounts.utils.download_utils import SignedURLAuthentication, serve_file
 
 from .models import (
     Organization,
@@ -28,8 +38,14 @@ from .serializers import (
     LetterReferenceSerializer,
     CCRecipientSerializer,
     CCMyOrgRecipientSerializer,
-    LetterFileSerializer
+    LetterFileSerializer,
+    LetterSearchRowSerializer
 )
+from .pagination import LetterCursorPagination
+from .utils.render_utils import get_render_queryset, request_letter_render
+from .utils.search_utils import search_letters
+
+logger = logging.getLogger(__name__)
 
 # ----------------------------------
 # List Views for Dropdown Data
@@ -84,118 +100,138 @@ class LetterCreateView(generics.CreateAPIView):
     def create(self, request, *args, **kwargs):
         """Override create to handle nested copy recipients, file attachments, and references."""
         try:
+            # Extract copy recipient data from the request
+            copy_same_org = request.data.get('copySameOrg', '')
+            copy_other_org = request.data.get('copyOtherOrg', '')
+            copy_my_org = request.data.get('copyMyOrg', '')
+            
+            # Extract multiple attachments (from FILES)
+            attachment_files = request.FILES.getlist('attachments')
+            attachment_titles = request.data.getlist('attachmentTitles', [])
+            
+            # Extract references data
+            internal_references = request.data.getlist('internalReferences', [])
+            external_references = request.data.getlist('externalReferences', [])
+            
+            # Extract date from request (will be stored as created_at)
+            date = request.data.get('date', None)
+            
+            # Create a mutable copy of request data for the serializer
+            letter_data = request.data.dict() if hasattr(request.data, 'dict') else dict(request.data)
+            
+            # Remove fields that are handled separately
+            fields_to_remove = [
+                'copySameOrg', 'copyOtherOrg', 'copyMyOrg',
+                'attachments', 'attachmentTitles',
+                'internalReferences', 'externalReferences', 'date'
+            ]
+            for field in fields_to_remove:
+                letter_data.pop(field, None)
+
+            letter_data['created_by'] = request.user.id
+            # Set created_at from the date field sent by frontend
+            if date:
+                letter_data['created_at'] = date
+            
+            serializer = self.get_serializer(data=letter_data)
+            serializer.is_valid(raise_exception=True)
+
+            # Reserve the reference number before the transaction below, so the
+            # counter row is not locked while attachments are written
+            draft = Letter(**serializer.validated_data)
+            draft.clean()
+            reference_number = draft.generate_reference_number()
+
             with transaction.atomic():
-                # Extract copy recipient data from the request
-                copy_same_org = request.data.get('copySameOrg', '')
-                copy_other_org = request.data.get('copyOtherOrg', '')
-                copy_my_org = request.data.get('copyMyOrg', '')
-                
-                # Extract multiple attachments (from FILES)
-                attachment_files = request.FILES.getlist('attachments')
-                attachment_titles = request.data.getlist('attachmentTitles', [])
-                
-                # Extract references data
-                internal_references = request.data.getlist('internalReferences', [])
-                external_references = request.data.getlist('externalReferences', [])
-                
-                # Extract date from request (will be stored as created_at)
-                date = request.data.get('date', None)
-                
-                # Create a mutable copy of request data for the serializer
-                letter_data = request.data.dict() if hasattr(request.data, 'dict') else dict(request.data)
-                
-                # Remove fields that are handled separately
-                fields_to_remove = [
-                    'copySameOrg', 'copyOtherOrg', 'copyMyOrg',
-                    'attachments', 'attachmentTitles',
-                    'internalReferences', 'externalReferences', 'date'
-                ]
-                for field in fields_to_remove:
-                    letter_data.pop(field, None)
-
-                letter_data['created_by'] = request.user.id
-                # Set created_at from the date field sent by frontend
-                if date:
-                    letter_data['created_at'] = date
-                
                 # Create the letter
-                serializer = self.get_serializer(data=letter_data)
-                serializer.is_valid(raise_exception=True)
-                letter = serializer.save()
+                letter = serializer.save(reference_number=reference_number)
                 
-                # Create copy recipients
+                # Create copy recipients, collected first and written in one query
+                copy_recipients = []
+                # Recipients are matched on fullName, Recipient has no name
+                # field (filtering on name raised a FieldError)
                 if copy_same_org:
                     # Find recipient by name in the same organization
                     recipients = Recipient.objects.filter(
-                        name__icontains=copy_same_org,
+                        fullName__icontains=copy_same_org,
                         organization=letter.organization
                     )
-                    for recipient in recipients:
-                        LetterCopyRecipient.objects.create(
-                            letter=letter,
-                            recipient=recipient
-                        )
+                    copy_recipients.extend(
+                        LetterCopyRecipient(letter=letter, recipient=recipient)
+                        for recipient in recipients
+                    )
                 
                 if copy_other_org:
                     # Find recipient by name in other organizations
                     recipients = Recipient.objects.filter(
-                        name__icontains=copy_other_org
+                        fullName__icontains=copy_other_org
                     ).exclude(organization=letter.organization)
-                    for recipient in recipients:
-                        LetterCopyRecipient.objects.create(
-                            letter=letter,
-                            recipient=recipient
-                        )
+                    copy_recipients.extend(
+                        LetterCopyRecipient(letter=letter, recipient=recipient)
+                        for recipient in recipients
+                    )
                 
                 if copy_my_org:
                     # Find user by full name in the current organization
                     users = User.objects.filter(
                         full_name__icontains=copy_my_org
                     )
-                    for user in users:
-                        LetterCopyRecipient.objects.create(
-                            letter=letter,
-                            MyOrgRecipient=user
-                        )
-                
-                # Create multiple attachments if provided
-                if attachment_files:
-                    for idx, attachment_file in enumerate(attachment_files):
-                        title = attachment_titles[idx] if idx < len(attachment_titles) else ''
-                        AdditionalLetterAttachment.objects.create(
-                            letter=letter,
-                            file=attachment_file,
-                            title=title or attachment_file.name
-                        )
+                    copy_recipients.extend(
+                        LetterCopyRecipient(letter=letter, MyOrgRecipient=user)
+                        for user in users
+                    )
+                LetterCopyRecipient.objects.bulk_create(copy_recipients)
                 
-                # Create internal references if provided
-                if internal_references:
-                    for ref_number in internal_references:
-                        # Check if the reference is not empty
-                        if ref_number and ref_number.strip():
-                            try:
-                                # Try to find the letter by its reference number
-                                ref_letter = Letter.objects.get(reference_number=ref_number.strip())
-                                LetterReferences.objects.create(
-                                    letter=letter,
-                                    internal_reference_number=ref_letter
-                                )
-                            except Letter.DoesNotExist:
-                                # If not found by reference number, log the error but don't fail
-                                print(f"Letter with reference number '{ref_number}' not found")
-                                pass
+                # Create multiple attachments if provided. bulk_create stores
+                # each file in the blob store before inserting all rows at once.
+                attachments = []
+                for idx, attachment_file in enumerate(attachment_files):
+                    title = attachment_titles[idx] if idx < len(attachment_titles) else ''
+                    attachment = AdditionalLetterAttachment(
+                        letter=letter,
+                        file=attachment_file,
+                        title=title or attachment_file.name
+                    )
+                    attachment.set_file_metadata()
+                    attachments.append(attachment)
+                AdditionalLetterAttachment.objects.bulk_create(attachments)
+                # bulk_create sends no post_save, count the blob references here
+                add_blob_references(attachment.file.name for attachment in attachments)
                 
-                # Create external references if provided
-                if external_references:
-                    for ext_ref in external_references:
-                        if ext_ref:  # Only create if not empty
-                            LetterReferences.objects.create(
+                # Create internal and external references if provided
+                references = []
+                ref_numbers = list(dict.fromkeys(
+                    ref_number.strip() for ref_number in internal_references
+                    if ref_number and ref_number.strip()
+                ))
+                if ref_numbers:
+                    # Find all referenced letters by reference number in one query
+                    ref_letters = {
+                        ref_letter.reference_number: ref_letter
+                        for ref_letter in Letter.objects.filter(reference_number__in=ref_numbers)
+                    }
+                    for ref_number in ref_numbers:
+                        if ref_number in ref_letters:
+                            references.append(LetterReferences(
                                 letter=letter,
-                                external_reference_number=ext_ref
-                            )
+                                internal_reference_number=ref_letters[ref_number]
+                            ))
+                        else:
+                            # If not found by reference number, log the error but don't fail
+                            logger.warning(f"Letter with reference number '{ref_number}' not found")
+                
+                references.extend(
+                    LetterReferences(letter=letter, external_reference_number=ext_ref)
+                    for ext_ref in external_references
+                    if ext_ref  # Only create if not empty
+                )
+                LetterReferences.objects.bulk_create(references)
                 
                 # Return the created letter with all details
-                detail_serializer = LetterDetailSerializer(letter)
+                letter = LetterDetailSerializer.setup_eager_loading(Letter.objects.all()).get(pk=letter.pk)
+                # Queue the PDF, the render_letter_pdfs worker builds it
+                request_letter_render(letter)
+                detail_serializer = LetterDetailSerializer(letter, context={'request': request})
                 return Response(
                     detail_serializer.data,
                     status=status.HTTP_201_CREATED
@@ -226,6 +262,51 @@ class LetterListView(viewsets.ReadOnlyModelViewSet):
             return LetterDetailSerializer  # Use full details for single letter
         return LetterListSerializer        # Use summary for the list
 
+    def get_queryset(self):
+        # Load what the selected serializer reads, so rows don't fan out into queries
+        return self.get_serializer_class().setup_eager_loading(Letter.objects.order_by('id'))
+
+class LetterSearchAPIView(APIView):
+    """
+    Search the letter registry and return a page of lean rows.
+    Query params:
+    - reference: reference number prefix
+    - q: words searched in subject and body
+    - organization: recipient organization id
+    - category: category id
+    - date_from / date_to: inclusive date range (YYYY-MM-DD)
+    - cursor / page_size: cursor pagination on -created_at
+    """
+
+    def get(self, request):
+        params = request.query_params
+        dates = {}
+        for name in ('date_from', 'date_to'):
+            value = params.get(name)
+            if value:
+                dates[name] = parse_date(value)
+                if dates[name] is None:
+                    return Response(
+                        {"error": f"Invalid {name}, expected YYYY-MM-DD"},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+
+        letters = search_letters(
+            Letter.objects.all(),
+            reference=params.get('reference'),
+            text=params.get('q'),
+            organization=params.get('organization'),
+            category=params.get('category'),
+            **dates
+        )
+
+        paginator = LetterCursorPagination()
+        page = paginator.paginate_queryset(
+            LetterSearchRowSerializer.get_list_values(letters), request, view=self
+        )
+        serializer = LetterSearchRowSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
 # ------------------------------
 # ViewSets for CRUD Operations
 # ------------------------------
@@ -273,19 +354,70 @@ class LetterPreviewAPIView(APIView):
 
 
 class LetterPDFAPIView(APIView):
-    """Returns a message or PDF download response (to be implemented later)."""
+    """
+    Returns the server-rendered PDF of a letter.
+
+    The PDF is built once per version of the letter by the render_letter_pdfs
+    worker (see letters.utils.render_utils). Until it is built the response is a
+    202 with a Retry-After header, poll until the PDF is returned.
+    Pass ?download=1 to get it as an attachment.
+    """
+    authentication_classes = [*api_settings.DEFAULT_AUTHENTICATION_CLASSES, SignedURLAuthentication]
+    permission_classes = [IsAuthenticated]
 
     def get(self, request, pk):
         try:
-            letter = Letter.objects.get(pk=pk)
+            letter = get_render_queryset().get(pk=pk)
         except Letter.DoesNotExist:
             return Response({"error": "Letter not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        # For now just respond with JSON — PDF generation can be added later
-        return Response(
-            {"message": f"PDF generation for Letter {pk} will be added soon."},
-            status=status.HTTP_200_OK
-        )
+        render = request_letter_render(letter)
+        if render.status == 'Complete':
+            reference = letter.reference_number or f"letter-{letter.pk}"
+            return serve_file(
+                request, render.pdf, f"{reference.replace('/', '-')}.pdf",
+                as_attachment=bool(request.query_params.get('download'))
+            )
+
+        if render.status == 'Failed' and render.attempts >= getattr(settings, 'LETTER_PDF_RENDER_MAX_ATTEMPTS', 3):
+            return Response(
+                {"error": f"PDF generation failed: {render.last_error}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+        response = Response({"status": render.status}, status=status.HTTP_202_ACCEPTED)
+        response['Retry-After'] = str(getattr(settings, 'LETTER_PDF_RETRY_AFTER', 2))
+        return response
+
+
+class LetterAttachmentDownloadAPIView(APIView):
+    """Send an additional letter attachment, also reachable through its signed download_url."""
+    authentication_classes = [*api_settings.DEFAULT_AUTHENTICATION_CLASSES, SignedURLAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        attachment = get_object_or_404(AdditionalLetterAttachment, pk=pk)
+        # The title defaults to the uploaded file name, the stored name is a content hash
+        extension = os.path.splitext(attachment.file.name)[1]
+        filename = attachment.title or f"attachment-{attachment.pk}"
+        if not filename.lower().endswith(extension.lower()):
+            filename += extension
+        return serve_file(request, attachment.file, filename)
+
+
+class LetterDocumentDownloadAPIView(APIView):
+    """Send a saved letter document, also reachable through its signed download_url."""
+    authentication_classes = [*api_settings.DEFAULT_AUTHENTICATION_CLASSES, SignedURLAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        document = get_object_or_404(LetterFile.objects.select_related('letter'), pk=pk)
+        extension = os.path.splitext(document.document.name)[1]
+        # Blob names are content hashes, name the download after the letter
+        reference = document.letter.reference_number or f"letter-{document.letter_id}"
+        filename = f"{reference.replace('/', '-')}{extension}"
+        return serve_file(request, document.document, filename)
+
 # API View to get next tentative reference number
 
 class NextReferenceNumberAPIView(APIView):
@@ -3,6 +3,7 @@ import axiosInstance from '../../axiosConfig';
 import { useAgreementContext } from '../../context/AgreementContext';
 import { getUserData, getUserPermissions, isUserLoggedIn } from '../../utils/userUtils';
 import AgreementPreview from './AgreementPreview';
+import { CHUNKED_UPLOAD_THRESHOLD, uploadInChunks } from '../../utils/chunkedUpload';
 import { useNavigate } from 'react-router-dom';
 
 export default function AgreementForm({ onSubmit, initialData }) {
@@ -154,9 +155,20 @@ export default function AgreementForm({ onSubmit, initialData }) {
         }
         setVendors(vendorsData);
         
-        // Fetch available agreements for parent selection
-        const agreementsResponse = await axiosInstance.get('agreements/');
-        setAvailableAgreements(agreementsResponse.data.agreements || []);
+        // Fetch available agreements for parent selection, following every page
+        // of the cursor paginated list but only loading the fields needed here
+        const parentAgreements = [];
+        let cursor = null;
+        do {
+          const agreementsResponse = await axiosInstance.get('agreements/', {
+            params: { fields: 'id,agreement_id,title,parent_agreement', page_size: 500, cursor },
+          });
+          parentAgreements.push(...(agreementsResponse.data.agreements || []));
+          cursor = agreementsResponse.data.next
+            ? new URL(agreementsResponse.data.next, window.location.origin).searchParams.get('cursor')
+            : null;
+        } while (cursor);
+        setAvailableAgreements(parentAgreements);
       } catch (error) {
         console.error('Error fetching data:', error);
         setErrors({ general: 'Failed to load form data. You may not be authorized to view this.' });
@@ -307,7 +319,10 @@ export default function AgreementForm({ onSubmit, initialData }) {
         console.log('Parent Agreement value:', form.parent_agreement);
         payload.append('parent_agreement', form.parent_agreement || '');
         
-        if (form.attachment instanceof File) {
+        if (form.attachment instanceof File && form.attachment.size > CHUNKED_UPLOAD_THRESHOLD) {
+          // Large scans are sent in resumable chunks, then attached by id
+          payload.append('upload_id', await uploadInChunks(form.attachment));
+        } else if (form.attachment instanceof File) {
           payload.append('attachment', form.attachment);
         } else if (typeof form.attachment === 'string') {
           payload.append('existing_attachment', form.attachment);
@@ -543,7 +558,7 @@ export default function AgreementForm({ onSubmit, initialData }) {
           {errors.attachment && <div className="error-text">{errors.attachment}</div>}
           {isEditing && form.attachment && form.original_filename && (
             <div>
-              Current file: <a href={form.attachment} download={form.original_filename}>
+              Current file: <a href={initialData?.download_url || form.attachment} download={form.original_filename}>
                 {form.original_filename}
               </a>
             </div>
@@ -567,25 +582,26 @@ export default function AgreementForm({ onSubmit, initialData }) {
                 return false;
               }
               
-              // Don't allow circular references by checking the agreement's ancestry
+              // Don't allow circular references by checking the agreement's ancestry.
+              // List rows only carry the parent id, so walk up through the loaded rows
               const isInAncestryChain = (agreement) => {
-                let current = agreement;
+                let parentId = agreement.parent_agreement;
                 const visited = new Set();
                 
-                while (current?.parent_agreement) {
+                while (parentId) {
                   // If we've seen this ID before, we have a cycle
-                  if (visited.has(current.id)) {
+                  if (visited.has(parentId)) {
                     return true;
                   }
-                  visited.add(current.id);
+                  visited.add(parentId);
                   
                   // If this agreement is the one we're editing, it would create a cycle
-                  if (current.parent_agreement.id === initialData?.id) {
+                  if (parentId === initialData?.id) {
                     return true;
                   }
                   
                   // Move up the chain
-                  current = current.parent_agreement;
+                  parentId = availableAgreements.find(a => a.id === parentId)?.parent_agreement;
                 }
                 return false;
               };
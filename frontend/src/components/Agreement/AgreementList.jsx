@@ -10,6 +10,10 @@ import './AgreementList.css';
 import viewicon from '../../assets/icons/view.svg';
 import editicon from '../../assets/icons/edit.svg';
 
+// The list endpoint is cursor paginated, keep only the cursor of the next page link
+const getNextCursor = (data) =>
+  data?.next ? new URL(data.next, window.location.origin).searchParams.get('cursor') : null;
+
 export default function AgreementList({ agreements: propAgreements }) {
   const { startEditing, deleteAgreement, prepareNewAgreement } = useAgreementContext();
   const navigate = useNavigate();
@@ -20,6 +24,9 @@ export default function AgreementList({ agreements: propAgreements }) {
   const [departments, setDepartments] = useState([]);
   const [isExecutive, setIsExecutive] = useState(false);
   const [isShowingSearchResults, setIsShowingSearchResults] = useState(false);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+  const [searchCount, setSearchCount] = useState(0);
 
   const handleCreate = async () => {
     if (isExecutive) {
@@ -52,6 +59,7 @@ export default function AgreementList({ agreements: propAgreements }) {
         ? response.data
         : (response.data.agreements || response.data.results || []);
       setAgreements(agreementsData);
+      setNextCursor(getNextCursor(response.data));
       setIsShowingSearchResults(false);
     } catch (error) {
       console.error('Error fetching agreements:', error);
@@ -73,6 +81,7 @@ export default function AgreementList({ agreements: propAgreements }) {
           ? response.data
           : (response.data.agreements || response.data.results || []);
         setAgreements(agreementsData);
+        setNextCursor(getNextCursor(response.data));
 
         if (response.data.departments) {
           setDepartments(response.data.departments);
@@ -87,6 +96,19 @@ export default function AgreementList({ agreements: propAgreements }) {
     fetchAgreements();
   }, []);
 
+  const handleLoadMore = async () => {
+    try {
+      setLoadingMore(true);
+      const response = await axiosInstance.get('agreements/', { params: { cursor: nextCursor } });
+      setAgreements((current) => [...current, ...(response.data.agreements || [])]);
+      setNextCursor(getNextCursor(response.data));
+    } catch (error) {
+      console.error('Error fetching more agreements:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   useEffect(() => {
     const checkUserPermissions = async () => {
       try {
@@ -136,9 +158,11 @@ export default function AgreementList({ agreements: propAgreements }) {
       {/* Search bar */}
       <div className="agreement-list-search-container">
         <SearchBar
-          onSearchResults={(results) => {
+          onSearchResults={(results, { append = false, count = results.length } = {}) => {
             console.log('Search Results received:', results);
-            setAgreements(results);
+            // Later pages of the same search are added below the first one
+            setAgreements((current) => (append ? [...current, ...results] : results));
+            setSearchCount(count);
             setIsShowingSearchResults(true);
             setIsSearching(false);
           }}
@@ -155,7 +179,7 @@ export default function AgreementList({ agreements: propAgreements }) {
       {/* Search results indicator */}
       {isShowingSearchResults && (
         <div className="agreement-list-search-results">
-          <span>Showing search results ({agreements.length} agreements found)</span>
+          <span>Showing search results ({agreements.length} of {searchCount} agreements found)</span>
           <button
             onClick={handleClearSearch}
             className="agreement-list-clear-search"
@@ -239,6 +263,15 @@ export default function AgreementList({ agreements: propAgreements }) {
               ))}
             </tbody>
           </table>
+          {nextCursor && !isShowingSearchResults && (
+            <button
+              onClick={handleLoadMore}
+              disabled={loadingMore}
+              className="agreement-list-empty-btn agreement-list-empty-btn-secondary"
+            >
+              {loadingMore ? 'Loading...' : 'Load More'}
+            </button>
+          )}
         </>
       )}
     </div>
@@ -79,7 +79,8 @@ export default function AgreementPreview({
   let attachmentLink = null;
   let attachmentName = '';
   if (data?.attachment) {
-    attachmentLink = data.attachment;
+    // Saved agreements link to the access-checked download endpoint
+    attachmentLink = data.download_url || data.attachment;
     attachmentName = data.original_filename || (typeof data.attachment === 'string' ? data.attachment.split('/').pop() : data.attachment.name);
   }
 
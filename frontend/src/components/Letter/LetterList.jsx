@@ -7,6 +7,7 @@ import './LetterList.css';
 import downloadIcon from '../../assets/icons/download.svg';
 import viewIcon from '../../assets/icons/view.svg';
 import axiosInstance from '../../axiosConfig';
+import { fetchLetterPdf } from '../../utils/letterPdf';
 import DatePicker from "react-datepicker";
 import "react-datepicker/dist/react-datepicker.css";
 
@@ -211,14 +212,16 @@ const LettersPage = () => {
   /* ------------------------------
        HANDLE VIEW PDF
     ------------------------------ */
-  const handleViewPdf = (letter) => {
-    if (letter.documents && letter.documents.length > 0) {
-      const latestDoc = letter.documents.sort((a, b) =>
-        new Date(b.uploaded_at) - new Date(a.uploaded_at)
-      )[0];
-      window.open(latestDoc.document, '_blank');
-    } else {
-      alert("No saved PDF found for this letter reference.");
+  const handleViewPdf = async (letter) => {
+    // Open the tab right away, browsers block window.open after an await
+    const pdfWindow = window.open('', '_blank');
+    try {
+      const blob = await fetchLetterPdf(letter.id);
+      pdfWindow.location.href = window.URL.createObjectURL(blob);
+    } catch (err) {
+      pdfWindow.close();
+      console.error("PDF generation failed:", err);
+      alert("Failed to generate the PDF for this letter.");
     }
   };
 
@@ -226,21 +229,10 @@ const LettersPage = () => {
      HANDLE DOWNLOAD PDF
   ------------------------------ */
   const handleDownloadPdf = async (letter) => {
-    if (!letter.documents || letter.documents.length === 0) {
-      alert("No saved PDF found for this letter.");
-      return;
-    }
-
-    const latestDoc = letter.documents.sort((a, b) =>
-      new Date(b.uploaded_at) - new Date(a.uploaded_at)
-    )[0];
-
     try {
-      const response = await axiosInstance.get(latestDoc.document, {
-        responseType: 'blob',
-      });
+      const blob = await fetchLetterPdf(letter.id);
 
-      const url = window.URL.createObjectURL(new Blob([response.data]));
+      const url = window.URL.createObjectURL(blob);
       const link = document.createElement('a');
       link.href = url;
 
@@ -254,7 +246,7 @@ const LettersPage = () => {
 
     } catch (err) {
       console.error("Download failed:", err);
-      alert("Failed to download the file. Please check if the file exists.");
+      alert("Failed to generate the PDF for this letter.");
     }
   };
 
@@ -506,7 +498,7 @@ const LettersPage = () => {
                       </div>
                       <div className="file-actions">
                         <a
-                          href={file.document}
+                          href={file.download_url || file.document}
                           target="_blank"
                           rel="noopener noreferrer"
                           className="file-view-btn"
@@ -515,7 +507,7 @@ const LettersPage = () => {
                           <i className="fa fa-eye"></i> View
                         </a>
                         <a
-                          href={file.document}
+                          href={file.download_url || file.document}
                           download
                           className="file-download-btn"
                           title="Download file"
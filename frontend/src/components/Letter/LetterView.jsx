@@ -342,7 +342,7 @@ export default function LetterView() {
                     <div style={{ flex: 1, display: "flex", justifyContent: "flex-end", gap: "10px" }}>
                         {letter.attachments && letter.attachments.length > 0 ? (
                             letter.attachments.map((att, idx) => (
-                                <a key={idx} href={att.file} target="_blank" rel="noopener noreferrer"
+                                <a key={idx} href={att.download_url || att.file} target="_blank" rel="noopener noreferrer"
                                     style={{
                                         textDecoration: "none",
                                         backgroundColor: "#f0f8ff",
@@ -679,23 +679,6 @@ const PreviewLetter = ({ formData, isOpen, onClose }) => {
         return date.toISOString();
       };
 
-      const pdfBlob = await pdf(
-        <LetterPDF
-          formData={formData}
-          tentativeRefNumber={tentativeRefNumber}
-        />
-      ).toBlob();
-
-      // 2. **Convert the Blob to a File object**
-      const pdfFileName = `letter-${
-        formData.refNumber || tentativeRefNumber || "document"
-      }.pdf`;
-
-      // This creates a file-like object on the client side
-      const pdfFile = new File([pdfBlob], pdfFileName, {
-        type: "application/pdf",
-      });
-
       // Prepare form data for submission
       const letterPayload = new FormData();
 
@@ -778,22 +761,8 @@ const PreviewLetter = ({ formData, isOpen, onClose }) => {
         }
       );
 
-      const newLetterId = response.data.id; // Get the ID of the newly created Letter
-
-      // 5. **Save the PDF File** (Step 2: Save generated PDF to LetterFile model)
-      const pdfPayload = new FormData();
-      pdfPayload.append("letter", newLetterId);
-      pdfPayload.append("document", pdfFile); // Use the converted PDF file
-
-      await axiosInstance.post(
-        "letters/letter_file/", // The ListCreateAPIView endpoint
-        pdfPayload,
-        {
-          headers: {
-            "Content-Type": "multipart/form-data",
-          },
-        }
-      );
+      // The PDF is rendered on the server from the saved letter
+      // (letters/<id>/pdf/), so nothing is uploaded back from here
 
       setSuccess(
         `Letter created successfully! Reference Number: ${response.data.reference_number}`
@@ -3,6 +3,12 @@ import React, { useState, useEffect } from 'react';
 import axiosInstance from '../axiosConfig';
 import './SearchBar.css';
 
+// Search results are page number paginated, keep only the page of the next page link
+const getNextPage = (data) =>
+  data?.next ? new URL(data.next, window.location.origin).searchParams.get('page') : null;
+
+// onSearchResults(results, { append, count }) gets the first page of a search,
+// then each page added with "Load more results" (append true)
 export default function SearchBar({ onSearchResults, onSearchError, isLoading = false }) {
   const [filters, setFilters] = useState({
     partyName: '',
@@ -17,6 +23,9 @@ export default function SearchBar({ onSearchResults, onSearchError, isLoading =
   });
   
   const [isSearching, setIsSearching] = useState(false);
+  const [nextPage, setNextPage] = useState(null);
+  const [searchQuery, setSearchQuery] = useState('');
+  const [loadingMore, setLoadingMore] = useState(false);
   const [isLoadingOptions, setIsLoadingOptions] = useState(true);
   const [connectionError, setConnectionError] = useState('');
 
@@ -83,6 +92,14 @@ export default function SearchBar({ onSearchResults, onSearchError, isLoading =
     return params.toString();
   };
 
+  const getAgreementsArray = (data) => {
+    // Direct access to data if it's an array, otherwise try to find the array in the response
+    if (Array.isArray(data)) {
+      return data;
+    }
+    return data.agreements || data.results || [];
+  };
+
   // Handle search submission with fetch
   const handleSearch = async () => {
     setIsSearching(true);
@@ -94,22 +111,13 @@ export default function SearchBar({ onSearchResults, onSearchError, isLoading =
       console.log('API Response:', response);
       console.log('API Response Data:', response.data);
 
-      // Direct access to response.data if it's an array, otherwise try to find the array in the response
-      let agreementsArray;
-      if (Array.isArray(response.data)) {
-        agreementsArray = response.data;
-      } else if (response.data.agreements) {
-        agreementsArray = response.data.agreements;
-      } else if (response.data.results) {
-        agreementsArray = response.data.results;
-      } else {
-        agreementsArray = [];
-      }
-
+      const agreementsArray = getAgreementsArray(response.data);
       console.log('Final Agreements Array:', agreementsArray);
-      
+      setNextPage(getNextPage(response.data));
+      setSearchQuery(queryParams);
+
       if (onSearchResults) {
-        onSearchResults(agreementsArray);
+        onSearchResults(agreementsArray, { append: false, count: response.data.count ?? agreementsArray.length });
       }
 
     } catch (error) {
@@ -123,6 +131,25 @@ export default function SearchBar({ onSearchResults, onSearchError, isLoading =
     }
   };
 
+  // Fetch the next page of the last search (not the filters edited since) and append it
+  const handleLoadMore = async () => {
+    setLoadingMore(true);
+    try {
+      const response = await axiosInstance.get(`/agreements/search/?${searchQuery}`, {
+        params: { page: nextPage },
+      });
+      setNextPage(getNextPage(response.data));
+      if (onSearchResults) {
+        onSearchResults(getAgreementsArray(response.data), { append: true, count: response.data.count });
+      }
+    } catch (error) {
+      console.error('Search error:', error);
+      setConnectionError(`Search failed: ${error.message}`);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   // Clear all filters
   const handleClear = () => {
     setFilters({
@@ -130,6 +157,7 @@ export default function SearchBar({ onSearchResults, onSearchError, isLoading =
       agreementType: '',
       status: ''
     });
+    setNextPage(null);
     
     if (onSearchResults) {
       onSearchResults([]);
@@ -241,6 +269,18 @@ export default function SearchBar({ onSearchResults, onSearchError, isLoading =
         </button>
       </div>
       
+      {nextPage && (
+        <div className="search-actions">
+          <button
+            className="search-button"
+            onClick={handleLoadMore}
+            disabled={isLoading || isSearching || loadingMore}
+          >
+            {loadingMore ? 'Loading...' : 'Load more results'}
+          </button>
+        </div>
+      )}
+      
       {isLoadingOptions && (
         <div className="loading-options">
           Loading filter options...
@@ -0,0 +1,46 @@
+// Resumable chunked uploads for large attachments (see agreements ChunkedUploadAPIView)
+import axiosInstance from '../axiosConfig';
+
+// Files above this size are sent in chunks instead of one multipart request
+export const CHUNKED_UPLOAD_THRESHOLD = 5 * 1024 * 1024;
+
+const MAX_RETRIES = 3;
+
+const sendChunk = (uploadId, file, start, chunkSize) => {
+  const end = Math.min(start + chunkSize, file.size);
+  return axiosInstance.put(`agreements/uploads/${uploadId}/`, file.slice(start, end), {
+    headers: {
+      'Content-Type': 'application/octet-stream',
+      'Content-Range': `bytes ${start}-${end - 1}/${file.size}`,
+    },
+  });
+};
+
+// Uploads the file chunk by chunk and returns the upload_id to submit with the form.
+// A failed chunk is retried from the offset the server reports.
+export const uploadInChunks = async (file, onProgress) => {
+  const { data } = await axiosInstance.post('agreements/uploads/', {
+    filename: file.name,
+    size: file.size,
+  });
+  const uploadId = data.upload_id;
+  const chunkSize = data.chunk_size;
+  let offset = data.offset;
+  let retries = 0;
+
+  while (offset < file.size) {
+    try {
+      const response = await sendChunk(uploadId, file, offset, chunkSize);
+      offset = response.data.offset;
+      retries = 0;
+      if (onProgress) onProgress(offset / file.size);
+    } catch (error) {
+      if (retries >= MAX_RETRIES) throw error;
+      retries += 1;
+      // Resume from wherever the server got to
+      const status = await axiosInstance.get(`agreements/uploads/${uploadId}/`);
+      offset = status.data.offset;
+    }
+  }
+  return uploadId;
+};
@@ -0,0 +1,26 @@
+// Server-rendered letter PDFs (see letters LetterPDFAPIView)
+import axiosInstance from '../axiosConfig';
+
+// Seconds to keep polling before giving up, whatever interval the server asks for
+const MAX_WAIT_SECONDS = 120;
+
+const wait = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+// Returns the PDF of a letter as a Blob. The server answers 202 while the
+// PDF is being rendered, so poll at the Retry-After interval it sends until
+// the PDF is ready.
+export const fetchLetterPdf = async (letterId) => {
+  let waited = 0;
+  while (waited < MAX_WAIT_SECONDS) {
+    const response = await axiosInstance.get(`letters/${letterId}/pdf/`, {
+      responseType: 'blob',
+    });
+    if (response.status !== 202) {
+      return new Blob([response.data], { type: 'application/pdf' });
+    }
+    const retryAfter = Number(response.headers['retry-after']) || 2;
+    await wait(retryAfter * 1000);
+    waited += retryAfter;
+  }
+  throw new Error('The PDF is still being generated, please try again shortly.');
+};